@@ -1,33 +1,90 @@
+import collections.abc
 import logging
 import os
-import importlib
-import sys
+import threading
+import time
+
+from . import tracing
+from .cache import ResultCache
+from .registry import AnalysisRegistry
 
 
 class AnalyticsModule:
     logger = logging.getLogger('analytics')
 
-    def __init__(self, script_folders):
+    def __init__(self, script_folders, cache_size=0, cache_ttl=3600., lazy=True):
+        """
+        :param script_folders: additional analytics script folders
+        :param cache_size: results cache memory cap (bytes), <= 0 if disabled
+        :param cache_ttl: results cache TTL (seconds)
+        :param lazy: import analysis scripts on their first use (only metadata is read at start)
+        """
+        start = time.monotonic()
         self.script_folders = script_folders
-        self.ANALYSIS, self.ANALYSIS_ARGS = self._import_analysis_functions()
+        self.cache = ResultCache(cache_size, cache_ttl) if cache_size > 0 else None
+        # scripts from 'analytics/scripts' and 'analytics/_in_development' folders and additional ones
+        analytics_dir = "analytics"
+        folders = [os.path.join(analytics_dir, "scripts"), os.path.join(analytics_dir, "_in_development"),
+                   *script_folders]
+        self.registry = AnalysisRegistry(folders, lazy)
+        self.registry.refresh()
+        self.startup_time = round(time.monotonic() - start, 6)
 
-    def run_analysis(self, analysis_name, analysis_arguments, loaded_data):
+    def run_analysis(self, analysis_name, analysis_arguments, loaded_data, cache_key=None, runner=None):
         """
         Calls analysis functions, returns analysis result.
 
         :param analysis_name: analysis function name
         :param analysis_arguments: dictonary of analysis function arguments
-        :param loaded_data: dataframe with data (time series)
+        :param loaded_data: dataframe with data (time series) or iterator of dataframes (consecutive chunks, for
+        analyses with 'chunked' in A_ARGS, see Analysis.analyze_chunks())
+        :param cache_key: key to cache the result with (see cache_key() and cached_result()), None - do not cache
+        :param runner: callable (analysis_name, analysis_arguments, loaded_data) -> dataframe, runs analysis
+        elsewhere (e.g. in another process), None - run in this thread
         :return: dataframe
         """
         self.logger.debug(
             "Starting '" + str(analysis_name) + "' Influx analysis, parameters: " + str(analysis_arguments))
         try:
-            result = self._analysis_caller(analysis_name, analysis_arguments, loaded_data)
+            if runner is not None:
+                result = runner(analysis_name, analysis_arguments, loaded_data)
+            else:
+                result = self._analysis_caller(analysis_name, analysis_arguments, loaded_data)
         except Exception as exc:
             self.logger.error("Analysis failed: " + str(exc))
             raise Exception("Analysis failed: " + str(exc))
         self.logger.debug("Analysis successfully complete")
+        if cache_key is not None and self.cache is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    def cache_key(self, analysis_name, analysis_arguments, source):
+        """
+        Results cache key.
+
+        :param analysis_name: analysis function name
+        :param analysis_arguments: dictonary of analysis function arguments
+        :param source: input data identification: its fingerprint (ResultCache.fingerprint()) or reading
+        parameters (for data which can not change anymore)
+        :return: key or None if caching is disabled or not allowed for the analysis ('cacheable' in A_ARGS)
+        """
+        snapshot = self.registry.snapshot
+        if self.cache is None or analysis_name not in snapshot.analysis:
+            return None
+        if not snapshot.analysis_args[analysis_name].get("cacheable", True):
+            return None
+        return ResultCache.key(analysis_name, analysis_arguments, source, snapshot.analysis_hash.get(analysis_name))
+
+    def cached_result(self, cache_key):
+        """
+        :param cache_key: results cache key
+        :return: cached analysis result or None
+        """
+        if cache_key is None or self.cache is None:
+            return None
+        result = self.cache.get(cache_key)
+        if result is not None:
+            self.logger.debug("Cached analysis result used: " + cache_key)
         return result
 
     def _analysis_caller(self, analysis_name, analysis_arguments, loaded_data):
@@ -35,11 +92,11 @@ class AnalyticsModule:
         Caller function
         """
         try:
-            if analysis_name in self.ANALYSIS:
-                result = self.ANALYSIS[analysis_name]().analyze(analysis_arguments, loaded_data)
+            analysis = tracing.instrument(self.registry.analysis_class(analysis_name)())
+            if isinstance(loaded_data, collections.abc.Iterator):
+                result = analysis.analyze_chunks(analysis_arguments, loaded_data)
             else:
-                self.logger.error("Analysis function doesn't exist: " + analysis_name)
-                raise Exception("Analysis function doesn't exist: " + analysis_name)
+                result = analysis.analyze(analysis_arguments, loaded_data)
         except Exception as exc:
             self.logger.error(str(exc))
             raise Exception(str(exc))
@@ -47,47 +104,44 @@ class AnalyticsModule:
         return result
 
     def update_analysis_functions(self):
-        self.ANALYSIS, self.ANALYSIS_ARGS = self._import_analysis_functions()
+        """
+        Reloads new and changed analysis scripts.
+        :return: reload report (see AnalysisRegistry.refresh())
+        """
+        return self.registry.refresh()
 
-    def _import_analysis_functions(self):
-        # import all scripts from 'analytics/scripts' and 'analytics/_in_development' folders
-        analytics_dir = "analytics"
-        analysis_scripts_dir = os.path.join(analytics_dir, "scripts")
-        in_development_scripts_dir = os.path.join(analytics_dir, "_in_development")
-
-        folders = [analysis_scripts_dir, in_development_scripts_dir, *self.script_folders]
-
-        analysis = {}  # name : class
-        analysis_args = {}  # name : analysis arguments
-
-        # loop through directories with scripts
-        for folder in folders:
-            if os.path.isdir(folder):
-                file_list = os.listdir(folder)
-                sys.path.append(folder)
-                for file in file_list:
-                    name, ext = os.path.splitext(file)
-                    if name.startswith("analysis_"):
-                        # try to import and update dictionaries
-                        try:
-                            # module_name = folder.replace(r'/', r'.') + "." + name
-                            # i = importlib.import_module(module_name)
-                            i = importlib.import_module(name)
-                            # imported module constants
-                            a_name = getattr(i, "ANALYSIS_NAME")
-                            a_class_name = getattr(i, "CLASS_NAME")
-                            a_class = getattr(i, a_class_name)
-                            a_args = getattr(i, "A_ARGS")
-                            a_args["folder"] = folder
-                            # update dictionaries
-                            analysis[a_name] = a_class
-                            analysis_args[a_name] = a_args
-                            self.logger.debug("Module imported: " + name)
-                        except Exception as err:
-                            self.logger.error("Failed to import module: " + name + ", " + str(err))
-            else:
-                self.logger.warning("Impossible to import from folder (check the existence): " + folder)
-        return analysis, analysis_args
+    def prewarm(self):
+        """
+        Imports all analysis scripts in a background thread.
+        :return: thread
+        """
+        thread = threading.Thread(target=self.registry.load_all, name="AnalysisPrewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        """
+        Analysis functions statistics: startup time, last reload report, modules import times.
+        :return: dictionary
+        """
+        stats = self.registry.stats()
+        stats["startup_time"] = self.startup_time
+        return stats
+
+    @property
+    def ANALYSIS(self):
+        """
+        Analysis entries (name : script), classes are imported on demand (see AnalysisRegistry.analysis_class())
+        """
+        return self.registry.snapshot.analysis
+
+    @property
+    def ANALYSIS_ARGS(self):
+        return self.registry.snapshot.analysis_args
+
+    @property
+    def ANALYSIS_HASH(self):
+        return self.registry.snapshot.analysis_hash
 
     ################################################## OLD FUNCTIONS ###################################################
 
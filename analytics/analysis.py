@@ -1,6 +1,8 @@
 import logging
 import os
 
+import pandas as pd
+
 """
 Base analysis function.
 """
@@ -45,6 +47,20 @@ class Analysis:
             self.logger.error(err)
             raise Exception(str(err))
 
+    def analyze_chunks(self, parameters, chunks):
+        """
+        Analysis of data read by chunks (consecutive time intervals with the same columns). Used instead of analyze()
+        if A_ARGS has '"chunked": True' and the analysis runs in a thread.
+        Override it to process the chunks as they are read, this one joins them and calls analyze().
+
+        :param parameters: raw (unchecked) parameters
+        :param chunks: iterator of dataframes
+
+        :return: analysis result represented as DF
+        """
+        chunks = list(chunks)
+        return self.analyze(parameters, pd.concat(chunks) if len(chunks) != 1 else chunks[0])
+
     def _parse_parameters(self, parameters):
         """
         Check parameter datatypes, quantity, presence etc.
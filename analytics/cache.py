@@ -0,0 +1,136 @@
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import pandas as pd
+
+
+class ResultCache:
+    """
+    Analysis results cache: LRU with memory cap and TTL. Thread safe.
+    """
+    logger = logging.getLogger('analytics_cache')
+
+    def __init__(self, max_bytes, ttl=3600.):
+        """
+        Constructor.
+        :param max_bytes: memory cap (sum of cached DataFrames sizes)
+        :param ttl: time (seconds) results are kept for
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # key : (result, size, expires), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # statistics
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        self._expired = 0
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: copy of the cached result or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                self._expired += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            result = entry[0]
+        # results are modified by consumers sometimes, never give away the cached object itself
+        return result.copy() if result is not None else None
+
+    def put(self, key, result):
+        """
+        :param key: cache key
+        :param result: analysis result (DataFrame)
+        """
+        size = self.frame_size(result)
+        if size > self.max_bytes:
+            self.logger.debug("Result is too large to be cached: " + str(size) + " bytes")
+            return
+        stored = result.copy() if result is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evicted += 1
+            self._entries[key] = (stored, size, time.monotonic() + self.ttl)
+            self._bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Cache statistics.
+        :return: dictionary
+        """
+        with self._lock:
+            requests = self._hits + self._misses
+            return {"entries": len(self._entries),
+                    "bytes": self._bytes,
+                    "max_bytes": self.max_bytes,
+                    "ttl": self.ttl,
+                    "hits": self._hits,
+                    "misses": self._misses,
+                    "hit_rate": round(self._hits / requests, 4) if requests else 0.,
+                    "evicted": self._evicted,
+                    "expired": self._expired}
+
+    def _remove(self, key):
+        """
+        Called under the lock.
+        """
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    @staticmethod
+    def frame_size(df):
+        if df is None:
+            return 0
+        return int(df.memory_usage(index=True, deep=True).sum())
+
+    @staticmethod
+    def fingerprint(df):
+        """
+        Content hash of the input DataFrame (index, columns and values).
+        :param df: DataFrame or None
+        :return: hex digest
+        """
+        h = hashlib.sha1()
+        if df is None:
+            h.update(b"None")
+        else:
+            h.update(json.dumps([str(c) for c in df.columns]).encode())
+            h.update(json.dumps([str(t) for t in df.dtypes]).encode())
+            h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def key(analysis_name, analysis_arguments, source, script_hash):
+        """
+        Cache key.
+        :param analysis_name: analysis name
+        :param analysis_arguments: analysis arguments (normalized: keys are sorted)
+        :param source: input data fingerprint or query parameters
+        :param script_hash: hash of analysis script's source
+        :return: hex digest
+        """
+        content = json.dumps([analysis_name, analysis_arguments, source, script_hash], sort_keys=True, default=str)
+        return hashlib.sha1(content.encode()).hexdigest()
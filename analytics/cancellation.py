@@ -0,0 +1,96 @@
+import contextlib
+import contextvars
+import time
+
+_current_token = contextvars.ContextVar("analytics_cancellation_token", default=None)
+
+
+class DeadlineExceeded(BaseException):
+    """
+    Raised when the request's deadline has passed or the request is cancelled.
+
+    It is a BaseException (as KeyboardInterrupt): analyses wrap their errors with 'except Exception', it must pass
+    through them unchanged.
+    """
+    pass
+
+
+class CancellationToken:
+    """
+    Request's deadline and cancellation flag, checked cooperatively (see check()).
+    """
+
+    def __init__(self, timeout=None, start=None):
+        """
+        :param timeout: seconds until the deadline, None - no deadline
+        :param start: time.monotonic() the timeout is counted from (default - now)
+        """
+        self.timeout = timeout
+        start = time.monotonic() if start is None else start
+        self.deadline = start + timeout if timeout is not None else None
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def remaining(self):
+        """
+        :return: seconds until the deadline (0 if passed), None - no deadline
+        """
+        if self._cancelled:
+            return 0.
+        if self.deadline is None:
+            return None
+        return max(0., self.deadline - time.monotonic())
+
+    def check(self):
+        """
+        Raises DeadlineExceeded if the deadline has passed or the token is cancelled.
+        """
+        if self._cancelled:
+            raise DeadlineExceeded("Request is cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceeded("Request deadline exceeded (" + str(self.timeout) + " s)")
+
+
+def current():
+    """
+    :return: token of the current request or None
+    """
+    return _current_token.get()
+
+
+@contextlib.contextmanager
+def activate(token):
+    """
+    Makes the token current in this context (None - no deadline).
+    """
+    t = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(t)
+
+
+def check():
+    """
+    Cancellation point for long-running loops (e.g. optimizer's objective function): raises DeadlineExceeded if the
+    current request's deadline has passed. Does nothing outside of a request.
+    """
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+def remaining(default=None):
+    """
+    :param default: value returned if there is no deadline
+    :return: seconds until the current request's deadline
+    """
+    token = _current_token.get()
+    r = token.remaining() if token is not None else None
+    return default if r is None else r
@@ -0,0 +1,281 @@
+import ast
+import hashlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+
+METADATA = ("CLASS_NAME", "ANALYSIS_NAME", "A_ARGS")
+
+
+class RegistrySnapshot:
+    """
+    Immutable state of the registry: analysis entries, arguments and script hashes.
+    """
+
+    def __init__(self, analysis=None, analysis_args=None, analysis_hash=None):
+        self.analysis = analysis or {}  # name : script (class is imported on demand)
+        self.analysis_args = analysis_args or {}  # name : analysis arguments
+        self.analysis_hash = analysis_hash or {}  # name : script's source hash
+
+
+class _Script:
+    """
+    Discovered script file. The module itself is imported on the first analysis_class() call.
+    """
+
+    def __init__(self, path, mtime, size, sha1, source):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.sha1 = sha1
+        self.module_name = os.path.splitext(os.path.basename(path))[0]
+        self.analysis_name = None
+        self.analysis_args = None
+        self.analysis_class = None
+        self.error = None  # discovery error
+        self.import_time = None
+        self._source = source  # kept until imported: the module must match the hash
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.analysis_class is not None
+
+
+class AnalysisRegistry:
+    """
+    Incremental registry of analysis scripts ('analysis_*.py' files in script folders).
+
+    On refresh only new, changed and previously failed files are (re)discovered: file's mtime and size are checked
+    first, the content hash then. The new state is built aside and swapped in at once, so readers never see
+    a half-built registry.
+
+    Discovery reads CLASS_NAME, ANALYSIS_NAME and A_ARGS from the script's syntax tree without importing it
+    (imports of heavy dependencies are postponed until the analysis is used). Scripts with non-literal metadata
+    are imported right away.
+    """
+    logger = logging.getLogger('analytics_registry')
+
+    def __init__(self, folders, lazy=True):
+        """
+        :param folders: script folders
+        :param lazy: import modules on the first use, False - import during discovery
+        """
+        self.folders = folders
+        self.lazy = lazy
+        self.snapshot = RegistrySnapshot()
+        self.last_refresh = None  # report of the last refresh
+        self._scripts = {}  # path : _Script
+        self._lock = threading.Lock()  # refreshes are serialized
+
+    def refresh(self):
+        """
+        Discovers new and changed scripts, forgets removed ones.
+        :return: report dictionary (duration, changed, removed and failed modules)
+        """
+        with self._lock:
+            start = time.monotonic()
+            changed = []
+            failed = {}
+            scripts = {}
+
+            for path in self._list_scripts():
+                try:
+                    st = os.stat(path)
+                except OSError as err:
+                    self.logger.warning("Impossible to stat script: " + path + ", " + str(err))
+                    continue
+                old = self._scripts.get(path)
+                # failed scripts are retried (e.g. missing dependency could be installed since)
+                if old is not None and old.error is None and old.mtime == st.st_mtime_ns and old.size == st.st_size:
+                    scripts[path] = old
+                    continue
+                with open(path, "rb") as f:
+                    source = f.read()
+                sha1 = hashlib.sha1(source).hexdigest()
+                if old is not None and old.error is None and old.sha1 == sha1:
+                    old.mtime, old.size = st.st_mtime_ns, st.st_size  # touched, but not modified
+                    scripts[path] = old
+                    continue
+                script = self._discover(path, source, st, sha1)
+                scripts[path] = script
+                if script.error is not None:
+                    failed[script.module_name] = script.error
+                else:
+                    changed.append(script.module_name)
+
+            removed = [s.module_name for p, s in self._scripts.items() if p not in scripts]
+            self._scripts = scripts
+            self.snapshot = self._build_snapshot(scripts)  # atomic swap
+
+            self.last_refresh = {"time": time.time(),
+                                 "duration": round(time.monotonic() - start, 6),
+                                 "modules": len(scripts),
+                                 "analyses": len(self.snapshot.analysis),
+                                 "changed": changed,
+                                 "removed": removed,
+                                 "failed": failed}
+            self.logger.info("Analysis scripts refreshed in " + str(self.last_refresh["duration"]) + " s, changed: " +
+                             str(changed) + ", removed: " + str(removed))
+            return self.last_refresh
+
+    def analysis_class(self, analysis_name):
+        """
+        Analysis class, the module is imported on the first call.
+        :param analysis_name: analysis name
+        :return: class
+        """
+        script = self.snapshot.analysis.get(analysis_name)
+        if script is None:
+            raise Exception("Analysis function doesn't exist: " + analysis_name)
+        if script.analysis_class is None:
+            with script._lock:
+                if script.analysis_class is None:
+                    self._import(script)
+        return script.analysis_class
+
+    def load_all(self):
+        """
+        Imports all discovered modules (pre-warm). Import errors are logged only.
+        """
+        for analysis_name in list(self.snapshot.analysis):
+            try:
+                self.analysis_class(analysis_name)
+            except Exception as err:
+                self.logger.error(str(err))
+
+    def stats(self):
+        """
+        Registry statistics.
+        :return: dictionary with the last refresh report and modules import times
+        """
+        scripts = list(self.snapshot.analysis.values())
+        return {"lazy": self.lazy,
+                "last_refresh": self.last_refresh,
+                "imported": sum(1 for s in scripts if s.loaded),
+                "import_time": {s.module_name: s.import_time for s in scripts if s.import_time is not None}}
+
+    def _list_scripts(self):
+        for folder in self.folders:
+            if os.path.isdir(folder):
+                for file in sorted(os.listdir(folder)):
+                    name, ext = os.path.splitext(file)
+                    if name.startswith("analysis_") and ext == ".py":
+                        yield os.path.join(folder, file)
+            else:
+                self.logger.warning("Impossible to import from folder (check the existence): " + folder)
+
+    def _discover(self, path, source, st, sha1):
+        """
+        Reads script's metadata (from the source the hash was calculated for).
+        """
+        script = _Script(path, st.st_mtime_ns, st.st_size, sha1, source)
+        try:
+            metadata = _read_metadata(source, path) if self.lazy else None
+            if metadata is None:
+                self._import(script)
+            else:
+                script.analysis_name = metadata["ANALYSIS_NAME"]
+                script.analysis_args = dict(metadata["A_ARGS"], folder=os.path.dirname(path))
+                self.logger.debug("Module discovered: " + script.module_name)
+        except Exception as err:
+            script.error = str(err)
+            self.logger.error(str(err))
+        return script
+
+    def _import(self, script):
+        """
+        Imports script's module (called under script's lock or during discovery).
+        """
+        name = script.module_name
+        previous = sys.modules.get(name)
+        start = time.monotonic()
+        try:
+            spec = importlib.util.spec_from_file_location(name, script.path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            exec(compile(script._source, script.path, "exec"), module.__dict__)
+            # imported module constants
+            analysis_name = getattr(module, "ANALYSIS_NAME")
+            analysis_class = getattr(module, getattr(module, "CLASS_NAME"))
+            analysis_args = dict(getattr(module, "A_ARGS"), folder=os.path.dirname(script.path))
+        except Exception as err:
+            if previous is not None:
+                sys.modules[name] = previous
+            else:
+                sys.modules.pop(name, None)
+            raise Exception("Failed to import module: " + name + ", " + str(err))
+        if script.analysis_name is not None and script.analysis_name != analysis_name:
+            raise Exception("Failed to import module: " + name + ", analysis name differs from the discovered one")
+        script.import_time = round(time.monotonic() - start, 6)
+        script.analysis_name = analysis_name
+        script.analysis_args = script.analysis_args or analysis_args
+        script.analysis_class = analysis_class
+        script._source = None
+        self.logger.info("Module imported: " + name + " (" + str(script.import_time) + " s)")
+
+    @staticmethod
+    def _build_snapshot(scripts):
+        snapshot = RegistrySnapshot()
+        for script in scripts.values():
+            if script.error is None:
+                snapshot.analysis[script.analysis_name] = script
+                snapshot.analysis_args[script.analysis_name] = script.analysis_args
+                snapshot.analysis_hash[script.analysis_name] = script.sha1
+        return snapshot
+
+
+def _read_metadata(source, path):
+    """
+    Evaluates script's top-level literal assignments (names defined above can be referenced).
+    :return: dictionary with METADATA values or None if some of them are not literals
+    """
+    env = {"True": True, "False": False, "None": None}
+    try:
+        tree = ast.parse(source, path)
+    except SyntaxError as err:
+        raise Exception("Failed to import module: " + path + ", " + str(err))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            target = node.targets[0].id
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name) and node.value is not None:
+            target = node.target.id
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom)):
+            continue
+        else:
+            # names used by other statements could be changed (e.g. A_ARGS["key"] = ...), not literals anymore
+            for child in ast.walk(node):
+                if isinstance(child, ast.Name):
+                    env.pop(child.id, None)
+            continue
+        try:
+            env[target] = _literal(node.value, env)
+        except (ValueError, TypeError):
+            env.pop(target, None)  # not a literal
+    if not all(name in env for name in METADATA):
+        return None
+    return {name: env[name] for name in METADATA}
+
+
+def _literal(node, env):
+    """
+    ast.literal_eval() with names resolved from env.
+    """
+    if isinstance(node, ast.Name):
+        if node.id not in env:
+            raise ValueError("Unknown name: " + node.id)
+        return env[node.id]
+    if isinstance(node, ast.Dict):
+        if any(k is None for k in node.keys):
+            raise ValueError("Dictionary unpacking")
+        return {_literal(k, env): _literal(v, env) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, ast.List):
+        return [_literal(e, env) for e in node.elts]
+    if isinstance(node, ast.Tuple):
+        return tuple(_literal(e, env) for e in node.elts)
+    if isinstance(node, ast.Set):
+        return {_literal(e, env) for e in node.elts}
+    return ast.literal_eval(node)
@@ -51,7 +51,7 @@ class CorrelationAnalysis(Analysis):
         try:
             super()._analyze(p, d)
             corr_matrix = d.corr(method=p['method'])
-            self.logger.debug("Correlation matrix:\n\n" + str(corr_matrix.values) + "\n")
+            self.logger.debug("Correlation matrix:\n\n%s\n", corr_matrix.values)
             return corr_matrix
         except Exception as err:
             self.logger.error("Impossible to analyze: " + str(err))
@@ -16,6 +16,7 @@ A_ARGS = {"analysis_code": "DEMAND_RESPONSE_BOOLEAN",
           "action": "Calculates the RRMSE of demand-response",
           "output": "1 time series (of boolean values)",
           "mode": "rw",
+          "lookback": {"parameter": "target_day", "days": 45, "after": 1},  # _get_fitting_workdays(), target_day
           "inputs_count": 1,
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
@@ -67,10 +68,10 @@ class DemandResponseBooleanAnalysis(Analysis):
 
             # means for each day (среднесуточные)
             avg_day = self.data.groupby(['date']).mean()
-            self.logger.debug("Mean per each day, for all given data:\n\n" + str(avg_day) + "\n")
+            self.logger.debug("Mean per each day, for all given data:\n\n%s\n", avg_day)
             # measurements per day (to avoid non-complete data)
             measurements_per_day = self.data.groupby(['date']).count()
-            self.logger.debug("Measurements for each day, for all data:\n\n" + str(measurements_per_day) + "\n")
+            self.logger.debug("Measurements for each day, for all data:\n\n%s\n", measurements_per_day)
 
             # 4th november was Sunday
             condition1 = self._get_fitting_workdays()
@@ -92,11 +93,11 @@ class DemandResponseBooleanAnalysis(Analysis):
 
             # base values
             b = self._get_base_value(self.data, condition2)
-            self.logger.debug("Base values:\n\n" + str(b) + "\n")
+            self.logger.debug("Base values:\n\n%s\n", b)
 
             # last day values
             c = self._get_c(self.data, condition2)
-            self.logger.debug("Last day:\n\n" + str(c) + "\n")
+            self.logger.debug("Last day:\n\n%s\n", c)
 
             a = self._get_correction(b, c)
             self.logger.debug("Correction: " + str(a))
@@ -104,7 +105,7 @@ class DemandResponseBooleanAnalysis(Analysis):
             # adjust (0.8*b < b_adj < 1.2*b)
             b_adj = self._adjust(a, b)
 
-            self.logger.debug("Adjusted base values:\n\n" + str(b_adj) + "\n")
+            self.logger.debug("Adjusted base values:\n\n%s\n", b_adj)
 
             # apply discharge
             b_discharged = self._discharge(b_adj)
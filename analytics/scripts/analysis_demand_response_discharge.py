@@ -15,6 +15,7 @@ A_ARGS = {"analysis_code": "DEMAND_RESPONSE_DISCHARGE",
           "action": "Calculates the discharge of demand-response",
           "output": "1 time series",
           "mode": "rw",
+          "lookback": {"parameter": "target_day", "days": 45, "after": 1},  # _get_fitting_workdays(), target_day
           "inputs_count": 1,
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
@@ -64,10 +65,10 @@ class DemandResponseDischargeAnalysis(Analysis):
 
             # means for each day (среднесуточные)
             avg_day = self.data.groupby(['date']).mean()
-            self.logger.debug("Mean per each day, for all given data:\n\n" + str(avg_day) + "\n")
+            self.logger.debug("Mean per each day, for all given data:\n\n%s\n", avg_day)
             # measurements per day (to avoid non-complete data)
             measurements_per_day = self.data.groupby(['date']).count()
-            self.logger.debug("Measurements for each day, for all data:\n\n" + str(measurements_per_day) + "\n")
+            self.logger.debug("Measurements for each day, for all data:\n\n%s\n", measurements_per_day)
 
             # 4th november was Sunday
             condition1 = self._get_fitting_workdays()
@@ -89,11 +90,11 @@ class DemandResponseDischargeAnalysis(Analysis):
 
             # base values
             b = self._get_base_value(self.data, condition2)
-            self.logger.debug("Base values:\n\n" + str(b) + "\n")
+            self.logger.debug("Base values:\n\n%s\n", b)
 
             # last day values
             c = self._get_c(self.data, condition2)
-            self.logger.debug("Last day:\n\n" + str(c) + "\n")
+            self.logger.debug("Last day:\n\n%s\n", c)
 
             a = self._get_correction(b, c)
             self.logger.debug("Correction: " + str(a))
@@ -103,7 +104,7 @@ class DemandResponseDischargeAnalysis(Analysis):
 
             b_adj.set_index(pd.date_range(self.target_day, periods=24, freq='1H'), inplace=True)
             b_adj.rename(columns={b_adj.columns[0]: 'value_discharge'}, inplace=True)
-            self.logger.debug("Adjusted base values:\n\n" + str(b_adj) + "\n")
+            self.logger.debug("Adjusted base values:\n\n%s\n", b_adj)
 
             # apply discharge
             b_discharged = self._discharge(b_adj)
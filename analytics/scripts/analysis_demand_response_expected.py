@@ -16,6 +16,7 @@ A_ARGS = {"analysis_code": "DEMAND_RESPONSE_EXPECTED",
           "action": "Calculates the expected line of demand-response",
           "output": "1 time series",
           "mode": "rw",
+          "lookback": {"parameter": "target_day", "days": 45, "after": 1},  # _get_fitting_workdays(), target_day
           "inputs_count": 1,
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
@@ -65,10 +66,10 @@ class DemandResponseExpectedAnalysis(Analysis):
 
             # means for each day (среднесуточные)
             avg_day = self.data.groupby(['date']).mean()
-            self.logger.debug("Mean per each day, for all given data:\n\n" + str(avg_day) + "\n")
+            self.logger.debug("Mean per each day, for all given data:\n\n%s\n", avg_day)
             # measurements per day (to avoid non-complete data)
             measurements_per_day = self.data.groupby(['date']).count()
-            self.logger.debug("Measurements for each day, for all data:\n\n" + str(measurements_per_day) + "\n")
+            self.logger.debug("Measurements for each day, for all data:\n\n%s\n", measurements_per_day)
 
             # 4th november was Sunday
             condition1 = self._get_fitting_workdays()
@@ -19,6 +19,7 @@ A_ARGS = {"analysis_code": "ELECTRICITYCOSTCALCULATION",
           "inputs_count": 1,
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
+          "cacheable": False,
           "parameters": [
               {"name": "method", "count": 1, "type": "SELECT", "options": ["one_category_*", "two_category_two_zones_*", "two_category_three_zones_*", "three_category_*", "four_category_*", "energy_storage", "peak_hours"],
                "info": "one_category - Calculation of cost for the first category"
@@ -61,7 +61,7 @@ class PeakPredictionMLAnalysis(Analysis):
     def _analyze(self, p, d):
         try:
             results = self._predict()
-            self.logger.debug("Predicted probabilities:\n\n" + str(results) + "\n")
+            self.logger.debug("Predicted probabilities:\n\n%s\n", results)
             return results
         except Exception as err:
             self.logger.error("Impossible to analyze: " + str(err))
@@ -139,7 +139,7 @@ class PeakPredictionMLAnalysis(Analysis):
         self.refactored['week'] = [i.isocalendar()[1] for i in self.date]
         self.refactored['month'] = [i.month for i in self.date]
 
-        self.logger.debug("Refactored data:\n\n" + str(self.refactored) + "\n")
+        self.logger.debug("Refactored data:\n\n%s\n", self.refactored)
 
     def _normalize_parameters(self):
         """
@@ -161,7 +161,7 @@ class PeakPredictionMLAnalysis(Analysis):
         self.normalized["week_norm"] = self._norm_range(self.refactored["week"], 1, 53)
         self.normalized["month_norm"] = self._norm_range(self.refactored["month"], 1, 12)
 
-        self.logger.debug("Normalized data:\n\n" + str(self.normalized) + "\n")
+        self.logger.debug("Normalized data:\n\n%s\n", self.normalized)
 
     def _norm_range(self, data, hi, lo):
         """
@@ -52,7 +52,7 @@ class PeakPredictionStatisticalAnalysis(Analysis):
     def _analyze(self, p, d):
         try:
             df = self._get_probabs_for_month()
-            self.logger.debug("Predicted probabilities:\n\n" + str(df) + "\n")
+            self.logger.debug("Predicted probabilities:\n\n%s\n", df)
             return df
         except Exception as err:
             self.logger.error("Impossible to analyze: " + str(err))
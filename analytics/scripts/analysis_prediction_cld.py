@@ -19,6 +19,9 @@ A_ARGS = {"analysis_code": "ANALYSISPREDICTIONCLD",
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
           "mode": "rw",
+          "lookback": {"parameter": "target_day", "days": 21},  # 3 same weekdays before target_day
+          "input_resolution": "1h",  # hourly means are read (see _preprocess_df_power())
+          "input_aggregate": "mean",
           "parameters": [
               {"name": "target_day", "count": 1, "type": "DATE", "info": "target day for analysis"},
           ]}
@@ -6,6 +6,7 @@ import pandas as pd
 from scipy.optimize import minimize
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_squared_error
+from analytics import cancellation
 from analytics.analysis import Analysis
 
 """
@@ -23,6 +24,11 @@ A_ARGS = {"analysis_code": "ANALYSISPREDICTIONHW",
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
           "mode": "rw",
+          "input_resolution": "1h",  # hourly means are read (see _preprocess_df_power())
+          "input_aggregate": "mean",
+          "execution": "process",
+          "max_concurrency": 2,
+          "timeout": 300,
           "parameters": [
               {"name": "target_day", "count": 1, "type": "DATE", "info": "target day for analysis"},
           ]}
@@ -246,6 +252,7 @@ class analysisPredictionHW(Analysis):
                 df.set_index('date_time', inplace=True)
                 return df.loc[df.index.date == target_day.date()][['val_hw']]
             for k in range(copy_from, len(day_list)+1):  # why 508 instead of 522?
+                cancellation.check()
                 data = df['E_load_Wh'][(k - copy_from) * N:(k - 1) * N]
 
                 if (k % 7 == 0):  # ones a week we should adapt parameters
@@ -281,6 +288,7 @@ class analysisPredictionHW(Analysis):
 
 
     def timeseriesCVscore(self, x, data, N):  # is called inside the run_HW method
+        cancellation.check()  # the optimizer calls it many times: abort it if the request's deadline has passed
         try:
             errors = []  # вектор ошибок
             values = data.values
@@ -22,6 +22,9 @@ A_ARGS = {"analysis_code": "ANALYSISPREDICTIONPAR",
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
           "mode": "rw",
+          "input_resolution": "1h",  # hourly means are read (see _preprocess_df_power())
+          "input_aggregate": "mean",
+          "execution": "process",
           "parameters": [
               {"name": "target_day", "count": 1, "type": "DATE", "info": "target day for analysis"},
           ]}
@@ -4,6 +4,7 @@ import datetime
 import pandas as pd
 import statsmodels.api as sm
 
+from analytics import cancellation
 from analytics.analysis import Analysis
 """
 Generate SARIMA forecast function.
@@ -20,6 +21,11 @@ A_ARGS = {"analysis_code": "ANALYSISPREDICTIONSARIMA",
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
           "mode": "rw",
+          "input_resolution": "1h",  # hourly means are read (see _preprocess_df_power())
+          "input_aggregate": "mean",
+          "execution": "process",
+          "max_concurrency": 2,
+          "timeout": 300,
           "parameters": [
               {"name": "target_day", "count": 1, "type": "DATE", "info": "target day for analysis"},
           ]}
@@ -178,7 +184,7 @@ class analysisPredictionSarima(Analysis):
             S = 48  # самое большое значение на ACF на 1 лаге
 
             model = sm.tsa.statespace.SARIMAX(train["E_load_Wh"], order=(p, d, q), seasonal_order=(P, D, Q, S)).fit(
-                disp=-1)
+                disp=-1, callback=lambda params: cancellation.check())  # checked after every optimizer's iteration
             # print('Обучена')
             pred_data = model.predict(len(train)-N, len(train) + N - 1 + N, dynamic=True)
             pred_data = pd.DataFrame({'date_time': pred_data.index, 'val_sarima': pred_data.values})
@@ -16,6 +16,7 @@ A_ARGS = {"analysis_code": "NORMALIZATION",
           "inputs_count": -1,
           "outputs_count": -1,
           "inputs_outputs_always_same_count": True,
+          "chunked": True,
           "parameters": [
               {"name": "min_value", "count": 1, "type": "FLOAT", "info": "lower bond"},
               {"name": "max_value", "count": 1, "type": "FLOAT", "info": "upper bond"}
@@ -46,11 +47,33 @@ class SatisticsNormalizationAnalysis(Analysis):
             self.logger.error(err)
             raise Exception(str(err))
 
+    def analyze_chunks(self, parameters, chunks):
+        """
+        Analysis cycle for data read by chunks: columns' ranges are found while the chunks are read, then every chunk
+        is normalized separately (input chunks are not joined).
+
+        :return: analysis result represented as DF
+        """
+        try:
+            p = self._parse_parameters(parameters)
+            parts = [d for d in (chunk.dropna(how='any') for chunk in chunks) if not d.empty]
+            if len(parts) == 0:
+                raise Exception("Failed to preprocess DataFrame: Empty DataFrame")
+            mins = pd.concat([d.min() for d in parts], axis=1).min(axis=1)
+            maxs = pd.concat([d.max() for d in parts], axis=1).max(axis=1)
+            res = pd.concat([self._normalize(p, d, mins, maxs) for d in parts])
+            self.logger.debug("Normalized data:\n\n%s\n", res)
+            out = self._prepare_for_output(p, None, res)
+            return out
+        except Exception as err:
+            self.logger.error(err)
+            raise Exception(str(err))
+
     def _analyze(self, p, d):
         try:
             super()._analyze(p, d)
             results = self._normalize(p, d)
-            self.logger.debug("Normalized data:\n\n" + str(results) + "\n")
+            self.logger.debug("Normalized data:\n\n%s\n", results)
             return results
         except Exception as err:
             self.logger.error("Impossible to analyze: " + str(err))
@@ -119,14 +142,19 @@ class SatisticsNormalizationAnalysis(Analysis):
             self.logger.error("Parameter 'max_value' can't be parsed: " + str(parameters['max_value']) + ' ' + str(err))
             raise Exception("Parameter 'max_value' can't be parsed: " + str(parameters['max_value']) + ' ' + str(err))
 
-    def _normalize(self, p, d):
+    def _normalize(self, p, d, mins=None, maxs=None):
         """
         Normalizes data in range (min_value, max_value)
+
+        :param mins: columns' minimums (default - of d)
+        :param maxs: columns' maximums (default - of d)
         """
         normalized = pd.DataFrame()
 
         for col in d.columns:
-            normalized[col] = self._norm_range(d[col], d[col].min(), d[col].max())
+            lo = d[col].min() if mins is None else mins[col]
+            hi = d[col].max() if maxs is None else maxs[col]
+            normalized[col] = self._norm_range(d[col], lo, hi)
             normalized[col] = normalized[col] * (p['max_value'] - p['min_value']) + p['min_value']
 
         return normalized
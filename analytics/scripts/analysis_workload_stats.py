@@ -14,6 +14,7 @@ A_ARGS = {"analysis_code": "WORKLOAD_STATS",
           "action": "Calculates work and idle times, on and off counts",
           "output": "1 time series (7 values) with dummy index",
           "mode": "rw",
+          "chunked": True,
           "inputs_count": 1,
           "outputs_count": 1,
           "inputs_outputs_always_same_count": True,
@@ -46,112 +47,85 @@ class WorkloadStatsAnalysis(Analysis):
             self.logger.error(err)
             raise Exception(str(err))
 
+    def analyze_chunks(self, parameters, chunks):
+        """
+        Analysis cycle for data read by chunks: statistics are accumulated chunk by chunk.
+
+        :return: analysis result represented as DF
+        """
+        try:
+            p = self._parse_parameters(parameters)
+            totals = None
+            for chunk in chunks:
+                d = chunk.dropna(how='any')
+                if not d.empty:
+                    totals = self._accumulate(p, totals, d)
+            if totals is None:
+                raise Exception("Failed to preprocess DataFrame: Empty DataFrame")
+            res = self._output_stats(totals)
+            out = self._prepare_for_output(p, None, res)
+            return out
+        except Exception as err:
+            self.logger.error(err)
+            raise Exception(str(err))
+
     def _analyze(self, p, d):
         try:
             super()._analyze(p, d)
-
-            idx = np.array(d.index)
-            y = np.array(d[d.columns[0]])
-            val_high = p['val_high']
-            val_low = p['val_low']
-
-            # time deltas
-            ds = [idx[i + 1] - idx[i] for i in range(idx.size - 1)]
-
-            # work/idle time calculation (in nanoseconds!)
-            t_total = (idx[-1] - idx[0]) / np.timedelta64(1, 'ns')
-            t_work, t_idle, t_neutral = self._calculate_work_idle_time(ds, y, val_high, val_low)
-
-            # on/off count
-            cs = self._encode_values(y, val_high, val_low)
-            c_on, c_off, c_neutral = self._count_on_off(cs)
-
-            # output
-            out_arr = [t_total, t_work, t_idle, t_neutral, c_on, c_off, c_neutral]
-            self.logger.debug("Output stats: " + str(out_arr) + "\n")
-            return out_arr
+            return self._output_stats(self._accumulate(p, None, d))
         except Exception as err:
             self.logger.error("Impossible to analyze: " + str(err))
             raise Exception("Impossible to analyze: " + str(err))
 
     @staticmethod
-    def _encode_values(y, val_high, val_low):
-        """
-        Encodes values of time series with regard to border values. 1 - higher than high, -1 - lower than low, 0 - rest
-
-        :param y: time series
-        :param val_high: high border value
-        :param val_low: low border value
-        :return: encoded series
-        """
-
-        cs = []
-
-        for v in y:
-            if v >= val_high:
-                cs.append(1)
-            elif v < val_low:
-                cs.append(-1)
-            else:
-                cs.append(0)
-
-        return cs
-
-    @staticmethod
-    def _calculate_work_idle_time(ds, y, val_high, val_low):
-        """
-        calculates working and idle time with regard to border values.
-        work - higher than high border
-        idle - lower than low border
-        neutral - rest
-
-        :param ds: time deltas
-        :param y: values
-        :param val_high: high border
-        :param val_low: low border
-        :return: work, idle and neutral times
-        """
-
-        t_work = 0
-        t_idle = 0
-        t_neutral = 0
-
-        for i in range(len(ds)):
-            if (y[i] >= val_high) and (y[i + 1] >= val_high):
-                t_work += ds[i] / np.timedelta64(1, 'ns')
-            elif (y[i] < val_low) and (y[i + 1] < val_low):
-                t_idle += ds[i] / np.timedelta64(1, 'ns')
-            else:
-                t_neutral += ds[i] / np.timedelta64(1, 'ns')
-
-        return t_work, t_idle, t_neutral
-
-    @staticmethod
-    def _count_on_off(cs):
-        """
-        counts switching of working modes
-        -1 or 0 -> 1 - on
-        1 or 0 -> -1 - off
-        1 or -1 -> 0 - neutral
-
-        :param cs: encoded values
-        :return:
-        """
-
-        c_on = 0
-        c_off = 0
-        c_neutral = 0
-
-        for i in range(len(cs) - 1):
-            if cs[i] != cs[i + 1]:
-                if cs[i + 1] == 1:
-                    c_on += 1
-                elif cs[i + 1] == -1:
-                    c_off += 1
-                else:
-                    c_neutral += 1
-
-        return c_on, c_off, c_neutral
+    def _accumulate(p, totals, d):
+        """
+        Adds work/idle/neutral times (nanoseconds!) and on/off/neutral switches of the data to the totals.
+        work - both values of consecutive pair are higher than high border, idle - lower than low border, neutral -
+        rest; switch to 1 (higher than high) - on, to -1 (lower than low) - off, to 0 - neutral.
+
+        :param p: parsed parameters
+        :param totals: totals of previous (earlier) data or None
+        :param d: preprocessed data
+        :return: totals
+        """
+        idx = d.index.asi8
+        y = np.asarray(d[d.columns[0]], dtype=np.float64)
+        if totals is None:
+            totals = {"first": idx[0], "t_work": 0., "t_idle": 0., "t_neutral": 0., "c_on": 0, "c_off": 0,
+                      "c_neutral": 0}
+        else:
+            # the pair across the border with previous data
+            idx = np.concatenate(([totals["last"]], idx))
+            y = np.concatenate(([totals["last_value"]], y))
+
+        ds = np.diff(idx).astype(np.float64)
+        high = y >= p['val_high']
+        low = y < p['val_low']
+        work = high[:-1] & high[1:]
+        idle = low[:-1] & low[1:]
+        totals["t_work"] += ds[work].sum()
+        totals["t_idle"] += ds[idle].sum()
+        totals["t_neutral"] += ds[~(work | idle)].sum()
+
+        cs = np.where(high, 1, np.where(low, -1, 0))  # encoded values
+        switched = cs[:-1] != cs[1:]
+        totals["c_on"] += int(np.count_nonzero(switched & (cs[1:] == 1)))
+        totals["c_off"] += int(np.count_nonzero(switched & (cs[1:] == -1)))
+        totals["c_neutral"] += int(np.count_nonzero(switched & (cs[1:] == 0)))
+
+        totals["last"], totals["last_value"] = idx[-1], y[-1]
+        return totals
+
+    def _output_stats(self, totals):
+        """
+        :return: [t_total, t_work, t_idle, t_neutral, c_on, c_off, c_neutral]
+        """
+        t_total = float(totals["last"] - totals["first"])
+        out_arr = [t_total, totals["t_work"], totals["t_idle"], totals["t_neutral"], totals["c_on"], totals["c_off"],
+                   totals["c_neutral"]]
+        self.logger.debug("Output stats: %s\n", out_arr)
+        return out_arr
 
     def _preprocess_df(self, data):
         """
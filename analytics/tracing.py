@@ -0,0 +1,180 @@
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+_current_span = contextvars.ContextVar("analytics_current_span", default=None)
+
+# Analysis methods wrapped by instrument()
+ANALYSIS_STAGES = ("_parse_parameters", "_preprocess_df", "_analyze", "_prepare_for_output")
+
+
+class Span:
+    """
+    Timed operation of a trace. Children are appended concurrently sometimes (batch entries), list.append is atomic.
+    """
+
+    def __init__(self, name, trace_id, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.attributes = attributes or {}
+        self.start_time = time.time()
+        self.duration = None  # None while running
+        self.error = None
+        self.children = []
+        self._start = time.monotonic()
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = round(time.monotonic() - self._start, 6)
+
+    def to_dict(self, origin=None):
+        """
+        :param origin: wall time the start times are counted from (default - this span's start), 0 - absolute
+        :return: dictionary (span tree)
+        """
+        origin = self.start_time if origin is None else origin
+        d = {"name": self.name,
+             "start": round(self.start_time - origin, 6),
+             "duration": self.duration}
+        if self.attributes:
+            d["attributes"] = dict(self.attributes)
+        if self.error is not None:
+            d["error"] = self.error
+        children = list(self.children)
+        if children:
+            d["children"] = [c.to_dict(origin) for c in children]
+        return d
+
+    @classmethod
+    def from_dict(cls, d, trace_id, origin=0.):
+        """
+        Restores span tree (e.g. recorded in another process).
+        """
+        span = cls(d["name"], trace_id, d.get("attributes"))
+        span.start_time = origin + d["start"]
+        span.duration = d["duration"]
+        span.error = d.get("error")
+        span.children = [cls.from_dict(c, trace_id, origin) for c in d.get("children", [])]
+        return span
+
+
+def current_span():
+    return _current_span.get()
+
+
+def new_trace(name, trace_id=None, **attributes):
+    """
+    Creates root span of a new trace (see activate()).
+    :param name: root span name
+    :param trace_id: trace id (e.g. received from a client), default - new random one
+    :return: root span
+    """
+    return Span(name, trace_id or uuid.uuid4().hex, attributes)
+
+
+@contextlib.contextmanager
+def activate(s):
+    """
+    Makes the span current in this context (None - disables tracing).
+    """
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        _current_span.reset(token)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Child span of the current one, nothing is recorded if there is no active trace.
+    Yields the span (or None) to add attributes.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(name, parent.trace_id, attributes)
+    parent.children.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as err:
+        s.error = str(err)
+        raise
+    finally:
+        s.finish()
+        _current_span.reset(token)
+
+
+def attach(span_dicts):
+    """
+    Attaches spans recorded elsewhere (see Span.to_dict() with origin=0) to the current span.
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        for d in span_dicts:
+            parent.children.append(Span.from_dict(d, parent.trace_id))
+
+
+def instrument(analysis):
+    """
+    Wraps analysis stages (ANALYSIS_STAGES) of the Analysis instance with spans, if there is an active trace.
+    Scripts override analyze() but call the same stage methods, instance attributes take precedence over them.
+    :param analysis: Analysis instance
+    :return: the same instance
+    """
+    if _current_span.get() is None:
+        return analysis
+    for stage in ANALYSIS_STAGES:
+        method = getattr(analysis, stage, None)
+        if method is not None:
+            setattr(analysis, stage, _traced(stage, method))
+    return analysis
+
+
+def _traced(name, func):
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class TraceWriter:
+    """
+    Appends sampled traces to a JSONL file (one trace per line). Thread safe.
+    """
+    logger = logging.getLogger('trace_writer')
+
+    def __init__(self, path, sample_rate=1.):
+        """
+        :param path: file path, None - traces are not written
+        :param sample_rate: share of requests to be traced (0..1)
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        """
+        :return: True if the next request should be traced
+        """
+        return self.sample_rate >= 1. or random.random() < self.sample_rate
+
+    def write(self, root):
+        """
+        :param root: root span of the trace
+        """
+        if self.path is None:
+            return
+        line = json.dumps({"trace_id": root.trace_id, "time": root.start_time, "span": root.to_dict()}, default=str)
+        try:
+            with self._lock, open(self.path, "a") as f:
+                f.write(line + "\n")
+        except Exception as err:
+            self.logger.error("Impossible to write the trace: " + str(err))
@@ -1,4 +1,9 @@
 import argparse
+import asyncio
+import contextvars
+import gzip
+import io
+import ipaddress
 import os
 import sys
 from http.server import HTTPServer, BaseHTTPRequestHandler
@@ -9,11 +14,21 @@ import logging
 import time
 import json
 import typing
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 import analytics
 import analytics.utils as u
+from analytics import cancellation, tracing
+from analytics.cache import ResultCache
 
-from db import InfluxServerIO
+from db import InfluxConnectionPool
+from server import AnalysisExecutor, AnalysisProcessPool, JobTable, QueueFullError, Scheduler, SingleFlight, codec
+from server import aio, log_queue
+from server.chunked import ChunkedWriter
+from server.logs import LogFile
+from server.metrics import MetricsRegistry, process_rss
 
 
 def parse_args(args):
@@ -39,6 +54,68 @@ def parse_args(args):
     server_group.add_argument("-ssf", "--srv-script-folders", dest="srv_script_folders", default=[], nargs="*",
                               help="additional analytics script folders with , default ones ('analytics/scripts' "
                                    "and 'analytics/_in_development') will be used in any case")
+    server_group.add_argument("-spw", "--srv-prewarm", dest="srv_prewarm", action="store_true",
+                              help="import analysis scripts in background right after start (otherwise imported on "
+                                   "their first use)")
+    server_group.add_argument("-sfe", "--srv-frontend", dest="srv_frontend", default="threaded",
+                              choices=["threaded", "asyncio"], help="HTTP front end: 'threaded' - a thread per "
+                                                                    "connection, 'asyncio' - all connections in one "
+                                                                    "event loop thread")
+    server_group.add_argument("-sio", "--srv-io-threads", dest="srv_io_threads", default=4, type=int,
+                              help="number of threads parsing requests, encoding responses and reading the log file "
+                                   "for the asyncio front end")
+    server_group.add_argument("-sw", "--srv-workers", dest="srv_workers", default=4, type=int,
+                              help="number of analysis worker threads")
+    server_group.add_argument("-sqs", "--srv-queue-size", dest="srv_queue_size", default=16, type=int,
+                              help="maximal number of queued analysis requests, further requests are rejected "
+                                   "with 503")
+    server_group.add_argument("-sem", "--srv-exec-mode", dest="srv_exec_mode", default="thread",
+                              choices=["thread", "process"], help="default analysis execution mode: 'thread' - in "
+                                                                  "the worker thread, 'process' - in a pool of worker "
+                                                                  "processes; analyses may override it with "
+                                                                  "'execution' in A_ARGS")
+    server_group.add_argument("-spr", "--srv-processes", dest="srv_processes", default=os.cpu_count() or 1, type=int,
+                              help="number of analysis worker processes (for 'process' execution mode)")
+    server_group.add_argument("-spc", "--srv-priority-classes", dest="srv_priority_classes", nargs="*",
+                              default=["interactive=8", "batch=1"],
+                              help="priority classes with weights ('name=weight'), workers are shared by weighted fair "
+                                   "queueing; the first one is the default class")
+    server_group.add_argument("-sph", "--srv-priority-hosts", dest="srv_priority_hosts", nargs="*", default=[],
+                              help="priority classes of client hosts ('host=class' or 'network/prefix=class'), "
+                                   "requests may set it with 'priority'")
+    server_group.add_argument("-sdt", "--srv-default-timeout", dest="srv_default_timeout", default=0., type=float,
+                              help="default analysis request deadline (seconds) if neither the request ('timeout') "
+                                   "nor the analysis ('timeout' in A_ARGS) sets it, <= 0 if unlimited")
+    server_group.add_argument("-sbw", "--srv-batch-workers", dest="srv_batch_workers", default=4, type=int,
+                              help="maximal number of concurrently running analyses of one batch request")
+    server_group.add_argument("-sjm", "--srv-jobs-max", dest="srv_jobs_max", default=1000, type=int,
+                              help="maximal number of stored asynchronous jobs")
+    server_group.add_argument("-sjt", "--srv-jobs-ttl", dest="srv_jobs_ttl", default=3600., type=float,
+                              help="time (seconds) finished asynchronous jobs are kept for")
+    server_group.add_argument("-scs", "--srv-cache-size", dest="srv_cache_size", default=256, type=int,
+                              help="analysis results cache memory cap (MB), <= 0 if disabled")
+    server_group.add_argument("-sct", "--srv-cache-ttl", dest="srv_cache_ttl", default=3600., type=float,
+                              help="analysis results cache TTL (seconds)")
+    server_group.add_argument("-scst", "--srv-cache-settle", dest="srv_cache_settle", default=3600., type=float,
+                              help="time (seconds) after which the data is considered final: results for time ranges "
+                                   "ending earlier are cached by reading parameters, without reading the data")
+    server_group.add_argument("-sco", "--srv-coalesce", dest="srv_coalesce", default=True, action="store_false",
+                              help="Disable coalescing of identical in-flight analysis requests")
+    server_group.add_argument("-sra", "--srv-retry-after", dest="srv_retry_after", default=5, type=int,
+                              help="'Retry-After' value (seconds) sent with 503 responses")
+    server_group.add_argument("-ska", "--srv-keep-alive", dest="srv_keep_alive", default=30., type=float,
+                              help="idle persistent (HTTP/1.1 keep-alive) connection timeout (seconds), <= 0 if "
+                                   "keep-alive is disabled")
+    server_group.add_argument("-sgz", "--srv-gzip-min", dest="srv_gzip_min", default=1024, type=int,
+                              help="minimal response size (bytes) to be gzip-compressed (if accepted by the client), "
+                                   "< 0 if disabled")
+    server_group.add_argument("-smb", "--srv-max-body", dest="srv_max_body", default=512, type=int,
+                              help="maximal POST-request body size (MB, after decompression)")
+    server_group.add_argument("-sts", "--srv-trace-sample", dest="srv_trace_sample", default=1., type=float,
+                              help="share of POST-requests to be traced (0..1), trace spans are returned in responses "
+                                   "('X-Trace: 1' header forces tracing)")
+    server_group.add_argument("-stf", "--srv-trace-file", dest="srv_trace_file", default=None,
+                              help="JSONL file to append traces to, not written if not set")
 
     # database
     dbc_group = parser.add_argument_group("Database", "Database's settings")
@@ -49,6 +126,18 @@ def parse_args(args):
     dbc_group.add_argument('-dbu', '--db-user', dest='db_user', default='ems_user', help='DB username')
     dbc_group.add_argument('-dbpw', '--db-password', dest='db_password', default=r"4rERYTPhfTtvU!99",
                            help='DB password')
+    dbc_group.add_argument('-dbps', '--db-pool-size', dest='db_pool_size', type=int, default=4,
+                           help='maximal number of pooled DB connections')
+    dbc_group.add_argument('-dbpt', '--db-pool-timeout', dest='db_pool_timeout', type=float, default=30.,
+                           help='maximal time (seconds) to wait for a free pooled DB connection')
+    dbc_group.add_argument('-dbhci', '--db-health-check-int', dest='db_health_check_int', type=float, default=60.,
+                           help='pooled DB connections health check interval (seconds), <= 0 if disabled')
+    dbc_group.add_argument('-dbcr', '--db-chunk-rows', dest='db_chunk_rows', type=int, default=100000,
+                           help='data is read by chunks: maximal number of rows per series returned by a query, '
+                                '<= 0 if read at once')
+    dbc_group.add_argument('-dbpr', '--db-parallel-reads', dest='db_parallel_reads', type=int, default=4,
+                           help='maximal number of parallel queries (pooled connections) reading the series of one '
+                                'request, spare connections are used only if free')
 
     # logger
     log_group = parser.add_argument_group("Logger", "Logger's settings")
@@ -58,6 +147,14 @@ def parse_args(args):
     log_group.add_argument('-ll', '--log-level', dest='log_level', default=20, type=int, help='Logging level')
     log_group.add_argument('-lgmt', '--log-gmt', dest='log_gmt', default=True, action='store_false',
                            help='Disable GMT+0 logging time zone, use local time instead')
+    log_group.add_argument('-lqs', '--log-queue-size', dest='log_queue_size', default=10000, type=int,
+                           help='log records queue size (records are written by a background thread), records are '
+                                'dropped if the queue is full')
+    log_group.add_argument('-lmm', '--log-max-message', dest='log_max_message', default=4096, type=int,
+                           help='maximal log message length (characters), longer ones are truncated, <= 0 if '
+                                'unlimited')
+    log_group.add_argument('-lls', '--log-large-sample', dest='log_large_sample', default=1., type=float,
+                           help='share (0..1) of too long log messages to be written (truncated)')
 
     try:
         parsed = parser.parse_args(args)
@@ -71,37 +168,29 @@ def parse_args(args):
         return parsed
 
 
-def init_logger(log_file, log_dir, log_level, log_gmt):
+def logger_configs(s):
     """
-    Initialize logger. Logging is thread safe.
-    :param log_file: log file name
-    :param log_dir: log directory
-    :param log_level: logging level https://docs.python.org/3.7/library/logging.html#logging-levels
-    :param log_gmt: set timezone to GMT
-    :return: Logger object
+    Logging configuration (log_queue.configure() arguments), shared with analysis worker processes.
+    :param s: settings (see parse_args())
+    :return: dictionary
     """
-    f = '%(asctime)s.%(msecs)d %(levelname)s %(module)s.%(funcName)s %(threadName)s (%(thread)d) %(message)s'
-    configs = {'filemode': 'a', 'format': f, 'datefmt': '%Y-%m-%d %H:%M:%S', 'level': log_level,
-               'filename': os.path.join(log_dir, log_file)}
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    logging.basicConfig(**configs)
-    if log_gmt:
-        logging.Formatter.converter = time.gmtime
-    return logging.getLogger("analytics_server")
+    f = '%(asctime)s.%(msecs)d %(levelname)s %(module)s.%(funcName)s %(processName)s %(threadName)s (%(thread)d) ' \
+        '%(message)s'
+    return {'filemode': 'a', 'format': f, 'datefmt': '%Y-%m-%d %H:%M:%S', 'level': s.log_level,
+            'filename': os.path.join(s.log_dir, s.log_file), 'gmt': s.log_gmt, 'queue_size': s.log_queue_size,
+            'max_message': s.log_max_message, 'large_sample': s.log_large_sample}
 
 
-def auto_update_analysis_functions(args, analysis_module):
+def init_logger(s):
     """
-    Updates analysis functions with given frequency (if enabled)
-    :param args: parsed args
-    :param analysis_module: analysis module instance
-    :return:
+    Initialize logger. Logging is thread safe, records are written by a background thread.
+    :param s: settings (see parse_args())
+    :return: Logger object
     """
-    if args.srv_auto_update:
-        time.sleep(args.srv_auto_update_int)
-        analysis_module.update_analysis_functions()
-        logger.info("Analysis functions updated automatically")
+    if not os.path.exists(s.log_dir):
+        os.makedirs(s.log_dir)
+    log_queue.configure(**logger_configs(s))
+    return logging.getLogger("analytics_server")
 
 
 class AnalyticsServer(HTTPServer):
@@ -113,8 +202,180 @@ class AnalyticsServer(HTTPServer):
         self.ctn = threading.current_thread()
         self.s = settings
         self.am = analytics_module
+        self.db_pool = InfluxConnectionPool(self.s.db_host, self.s.db_name, self.s.db_port, self.s.db_user,
+                                            self.s.db_password, self.s.db_pool_size, self.s.db_pool_timeout)
+        self.priority_classes, self.priority_hosts = self._parse_priorities()
+        self.executor = AnalysisExecutor(self.s.srv_workers, self.s.srv_queue_size, self._analysis_concurrency_limit,
+                                         self.priority_classes)
+        self.process_pool = AnalysisProcessPool(self.s.srv_script_folders, self.s.srv_processes,
+                                                logger_configs(self.s))
+        self.jobs = JobTable(self.s.srv_jobs_max, self.s.srv_jobs_ttl)
+        self.single_flight = SingleFlight()
+        self.scheduler = Scheduler()
+        self.metrics = MetricsRegistry()
+        self.log_file = LogFile(os.path.join(self.s.log_dir, self.s.log_file))
+        self.trace_writer = tracing.TraceWriter(self.s.srv_trace_file, self.s.srv_trace_sample)
+        self._init_metrics()
         super().__init__((self.s.srv_host, self.s.srv_port), request_handler_class)
 
+    def _init_metrics(self):
+        """
+        Registers server's metrics (see '/metrics').
+        """
+        m = self.metrics
+        self.m_http_requests = m.counter("analytics_http_requests_total", "HTTP responses by method and status code",
+                                         ("method", "code"))
+        self.m_analysis_requests = m.counter("analytics_analysis_requests_total",
+                                             "Processed analysis requests by analysis and result",
+                                             ("analysis", "result"))
+        self.m_stage_seconds = m.histogram("analytics_stage_seconds",
+                                           "Duration of request stages (queue, read, analysis, write) by analysis",
+                                           ("analysis", "stage"))
+        self.m_rows_read = m.counter("analytics_rows_read_total", "Rows read from DB by analysis", ("analysis",))
+        self.m_rows_written = m.counter("analytics_rows_written_total", "Rows written to DB by analysis",
+                                        ("analysis",))
+        self.m_priority_seconds = m.histogram("analytics_priority_seconds",
+                                              "Queue wait and total latency of analysis requests by priority class",
+                                              ("priority", "stage"))
+        self.m_deadline_exceeded = m.counter("analytics_deadline_exceeded_total",
+                                             "Analysis requests which ran out of time by analysis", ("analysis",))
+
+        def stat(component, key):
+            return lambda: component.stats()[key]
+
+        m.gauge("analytics_executor_queue_depth", "Queued analysis requests", stat(self.executor, "queue_depth"))
+        m.gauge("analytics_executor_busy_workers", "Busy analysis workers", stat(self.executor, "busy"))
+        m.gauge("analytics_executor_rejected_total", "Requests rejected because of the full queue",
+                stat(self.executor, "rejected"), type="counter")
+        m.gauge("analytics_db_pool_in_use", "DB connections in use", stat(self.db_pool, "in_use"))
+        m.gauge("analytics_db_pool_wait_seconds_total", "Time spent waiting for a free DB connection",
+                stat(self.db_pool, "wait_time_total"), type="counter")
+        m.gauge("analytics_db_pool_timeouts_total", "DB connection acquisition timeouts",
+                stat(self.db_pool, "timeouts"), type="counter")
+        m.gauge("analytics_jobs", "Stored asynchronous jobs", stat(self.jobs, "jobs"))
+        m.gauge("analytics_coalesced_requests_total", "Requests coalesced with identical in-flight ones",
+                stat(self.single_flight, "coalesced"), type="counter")
+
+        def cache_stat(key):
+            return lambda: self.am.cache.stats()[key] if self.am.cache is not None else None
+
+        m.gauge("analytics_cache_hits_total", "Results cache hits", cache_stat("hits"), type="counter")
+        m.gauge("analytics_cache_misses_total", "Results cache misses", cache_stat("misses"), type="counter")
+        m.gauge("analytics_cache_hit_rate", "Results cache hit rate", cache_stat("hit_rate"))
+        m.gauge("analytics_cache_bytes", "Results cache size", cache_stat("bytes"))
+
+        m.gauge("analytics_process_rss_bytes", "Server process resident memory", process_rss)
+        m.gauge("analytics_worker_process_rss_bytes", "Analysis worker processes resident memory",
+                self._workers_rss, ("pid",))
+        m.gauge("analytics_threads", "Active threads", threading.active_count)
+
+        def class_stat(key):
+            return lambda: {(c,): cs[key] for c, cs in self.executor.stats()["classes"].items()}
+
+        m.gauge("analytics_priority_queue_depth", "Queued analysis requests by priority class",
+                class_stat("queue_depth"), ("priority",))
+        m.gauge("analytics_priority_rejected_total", "Requests rejected because of the full queue by priority class",
+                class_stat("rejected"), ("priority",), type="counter")
+
+        def log_stat(key):
+            return lambda: log_queue.stats()[key] if log_queue.stats() is not None else None
+
+        m.gauge("analytics_log_queue_depth", "Log records waiting to be written", log_stat("queued"))
+        m.gauge("analytics_log_dropped_total", "Log records dropped because of the full queue", log_stat("dropped"),
+                type="counter")
+        m.gauge("analytics_log_truncated_total", "Truncated log messages", log_stat("truncated"), type="counter")
+        m.gauge("analytics_log_sampled_out_total", "Too long log messages not written", log_stat("sampled_out"),
+                type="counter")
+
+    def finish_trace(self, root):
+        """
+        Finishes the request's trace and writes it to the trace file (if set).
+        :param root: root span
+        """
+        root.finish()
+        self.trace_writer.write(root)
+
+    def _workers_rss(self):
+        rss = {(str(pid),): process_rss(pid) for pid in self.process_pool.stats()["pids"]}
+        return {pid: value for pid, value in rss.items() if value is not None}
+
+    def metrics_label(self, analysis_name):
+        """
+        Analysis name as a metrics label (unknown names are not used as labels: they come from requests)
+        """
+        if analysis_name == "batch" or analysis_name in self.am.ANALYSIS_ARGS:
+            return analysis_name
+        return "unknown"
+
+    def observe(self, analysis_name, timings, result, priority=None, latency=None):
+        """
+        Records metrics of the processed analysis request.
+        :param analysis_name: analysis name
+        :param timings: stage : duration (seconds)
+        :param result: request's result ('DONE', 'ERROR', ...)
+        :param priority: request's priority class (None for batch entries: counted with the request)
+        :param latency: time from submission to completion (seconds)
+        """
+        label = self.metrics_label(analysis_name)
+        for stage, duration in timings.items():
+            self.m_stage_seconds.observe(duration, analysis=label, stage=stage)
+        self.m_analysis_requests.inc(analysis=label, result=result)
+        if priority is not None:
+            if "queue" in timings:
+                self.m_priority_seconds.observe(timings["queue"], priority=priority, stage="queue")
+            if latency is not None:
+                self.m_priority_seconds.observe(latency, priority=priority, stage="total")
+
+    def _parse_priorities(self):
+        """
+        Parses priority classes and hosts settings
+        :return: {class : weight}, [(network, class), ...]
+        """
+        classes = {}
+        for item in self.s.srv_priority_classes:
+            name, _, weight = item.partition("=")
+            try:
+                weight = float(weight) if weight else 1.
+            except ValueError:
+                raise Exception("Wrong priority class weight: " + item)
+            if weight <= 0:
+                raise Exception("Priority class weight must be positive: " + item)
+            classes[name] = weight
+        if not classes:
+            classes = {"default": 1.}
+        hosts = []
+        for item in self.s.srv_priority_hosts:
+            host, _, name = item.rpartition("=")
+            if name not in classes:
+                raise Exception("Unknown priority class of host '" + host + "': " + name)
+            try:
+                hosts.append((ipaddress.ip_network(host, strict=False), name))
+            except ValueError as err:
+                raise Exception("Wrong priority host: " + str(err))
+        return classes, hosts
+
+    def priority_class(self, json_request, client_address):
+        """
+        Request's priority class: 'priority' of the request, the class of the client's host or the default one
+        :param json_request: analysis request
+        :param client_address: (host, port)
+        :return: class name
+        """
+        name = json_request.get("priority")
+        if name is not None:
+            if name not in self.priority_classes:
+                raise Exception("Unknown priority class '" + str(name) + "', available: " +
+                                str(list(self.priority_classes)))
+            return name
+        try:
+            address = ipaddress.ip_address(client_address[0])
+        except ValueError:
+            address = None
+        for network, name in self.priority_hosts:
+            if address is not None and address in network:
+                return name
+        return next(iter(self.priority_classes))
+
     def start(self):
         """
         Start server.
@@ -122,8 +383,96 @@ class AnalyticsServer(HTTPServer):
         s = "Analytics Server's address: " + 'http://' + self.s.srv_host + ':' + str(self.s.srv_port)
         print(s)
         logger.info(s)
+        if self.s.srv_prewarm:
+            self.am.prewarm()
+        self._schedule_tasks()
+        self.scheduler.start()
+        self.executor.start()
+        if self.s.srv_exec_mode == "process":
+            self.process_pool.start()  # warm up, otherwise started with the first 'process' analysis
         self.serve_forever()
 
+    def server_close(self):
+        """
+        Close server's socket, stop analysis workers and close pooled DB connections.
+        """
+        super().server_close()
+        self.scheduler.stop()
+        self.executor.shutdown(wait=False)
+        self.process_pool.shutdown()
+        self.db_pool.close()
+
+    def _schedule_tasks(self):
+        """
+        Registers server's periodic tasks.
+        """
+        if self.s.srv_auto_update:
+            self.scheduler.add_task("update_analysis_functions", self.s.srv_auto_update_int,
+                                    self._auto_update_analysis_functions)
+        if self.s.db_health_check_int > 0:
+            self.scheduler.add_task("db_pool_health_check", self.s.db_health_check_int, self.db_pool.check_health)
+        self.scheduler.add_task("evict_expired_jobs", max(1., min(self.s.srv_jobs_ttl, 60.)), self.jobs.evict)
+
+    def _auto_update_analysis_functions(self):
+        """
+        Updates analysis functions (scheduled with 'srv_auto_update_int' interval, if enabled)
+        """
+        report = self.am.update_analysis_functions()
+        if report["changed"] or report["removed"]:
+            logger.info("Analysis functions updated automatically, changed: " + str(report["changed"]) +
+                        ", removed: " + str(report["removed"]))
+
+    def _analysis_concurrency_limit(self, analysis_name):
+        """
+        Per-analysis concurrency cap ('max_concurrency' in analysis' A_ARGS).
+        :param analysis_name: analysis name
+        :return: cap or None if unlimited
+        """
+        return self.am.ANALYSIS_ARGS.get(analysis_name, {}).get("max_concurrency")
+
+    def submit(self, task):
+        """
+        Submits analysis task to the executor, unless identical request is already in flight.
+        :param task: AnalysisTask object
+        :return: task which is actually executed (this one or identical in-flight one), its Future
+        """
+        # requests with inline data are not coalesced: the request alone does not identify them
+        key = None
+        if self.s.srv_coalesce and task.inline is None:
+            key = SingleFlight.key(task.json_request, task.priority)
+        return self.single_flight.submit(key, task, lambda: self.executor.submit(task.run, key=task.analysis_name,
+                                                                                 priority=task.priority),
+                                         task.token.deadline if task.token is not None else None)
+
+    def request_timeout(self, json_request):
+        """
+        Analysis request's timeout: 'timeout' of the request, the longest 'timeout' in A_ARGS of requested analyses
+        or server's default one.
+        :param json_request: analysis request
+        :return: seconds or None if unlimited
+        """
+        timeout = json_request.get("timeout")
+        if timeout is None:
+            entries = json_request["analysis_parameters"]
+            entries = entries if isinstance(entries, list) else [entries]
+            defaults = [self.am.ANALYSIS_ARGS.get(ap.get("analysis"), {}).get("timeout") for ap in entries
+                        if isinstance(ap, dict)]
+            defaults = [t for t in defaults if t is not None]
+            timeout = max(defaults) if defaults else self.s.srv_default_timeout
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            raise Exception("Wrong 'timeout': " + str(timeout))
+        return timeout if timeout > 0 else None
+
+    def execution_mode(self, analysis_name):
+        """
+        Analysis execution mode: 'execution' in analysis' A_ARGS or server's default one.
+        :param analysis_name: analysis name
+        :return: 'thread' or 'process'
+        """
+        return self.am.ANALYSIS_ARGS.get(analysis_name, {}).get("execution", self.s.srv_exec_mode)
+
     def finish_request(self, request, client_address):
         """Finish one request by instantiating RequestHandlerClass."""
         client = client_address[0] + ':' + str(client_address[1])
@@ -148,48 +497,127 @@ class AnalyticsServerThreaded(ThreadingMixIn, AnalyticsServer):
     block_on_close = True  # wait until the completion of all non-daemonic threads before termination
 
 
+class AsyncAnalyticsServer(AnalyticsServer):
+    """
+    asyncio front end: all connections (including idle keep-alive and slow ones) are held by one event loop thread.
+    Requests are parsed and responses are encoded in a small thread pool ('srv_io_threads'), analyses (with their
+    DB I/O, the Influx client is blocking) run in the analysis executor as with the threaded front end.
+    The listening socket is the one bound by HTTPServer.
+    """
+
+    def __init__(self, request_handler_class, settings, analytics_module):
+        super().__init__(request_handler_class, settings, analytics_module)
+        self.io_pool = ThreadPoolExecutor(max_workers=max(1, self.s.srv_io_threads), thread_name_prefix="AnalyticsIO")
+        self._loop = None
+        self._stop = None
+
+    def serve_forever(self, poll_interval=0.5):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._connection, sock=self.socket)
+        async with server:
+            await self._stop.wait()
+
+    def shutdown(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def server_close(self):
+        super().server_close()
+        self.io_pool.shutdown(wait=False)
+
+    async def _connection(self, reader, writer):
+        client_address = writer.get_extra_info('peername')[:2]
+        client = client_address[0] + ':' + str(client_address[1])
+        if not self._check_host_allowance(client_address):
+            logger.warning("Ignoring request from unauthorized host: " + client)
+            writer.close()
+            return
+        logger.debug("Request from: " + client)
+        await self.RequestHandlerClass(self, client_address, reader, writer).handle_connection()
+
+
+class BodyTooLargeError(Exception):
+    """
+    Raised when POST-request's body (or its decompressed content) exceeds 'srv_max_body' (413 response).
+    """
+    pass
+
+
 class AnalyticsRequestHandler(BaseHTTPRequestHandler):
     """
     Request handler.
     """
 
     server_version = "InsyteAnalyticsServer(" + BaseHTTPRequestHandler.server_version + ")"
+    protocol_version = "HTTP/1.1"  # persistent connections: every response must have 'Content-Length' (or be chunked)
+    follow_poll = True  # '/logs?follow=S' waits for new records in the connection's thread (see LogFile.records())
 
     def __init__(self, request, client_address, server):
+        self._setup(server)
+        super().__init__(request, client_address, server)
+
+        print()
+
+    def _setup(self, server):
+        """
+        Sets handler's state and routes (shared by both front ends)
+        """
         self.s = server.s
         self.am = server.am
+        self.db_pool = server.db_pool
+        self.executor = server.executor
         self.ctn = threading.current_thread()
-        self.time = datetime.datetime.utcnow()
-        self.influx = InfluxServerIO(self.s.db_host, self.s.db_name, self.s.db_port, self.s.db_user, self.s.db_password)
+        self.time = None  # request's time
         self.json_request = None  # analysis request
-        self.input = None
-        self.output = None
+        self.timeout = self.s.srv_keep_alive if self.s.srv_keep_alive > 0 else None  # idle connection timeout
 
         self.get_requests = [
             (["/status/", "/status", "/status.json"], self._do_get_status),
             (["/functions/", "/functions", "/functions.json"], self._do_get_functions),
             (["/update_analysis_functions/", "/update_analysis_functions", "/update_analysis_functions.json"],
              self._do_get_update_analysis_functions),
-            (["/logs", "/logs/", "/log", "/log/"], self._do_get_log)
+            (["/logs", "/logs/", "/log", "/log/"], self._do_get_log),
+            (["/metrics", "/metrics/"], self._do_get_metrics)
+        ]
+        self.get_prefix_requests = [
+            ("/jobs/", self._do_get_job)
         ]
 
-        super().__init__(request, client_address, server)
-
-        print()
+    def _reset(self):
+        """
+        Resets per-request state (one handler serves all requests of a persistent connection)
+        """
+        self.time = datetime.datetime.utcnow()
+        self.received = time.monotonic()  # request's deadline is counted from here
+        self.json_request = None
 
     def do_GET(self):
         """
         GET-request processor
         """
+        self._reset()
         try:
             client = self.client_address[0] + ':' + str(self.client_address[1])
+            path = urllib.parse.urlsplit(self.path).path  # without query
             # addr - addresses, func - function caller
             for addr, func in self.get_requests:
-                if self.path in addr:
+                if path in addr:
+                    func(client)
+                    return
+            for prefix, func in self.get_prefix_requests:
+                if path.startswith(prefix):
                     func(client)
+                    return
+            msg = {'result': 'ERROR', 'error_message': "Not found: " + path}
+            self._send_response_code_and_content(404, msg, 'application/json')
 
         except Exception as err:
             logger.error("GET-failure: " + str(err))
+            self.close_connection = True  # the response could be sent partially
             msg = {'result': 'ERROR', 'error_message': str(err)}
             self._send_response_code_and_content(200, msg, 'application/json')
 
@@ -201,6 +629,14 @@ class AnalyticsRequestHandler(BaseHTTPRequestHandler):
         logger.info("GET 'status' request from " + client)
         self._send_response_code_and_content(200, self._get_status_msg(), 'application/json')
 
+    def _do_get_metrics(self, client):
+        """
+        GET 'metrics' request processor (Prometheus text format)
+        :param client: address
+        """
+        logger.debug("GET 'metrics' request from " + client)
+        self._send_response_code_and_content(200, self.server.metrics.render(), 'text/plain; version=0.0.4')
+
     def _do_get_functions(self, client):
         """
         GET 'functions' request processor
@@ -216,12 +652,10 @@ class AnalyticsRequestHandler(BaseHTTPRequestHandler):
         """
         logger.info("GET 'update_analysis_functions' request from " + client)
         if self.s.srv_manual_update:
-            self.am.update_analysis_functions()
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(bytes(json.dumps(self.am.ANALYSIS_ARGS, indent=4, sort_keys=True), 'utf-8'))
-            logger.info("Analysis functions updated manually")
+            report = self.am.update_analysis_functions()
+            self._send_response_code_and_content(200, self.am.ANALYSIS_ARGS, 'application/json')
+            logger.info("Analysis functions updated manually in " + str(report["duration"]) + " s, changed: " +
+                        str(report["changed"]) + ", removed: " + str(report["removed"]))
         else:
             logger.warning("Manual analysis functions update is disabled")
             msg = {'result': 'WARNING', 'warning_message': "Manual analysis functions update is disabled"}
@@ -229,41 +663,385 @@ class AnalyticsRequestHandler(BaseHTTPRequestHandler):
 
     def _do_get_log(self, client):
         """
-        GET 'functions' request processor
+        GET 'logs' request processor, the log file is streamed. Query parameters (combinable): 'tail' - last N lines,
+        'start', 'end' - byte offsets, 'level' - minimal level, 'since', 'until' - time (log's time zone),
+        'follow' - seconds to wait for new records. Raw byte ranges: 'Range' header (without query parameters).
+        :param client: address
+        """
+        logger.debug("GET 'logs' request from " + client)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            size = self.server.log_file.size()
+        except OSError as err:
+            msg = {'result': 'ERROR', 'error_message': "Log file is not available: " + str(err)}
+            self._send_response_code_and_content(404, msg, 'application/json')
+            return
+        try:
+            params = self._log_parameters(query)
+        except Exception as err:
+            msg = {'result': 'ERROR', 'error_message': "Wrong 'logs' parameters: " + str(err)}
+            self._send_response_code_and_content(400, msg, 'application/json')
+            return
+
+        byte_range = self.headers.get('Range')
+        if byte_range is not None and not query:
+            byte_range = self._parse_byte_range(byte_range, size)
+            if byte_range is None:
+                self._send_response_code_and_content(416, "", 'text/plain', {'Content-Range': 'bytes */' + str(size)})
+                return
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(end) + '/' + str(size))
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            for chunk in self.server.log_file.read_range(start, end):
+                self.wfile.write(chunk)
+            return
+        self._send_stream(200, self.server.log_file.records(poll=self.follow_poll, **params),
+                          'text/plain; charset=utf-8')
+
+    @staticmethod
+    def _log_parameters(query):
+        """
+        '/logs' query parameters
+        :return: LogFile.records() arguments
+        """
+
+        def value(name, conv):
+            return conv(query[name][0]) if name in query else None
+
+        def log_time(t):
+            t = datetime.datetime.fromisoformat(t.replace('_', ' ').replace('T', ' '))
+            return t.strftime("%Y-%m-%d %H:%M:%S")
+
+        def log_level(level):
+            level = int(level) if level.isdigit() else logging.getLevelName(level.upper())
+            if not isinstance(level, int):
+                raise Exception("unknown level")
+            return level
+
+        return {"start": value("start", int) or 0,
+                "end": value("end", int),
+                "tail": value("tail", int),
+                "level": value("level", log_level),
+                "since": value("since", log_time),
+                "until": value("until", log_time),
+                "follow": min(value("follow", float) or 0., 3600.)}
+
+    @staticmethod
+    def _parse_byte_range(header, size):
+        """
+        Single 'bytes' range of the 'Range' header
+        :return: (first, last) byte offsets or None if not satisfiable
+        """
+        try:
+            unit, _, spec = header.partition('=')
+            first, _, last = spec.strip().partition('-')
+            if unit.strip() != 'bytes' or ',' in spec:
+                return None
+            if first == '':
+                first, last = max(0, size - int(last)), size - 1  # suffix: last N bytes
+            else:
+                first, last = int(first), min(int(last), size - 1) if last else size - 1
+        except ValueError:
+            return None
+        if first > last or first >= size:
+            return None
+        return first, last
+
+    def _send_stream(self, code, chunks, content_type, headers=None):
+        """
+        Streams response body: chunked for HTTP/1.1 clients, until the connection is closed for HTTP/1.0 ones.
+        The body is gzip-compressed on the fly if the client accepts it.
+        :param chunks: iterable of bytes
+        :param headers: additional headers
+        """
+        chunked, compress = self._start_stream(code, content_type, headers)
+        writer = ChunkedWriter(self.wfile, chunked)
+        try:
+            if compress:
+                chunks = self._gzip_stream(chunks)
+            for chunk in chunks:
+                writer.write(chunk)
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError) as err:
+            self.close_connection = True
+            logger.debug("Client disconnected during streaming: " + str(err))
+
+    def _start_stream(self, code, content_type, headers=None):
+        """
+        Sends headers of a streamed response
+        :return: chunked (bool), compressed (bool)
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        compress = self.s.srv_gzip_min >= 0 and self._accepts_gzip()
+        self.send_response(code)
+        self.send_header('Content-type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        elif not self.close_connection:  # otherwise 'Connection: close' is sent by send_response()
+            self.send_header('Connection', 'close')  # sets close_connection
+        self.end_headers()
+        return chunked, compress
+
+    @staticmethod
+    def _gzip_stream(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+        for chunk in chunks:
+            if chunk is LogFile.IDLE:
+                yield chunk
+                continue
+            yield compressor.compress(chunk)
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)  # the client gets every chunk right away
+        yield compressor.flush()
+
+    def _accepts_gzip(self):
+        """
+        :return: True if 'Accept-Encoding' allows gzip
+        """
+        for coding in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = coding.strip().partition(';')
+            if name.strip().lower() in ('gzip', '*'):
+                q = params.strip()
+                return not (q.startswith('q=') and float(q[2:] or 0) == 0)
+        return False
+
+    def _do_get_job(self, client):
+        """
+        GET 'jobs/<id>' request processor, '?result=true' adds result data in the request's 'return' format or
+        the one set by '&format=json|ndjson|npz' (default - json)
         :param client: address
         """
-        # logger.info("GET 'log' request from " + client)
-        with open(os.path.join(self.s.log_dir, self.s.log_file), "r") as log:
-            content = log.read()
-        self._send_response_code_and_content(200, content, 'text/plain')
+        url = urllib.parse.urlsplit(self.path)
+        job_id = url.path[len("/jobs/"):].strip("/")
+        query = urllib.parse.parse_qs(url.query)
+        logger.info("GET 'jobs/" + job_id + "' request from " + client)
+        job = self.server.jobs.get(job_id)
+        if job is None:
+            msg = {'result': 'ERROR', 'error_message': "Job not found (or expired): " + job_id}
+            self._send_response_code_and_content(404, msg, 'application/json')
+            return
+        msg = job.describe()
+        if msg["status"] == "done" and query.get("result", ["false"])[0].lower() in ["1", "true", "yes"]:
+            try:
+                fmt = codec.check_format(query["format"][0] if "format" in query else job.task.return_format)
+            except Exception as err:
+                msg = {'result': 'ERROR', 'error_message': str(err)}
+                self._send_response_code_and_content(400, msg, 'application/json')
+                return
+            self._send_result(200, msg, job.task, fmt or "json")
+            return
+        self._send_response_code_and_content(200, msg, 'application/json')
+
+    def _send_result(self, code, msg, task, fmt, headers=None):
+        """
+        Sends response message with task's output data (inline result return)
+        :param msg: response message
+        :param task: executed AnalysisTask
+        :param fmt: format (see codec.FORMATS), None - the message only
+        """
+        outputs = task.outputs if task.batch else [task.output]
+        if fmt == "json":
+            msg["data"] = [codec.frame_to_records(output) for output in outputs] if task.batch \
+                else codec.frame_to_records(task.output)
+        elif fmt == "ndjson":
+            # the first line is the response message, then records (with 'entry' - entry number for batches)
+            def lines():
+                yield (json.dumps(msg, sort_keys=True) + "\n").encode()
+                for i, output in enumerate(outputs):
+                    yield from (codec.frame_to_ndjson(output, entry=i) if task.batch
+                                else codec.frame_to_ndjson(output))
+            self._send_stream(code, lines(), codec.FORMATS[fmt], headers)
+            return
+        elif fmt == "npz":
+            self._send_response_code_and_content(code, codec.frames_to_npz(outputs, msg), codec.FORMATS[fmt],
+                                                 headers)
+            return
+        self._send_response_code_and_content(code, msg, 'application/json', headers)
 
     def do_POST(self):
         """
         POST-request processor
         """
+        self._reset()
+        # sampled requests are traced, spans are returned in the response
+        root = None
+        if self.headers.get('X-Trace') == '1' or self.server.trace_writer.sampled():
+            root = tracing.new_trace("POST " + self.path, self.headers.get('X-Trace-Id'))
+        with tracing.activate(root):
+            self._do_post(root)
+
+    def _do_post(self, root):
+        task = None
         try:
-            # read POST-request's content
-            cl = int(self.headers['Content-Length'])
-            content = self.rfile.read(cl)
-            logger.info(str(cl) + " bytes from " + self.client_address[0] + ':' + str(self.client_address[1]))
+            submitted = self._submit_post(root, self._read_body())
+            if submitted is None:
+                return
+            task, executed, future, token = submitted
+            try:
+                # the client is answered at the deadline, the task stops at its next cancellation check
+                msg = future.result(timeout=token.remaining() if token is not None else None)
+            except FutureTimeoutError:
+                raise cancellation.DeadlineExceeded("Request deadline exceeded (" + str(token.timeout) + " s)")
+            self._send_post_result(root, task, executed, msg)
+        except cancellation.DeadlineExceeded as err:
+            self._send_post_timeout(root, task, err)
+        except Exception as err:
+            self._send_post_error(root, err)
 
-            # analysis parameters
-            self._content_to_json(content)
+    def _submit_post(self, root, content):
+        """
+        Parses POST-request's content and submits the analysis task. Jobs and rejected requests are answered here.
+        :param root: root span of the request's trace or None
+        :param content: request's body
+        :return: (task, executed task, its future, cancellation token or None) or None if the response is sent
+        """
+        # analysis parameters (and inline input data)
+        data = None
+        if self.headers.get_content_type() == codec.FORMATS["npz"]:
+            with tracing.span("parse_npz", bytes=len(content)):
+                data = self._content_to_request_and_data(content)
+        else:
+            with tracing.span("parse_json", bytes=len(content)):
+                self._content_to_json(content)
 
-            # analyse
-            self._read_data()
-            self._call_analysis()
-            self._write_results()
+        # analyse (read, analyze, write) in the analysis workers pool
+        timeout = self.server.request_timeout(self.json_request)
+        token = cancellation.CancellationToken(timeout, self.received) if timeout is not None else None
+        priority = self.server.priority_class(self.json_request, self.client_address)
+        with cancellation.activate(token):  # the task runs in this context (deadline, trace span)
+            task = AnalysisTask(self.json_request, self.server, data, priority)
+        task.return_format  # checked before the analysis runs
+        try:
+            if urllib.parse.urlsplit(self.path).path.rstrip("/") == "/jobs":
+                # asynchronous: respond with job id immediately
+                with cancellation.activate(token):
+                    job = self.server.jobs.add(task, self.server.submit)
+                logger.info("Job accepted: " + job.id)
+                job.future.add_done_callback(lambda f: self._count_timeout(task, f))
+                if root is not None:
+                    job.future.add_done_callback(lambda f: self.server.finish_trace(root))
+                msg = {'result': 'ACCEPTED', 'job_id': job.id, 'status': job.status,
+                       'active_threads': threading.active_count()}
+                self._send_response_code_and_content(202, msg, 'application/json',
+                                                     self._trace_headers(root, {'Location': '/jobs/' + job.id}))
+                return None
+            with cancellation.activate(token):
+                executed, future = self.server.submit(task)
+        except QueueFullError as err:
+            logger.warning("POST-rejected: " + str(err))
+            msg = {'result': 'BUSY', 'error_message': str(err), 'active_threads': threading.active_count()}
+            self._send_response_code_and_content(503, msg, 'application/json',
+                                                 self._trace_headers(root, {'Retry-After':
+                                                                            str(self.s.srv_retry_after)}))
+            return None
+        return task, executed, future, token
 
-            # send response
-            msg = {'result': 'DONE', 'active_threads': threading.active_count()}
-            self._send_response_code_and_content(200, msg, 'application/json')
+    def _send_post_result(self, root, task, executed, msg):
+        """
+        Sends the analysis result
+        :param task: request's task
+        :param executed: executed task (this one or the coalesced one)
+        :param msg: executed task's result message
+        """
+        msg = dict(msg)  # the result may be shared with coalesced requests
+        if executed is not task:
+            msg['coalesced'] = True
+            if executed.trace is not None:
+                msg['coalesced_trace_id'] = executed.trace.trace_id
+        msg['active_threads'] = threading.active_count()
+        if root is not None:
+            self.server.finish_trace(root)
+            msg['trace'] = {'trace_id': root.trace_id, 'spans': root.to_dict()}
+        self._send_result(200, msg, executed, task.return_format, self._trace_headers(root))
 
-        except Exception as err:
-            logger.error("POST-failure: " + str(err))
-            self.influx.disconnect()
-            msg = {'result': 'ERROR', 'error_message': str(err), 'active_threads': threading.active_count()}
-            self._send_response_code_and_content(400, msg, 'application/json')
+    def _send_post_timeout(self, root, task, err):
+        logger.warning("POST-timeout: " + str(err))
+        self.server.m_deadline_exceeded.inc(analysis=self.server.metrics_label(
+            task.analysis_name if task is not None else None))
+        msg = {'result': 'TIMEOUT', 'error_message': str(err), 'active_threads': threading.active_count()}
+        if root is not None:
+            self.server.finish_trace(root)
+            msg['trace'] = {'trace_id': root.trace_id, 'spans': root.to_dict()}
+        self._send_response_code_and_content(504, msg, 'application/json', self._trace_headers(root))
+
+    def _send_post_error(self, root, err):
+        logger.error("POST-failure: " + str(err))
+        msg = {'result': 'ERROR', 'error_message': str(err), 'active_threads': threading.active_count()}
+        if root is not None:
+            self.server.finish_trace(root)
+            msg['trace'] = {'trace_id': root.trace_id, 'spans': root.to_dict()}
+        code = 413 if isinstance(err, BodyTooLargeError) else 400
+        self._send_response_code_and_content(code, msg, 'application/json', self._trace_headers(root))
+
+    def _count_timeout(self, task, future):
+        if not future.cancelled() and isinstance(future.exception(), cancellation.DeadlineExceeded):
+            self.server.m_deadline_exceeded.inc(analysis=self.server.metrics_label(task.analysis_name))
+
+    @staticmethod
+    def _trace_headers(root, headers=None):
+        headers = dict(headers or {})
+        if root is not None:
+            headers['X-Trace-Id'] = root.trace_id
+        return headers
+
+    def send_response(self, code, message=None):
+        self.server.m_http_requests.inc(method=self.command, code=code)
+        super().send_response(code, message)
+        if self.timeout is None:
+            self.close_connection = True  # keep-alive is disabled
+        if self.close_connection:  # e.g. the body is not read
+            self.send_header('Connection', 'close')
+
+    def _read_body(self):
+        """
+        Reads POST-request's body ('Content-Encoding: gzip' is decompressed)
+        :return: bytes
+        """
+        cl = self._content_length()
+        content = bytearray(cl)  # writable: inline input data arrays are its views
+        del content[self.rfile.readinto(content):]  # connection closed early
+        logger.info(str(cl) + " bytes from " + self.client_address[0] + ':' + str(self.client_address[1]))
+        return self._decode_body(content)
+
+    def _content_length(self):
+        """
+        :return: POST-request's body length (checked)
+        """
+        try:
+            cl = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.close_connection = True  # the body's end is unknown
+            raise Exception("'Content-Length' header is missing or wrong")
+        if cl > self.s.srv_max_body * 2 ** 20:
+            self.close_connection = True  # the body is not read
+            raise BodyTooLargeError("Request body is too large: " + str(cl) + " bytes")
+        return cl
+
+    def _decode_body(self, content):
+        """
+        Decompresses POST-request's body ('Content-Encoding: gzip')
+        :return: bytes
+        """
+        max_body = self.s.srv_max_body * 2 ** 20
+        encoding = self.headers.get('Content-Encoding', 'identity').strip().lower()
+        if encoding == 'gzip':
+            decompressor = zlib.decompressobj(31)
+            try:
+                content = decompressor.decompress(content, max_body + 1)
+            except zlib.error as err:
+                raise Exception("Impossible to decompress request body: " + str(err))
+            if len(content) > max_body or decompressor.unconsumed_tail:
+                raise BodyTooLargeError("Request body is too large (decompressed)")
+        elif encoding != 'identity':
+            raise Exception("Unsupported 'Content-Encoding': " + encoding)
+        return content
 
     def log_message(self, format, *args):
         """
@@ -271,18 +1049,30 @@ class AnalyticsRequestHandler(BaseHTTPRequestHandler):
         """
         pass
 
-    def _send_response_code_and_content(self, code: int, content: typing.Union[str, dict],
-                                        content_type: str = 'application/json'):
-        if isinstance(content, str):
-            pass
-        elif isinstance(content, dict):
-            content = json.dumps(content, indent=4, sort_keys=True)
+    def _send_response_code_and_content(self, code: int, content: typing.Union[str, bytes, dict],
+                                        content_type: str = 'application/json', headers: dict = None):
+        if isinstance(content, bytes):
+            body = content
         else:
-            content = str(content)
+            if isinstance(content, dict):
+                # POST-responses are compact, GET ones are human-readable
+                indent = 4 if self.command == 'GET' else None
+                content = json.dumps(content, indent=indent, sort_keys=True)
+            elif not isinstance(content, str):
+                content = str(content)
+            body = bytes(content, 'utf-8')
+        headers = dict(headers or {})
+        if 0 <= self.s.srv_gzip_min <= len(body) and self._accepts_gzip():
+            body = gzip.compress(body, 6)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
         self.send_response(code)
         self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
         self.end_headers()
-        self.wfile.write(bytes(content, 'utf-8'))
+        self.wfile.write(body)
 
     def _content_to_json(self, content):
         """
@@ -290,53 +1080,576 @@ class AnalyticsRequestHandler(BaseHTTPRequestHandler):
         """
         try:
             self.json_request = json.loads(content)
-            logger.info("JSON content: " + str(self.json_request))
+            logger.info("JSON content: %s", self.json_request)
         except Exception as err:
             logger.error("Impossible to process sent data (not a JSON): " + str(err))
             raise Exception("Impossible to process sent data (not a JSON): " + str(err))
 
-    def _read_data(self):
+    def _content_to_request_and_data(self, content):
         """
-        Read data for processing
+        Converts POST-request's npz content into request and inline input data (see codec.npz_to_request())
+        :return: input dataframe
+        """
+        try:
+            self.json_request, data = codec.npz_to_request(content)
+        except Exception as err:
+            logger.error("Impossible to process sent data (not an inline data npz): " + str(err))
+            raise Exception("Impossible to process sent data (not an inline data npz): " + str(err))
+        # data is not read from DB, it is written only if requested
+        self.json_request.setdefault("db_io_parameters", {}).setdefault("mode", "")
+        logger.info("Inline data %s, request: %s", data.shape, self.json_request)
+        return data
+
+    def _get_status_msg(self):
+        """
+        Server's status wrapper
+        :return: dictionary with status variables
+        """
+
+        def thread_name(t):
+            name = t.name + ' (' + str(t.ident) + ')'
+            if t.daemon:
+                name += ' daemon'
+            return name
+
+        threads = [thread_name(t) for t in threading.enumerate()]
+        return {"active_threads": threading.active_count(),
+                "active_list": threads,
+                "db_pool": self.db_pool.stats(),
+                "executor": self.executor.stats(),
+                "process_pool": self.server.process_pool.stats(),
+                "jobs": self.server.jobs.stats(),
+                "single_flight": self.server.single_flight.stats(),
+                "cache": self.am.cache.stats() if self.am.cache is not None else None,
+                "scheduler": self.server.scheduler.tasks(),
+                "analysis_functions": self.am.stats(),
+                "logging": log_queue.stats()}
+
+
+class AsyncAnalyticsRequestHandler(AnalyticsRequestHandler):
+    """
+    Request handler of the asyncio front end: the same routes and responses as AnalyticsRequestHandler.
+
+    Route methods run in the server's I/O thread pool and write the response into a buffer, the event loop sends it.
+    Streamed responses are sent chunk by chunk (chunks are produced in the pool). POST-request's body is read and
+    the analysis result is awaited in the event loop: no thread waits for a running analysis, nor for new records
+    of a followed log.
+    """
+    follow_poll = False  # '/logs?follow=S' waits for new records in the event loop (see _flush())
+
+    def __init__(self, server, client_address, reader, writer):
+        # BaseHTTPRequestHandler's constructor is not called: it would serve the (blocking) socket
+        self.server = server
+        self.client_address = client_address
+        self.reader = reader
+        self.writer = writer
+        self._setup(server)
+        self.wfile = io.BytesIO()  # response buffer, see send_response() and _flush()
+        self.close_connection = True
+        self.command, self.requestline, self.request_version = None, '', 'HTTP/1.0'  # until a request is parsed
+        self._stream = None  # (chunks, chunked, compressed) of a streamed response
+
+    async def handle_connection(self):
+        """
+        Serves requests of the connection until it is closed (or idle for 'srv_keep_alive' seconds)
+        """
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(aio.read_request(self.reader), self.timeout)
+                except asyncio.TimeoutError:
+                    break
+                except aio.BadRequest as err:
+                    logger.warning("Bad request from " + self.client_address[0] + ": " + str(err))
+                    self.close_connection = True
+                    self.send_error(400, str(err))
+                    await self._flush()
+                    break
+                if request is None:
+                    break
+                self.command, self.path, self.request_version, self.headers = request
+                self.requestline = self.command + ' ' + self.path + ' ' + self.request_version
+                self.close_connection = not aio.keep_alive(self.request_version, self.headers)
+                if self.command == 'GET':
+                    await self._run(self.do_GET)
+                elif self.command == 'POST':
+                    await self._do_post_async()
+                else:
+                    self.close_connection = True  # the body (if any) is not read
+                    await self._run(self.send_error, 501, "Unsupported method (" + repr(self.command) + ")")
+                await self._flush()
+                if self.close_connection:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError) as err:
+            logger.debug("Client disconnected: " + str(err))
+        finally:
+            self.writer.close()
+
+    async def _run(self, func, *args):
+        """
+        Runs func in the I/O thread pool, in the current context (trace span)
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.server.io_pool, contextvars.copy_context().run,
+                                                                func, *args)
+
+    async def _flush(self):
+        """
+        Sends the buffered response (and the streamed body)
+        """
+        self.writer.write(self.wfile.getvalue())
+        self.wfile = io.BytesIO()
+        await self.writer.drain()
+        if self._stream is None:
+            return
+        chunks, chunked, compress = self._stream
+        self._stream = None
+        if compress:
+            chunks = self._gzip_stream(chunks)
+        chunks = iter(chunks)
+        while True:
+            chunk = await self._run(next, chunks, None)
+            if chunk is None:
+                break
+            if chunk is LogFile.IDLE:
+                await asyncio.sleep(self.server.log_file.FOLLOW_POLL)  # no new log records yet
+                continue
+            if chunk:  # an empty chunk would end the body
+                self.writer.write(b"%X\r\n" % len(chunk) + chunk + b"\r\n" if chunked else chunk)
+                await self.writer.drain()
+        if chunked:
+            self.writer.write(b"0\r\n\r\n")
+            await self.writer.drain()
+
+    def _send_stream(self, code, chunks, content_type, headers=None):
+        chunked, compress = self._start_stream(code, content_type, headers)
+        self._stream = (chunks, chunked, compress)
+
+    async def _do_post_async(self):
+        """
+        POST-request processor (see do_POST())
+        """
+        self._reset()
+        root = None
+        if self.headers.get('X-Trace') == '1' or self.server.trace_writer.sampled():
+            root = tracing.new_trace("POST " + self.path, self.headers.get('X-Trace-Id'))
+        with tracing.activate(root):
+            task = None
+            try:
+                cl = self._content_length()
+                if self.headers.get('Expect', '').lower() == '100-continue' and self.request_version == 'HTTP/1.1':
+                    self.writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                content = await aio.read_body(self.reader, cl)
+                logger.info(str(cl) + " bytes from " + self.client_address[0] + ':' + str(self.client_address[1]))
+                submitted = await self._run(lambda: self._submit_post(root, self._decode_body(content)))
+                if submitted is None:
+                    return
+                task, executed, future, token = submitted
+                result = asyncio.wrap_future(future)
+                # asyncio.wait() does not cancel the task at the deadline (it may be shared with coalesced requests)
+                done, _ = await asyncio.wait({result}, timeout=token.remaining() if token is not None else None)
+                if not done:
+                    raise cancellation.DeadlineExceeded("Request deadline exceeded (" + str(token.timeout) + " s)")
+                await self._run(self._send_post_result, root, task, executed, result.result())
+            except asyncio.IncompleteReadError:
+                raise
+            except cancellation.DeadlineExceeded as err:
+                await self._run(self._send_post_timeout, root, task, err)
+            except Exception as err:
+                await self._run(self._send_post_error, root, err)
+
+
+class AnalysisTask:
+    """
+    Analysis request: read data from DB (or use inline input data sent with the request), analyze, write results
+    to DB (if 'mode' has 'w') and/or return them in the response ('return' of 'db_io_parameters': 'json', 'ndjson'
+    or 'npz', see codec.FORMATS).
+
+    Batch request ('analysis_parameters' is a list): data is read once and shared by all analyses, which run
+    concurrently, each entry has its own 'result_id' and is reported separately:
+    {"db_io_parameters": {...},
+     "analysis_parameters": [{"analysis": "...", "analysis_arguments": {...}, "result_id": [...]}, ...]}
+    """
+
+    def __init__(self, json_request, server, inline=None, priority=None):
+        """
+        :param json_request: analysis request
+        :param server: AnalyticsServer
+        :param inline: inline input data (dataframe), None - data is read from DB
+        :param priority: priority class, None - the default one
+        """
+        self.server = server
+        self.s = server.s
+        self.am = server.am
+        self.db_pool = server.db_pool
+        self.json_request = json_request  # analysis request
+        self.inline = inline
+        self.priority = priority if priority is not None else next(iter(server.priority_classes))
+        self.input = None
+        self.output = None
+        self.outputs = []  # batch results, in order of 'analysis_parameters' entries
+        self.source = None  # input data identification for results cache
+        self.created = time.monotonic()
+        self.started = None
+        self.timings = {}  # stage : duration (seconds)
+        self.trace = tracing.current_span()  # root span of the request's trace or None
+        self.token = cancellation.current()  # request's deadline or None
+
+    @property
+    def batch(self):
+        return isinstance(self.json_request["analysis_parameters"], list)
+
+    @property
+    def return_format(self):
+        """
+        Inline result format or None (results are not returned)
+        """
+        return codec.check_format(self.json_request["db_io_parameters"].get("return"))
+
+    @property
+    def analysis_name(self):
+        if self.batch:
+            return "batch"
+        return self.json_request["analysis_parameters"]["analysis"]
+
+    def run(self):
+        """
+        Processes the request
+        :return: response message
+        """
+        result = 'ERROR'
+        try:
+            cancellation.check()  # expired while queued
+            with tracing.span("task", analysis=str(self.analysis_name)):
+                msg = self._run()
+            result = msg['result']
+            return msg
+        except cancellation.DeadlineExceeded:
+            result = 'TIMEOUT'
+            raise
+        finally:
+            self.server.observe(self.analysis_name, self.timings, result, self.priority,
+                                time.monotonic() - self.created)
+
+    def _run(self):
+        self.started = time.monotonic()
+        self.timings["queue"] = round(self.started - self.created, 6)
+        entries = self.json_request["analysis_parameters"] if self.batch else [self.json_request["analysis_parameters"]]
+        if len(entries) == 0:
+            raise Exception("Empty batch: no 'analysis_parameters' entries")
+
+        # cached results for final data are looked up before reading, the data is not read if all of them are found
+        read = self._read_parameters(entries) if self.inline is None else None
+        self.source = self._final_data_source(read) if self.inline is None else None
+        cached = [self.am.cached_result(self._cache_key(ap)) for ap in entries]
+        if self.inline is not None:
+            self.input = self.inline
+            if self.am.cache is not None and any(self._use_cache(ap) for ap in entries):
+                self.source = {"fingerprint": ResultCache.fingerprint(self.input)}
+                cached = [self.am.cached_result(self._cache_key(ap)) for ap in entries]
+        elif read is not None and any(output is None for output in cached) and not self._chunked(entries[0]):
+            self.input = self._timed(self.timings, "read", self._read_data, read)
+            if self.input is not None:
+                self.server.m_rows_read.inc(len(self.input), analysis=self.server.metrics_label(self.analysis_name))
+            if self.source is None and self.am.cache is not None and any(self._use_cache(ap) for ap in entries):
+                self.source = {"fingerprint": ResultCache.fingerprint(self.input)}
+                cached = [self.am.cached_result(self._cache_key(ap)) for ap in entries]
+
+        if self.batch:
+            return self._run_batch(entries, cached)
+        ap = entries[0]
+        self.output = cached[0]
+        if self.output is None and self.input is None and read is not None and self._chunked(ap):
+            # the analysis consumes the data chunk by chunk while it is read
+            self.output = self._timed(self.timings, "analysis", self._call_analysis, ap, self._read_chunks(read))
+        elif self.output is None:
+            self.output = self._timed(self.timings, "analysis", self._call_analysis, ap, self.input)
+        written = 0
+        if 'w' in self.json_request["db_io_parameters"]['mode']:
+            written = self._timed(self.timings, "write", self._write_results,
+                                  self.json_request["db_io_parameters"].get('result_id'), self.output)
+        self.server.m_rows_written.inc(written, analysis=self.server.metrics_label(ap['analysis']))
+        return {'result': 'DONE', 'cached': cached[0] is not None}
+
+    def _run_batch(self, entries, cached):
+        """
+        Processes batch request: one read, concurrent analyses and writes
+        :param entries: 'analysis_parameters' entries
+        :param cached: cached results of entries (None if not found)
+        :return: response message
+        """
+        start = time.monotonic()
+        workers = max(1, min(len(entries), self.s.srv_batch_workers))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=threading.current_thread().name) as pool:
+            # every entry runs in its own copy of the context (trace span)
+            futures = [pool.submit(contextvars.copy_context().run, self._run_batch_entry, entry, output)
+                       for entry, output in zip(entries, cached)]
+            results = [f.result() for f in futures]
+        self.timings["analysis"] = round(time.monotonic() - start, 6)
+
+        self.outputs = [output for output, _ in results]
+        failed = sum(1 for _, msg in results if msg['result'] != 'DONE')
+        if failed == 0:
+            result = 'DONE'
+        elif failed < len(entries):
+            result = 'PARTIAL'
+        else:
+            result = 'ERROR'
+        logger.info("Batch complete: " + str(len(entries) - failed) + " of " + str(len(entries)) + " succeeded")
+        return {'result': result, 'results': [msg for _, msg in results]}
+
+    def _run_batch_entry(self, entry, output):
+        """
+        Analyzes shared data and writes results of one batch entry
+        :param entry: analysis parameters with 'result_id'
+        :param output: cached result (None if not found)
+        :return: output, response message
+        """
+        timings = {}
+        msg = {'analysis': entry.get('analysis') if isinstance(entry, dict) else None, 'timings': timings,
+               'cached': output is not None}
+        try:
+            with tracing.span("entry", analysis=str(msg['analysis'])):
+                if output is None:
+                    data = self.input
+                    if data is not None and self.server.execution_mode(entry['analysis']) != "process":
+                        data = data.copy()  # analyses may modify input inplace, the data is shared between entries
+                    output = self._timed(timings, "analysis", self._call_analysis, entry, data)
+                written = 0
+                if 'w' in self.json_request["db_io_parameters"]['mode']:
+                    written = self._timed(timings, "write", self._write_results, entry.get('result_id'), output)
+            self.server.m_rows_written.inc(written, analysis=self.server.metrics_label(msg['analysis']))
+            msg['result'] = 'DONE'
+            return output, msg
+        except cancellation.DeadlineExceeded:
+            msg['result'] = 'TIMEOUT'
+            raise
+        except Exception as err:
+            msg.update({'result': 'ERROR', 'error_message': str(err)})
+            return None, msg
+        finally:
+            self.server.observe(msg['analysis'], timings, msg.get('result', 'ERROR'))
+
+    @staticmethod
+    def _timed(timings, stage, func, *args):
+        cancellation.check()  # no new stage after the deadline
+        start = time.monotonic()
+        try:
+            with tracing.span(stage):
+                return func(*args)
+        finally:
+            timings[stage] = round(time.monotonic() - start, 6)
+
+    def _read_parameters(self, entries):
+        """
+        Checks reading parameters
+        :param entries: 'analysis_parameters' entries
+        :return: tuple (device_id, data_source_id, time_upload, limit, aggregate) or None if not in reading mode
         """
         try:
             db_io = self.json_request["db_io_parameters"]
             if db_io['limit'] == 'null':
                 db_io['limit'] = None
-            if 'r' in db_io['mode']:
-                tu, di, dsi = self._check_reading_lengths(db_io['time_upload'], db_io['device_id'],
-                                                          db_io['data_source_id'])
-                self.influx.connect()
-                self.input = self.influx.read_data(di, dsi, tu, db_io['limit'])
-                self.influx.disconnect()
-                logger.info("Data has been successfully read from DB: " + str(self.input.shape) + " (rows, columns)")
+            if 'r' not in db_io['mode']:
+                return None
+            tu, di, dsi = self._check_reading_lengths(db_io['time_upload'], db_io['device_id'],
+                                                      db_io['data_source_id'])
+            if db_io.get('narrow', True):
+                tu = self._narrow_time_upload(tu, entries)
+            aggregate = self._input_aggregate(entries) if db_io.get('aggregate', True) else None
+            return di, dsi, tu, db_io['limit'], aggregate
         except Exception as err:
             logger.error("Failed to read the data: " + str(err))
             raise Exception("Failed to read the data: " + str(err))
 
-    def _call_analysis(self):
+    def _narrow_time_upload(self, time_upload, entries):
+        """
+        Clips time ranges to the data the analyses use: 'lookback' in A_ARGS, e.g.
+        {"parameter": "target_day", "days": 45, "after": 1} - from 45 days before the date in the 'target_day' argument
+        to the end of the next day after it ('after' is optional, the range's end is kept without it).
+        Batch entries share the data: the union of their windows is read, nothing is clipped if any of them has no
+        lookback. Disabled by '"narrow": false' in 'db_io_parameters'.
+        :param time_upload: list of tuples of upload times (datetimes)
+        :param entries: 'analysis_parameters' entries
+        :return: list of tuples of upload times
+        """
+        starts, ends = [], []
+        for ap in entries:
+            try:
+                spec = self.am.ANALYSIS_ARGS[ap['analysis']]["lookback"]
+                day = u.string_to_date(ap['analysis_arguments'][spec["parameter"]][0])
+            except Exception:
+                return time_upload  # no lookback or wrong argument (reported by the analysis)
+            starts.append(day - datetime.timedelta(days=spec["days"]))
+            ends.append(day + datetime.timedelta(days=spec["after"]) if "after" in spec else None)
+        start = min(starts)
+        end = max(ends) if None not in ends else None
+
+        narrowed, trimmed, total = [], 0., 0.
+        for t in time_upload:
+            tz = datetime.timezone.utc if t[0].tzinfo is not None else None  # analyses use UTC dates
+            d_min = max(t[0], datetime.datetime.combine(start, datetime.time(), tz))
+            d_max = min(t[1], datetime.datetime.combine(end, datetime.time(), tz)) if end is not None else t[1]
+            if d_min > d_max:
+                d_min, d_max = t  # the window is outside of the range, the analysis reports the missing data
+            narrowed.append((d_min, d_max))
+            total += (t[1] - t[0]).total_seconds()
+            trimmed += (t[1] - t[0] - (d_max - d_min)).total_seconds()
+        if trimmed > 0:
+            logger.info("Time ranges narrowed to the analysis lookback (" + str(start) + " - " + str(end) + "): " +
+                        str(round(trimmed / 86400, 2)) + " of " + str(round(total / 86400, 2)) + " days trimmed")
+        return narrowed
+
+    def _input_aggregate(self, entries):
+        """
+        Aggregation of input data in DB: 'input_resolution' (InfluxQL duration, e.g. '1h') and 'input_aggregate'
+        (default - 'mean') in A_ARGS of the analyses, if all of them require the same one. Disabled by
+        '"aggregate": false' in 'db_io_parameters'.
+        :param entries: 'analysis_parameters' entries
+        :return: (function, resolution) or None - raw data
+        """
+        aggregates = set()
+        for ap in entries:
+            a_args = self.am.ANALYSIS_ARGS.get(ap.get('analysis') if isinstance(ap, dict) else None, {})
+            resolution = a_args.get("input_resolution")
+            aggregates.add((a_args.get("input_aggregate", "mean"), resolution) if resolution is not None else None)
+        return aggregates.pop() if len(aggregates) == 1 else None
+
+    def _read_data(self, read):
+        """
+        Read data for processing
+        :param read: reading parameters (see _read_parameters())
+        :return: dataframe
+        """
+        try:
+            di, dsi, tu, limit, aggregate = read
+            with self.db_pool.connection() as influx, self.db_pool.spare_connections(self._spare(di)) as spare:
+                data = influx.read_data(di, dsi, tu, limit, self.s.db_chunk_rows if self.s.db_chunk_rows > 0 else None,
+                                        aggregate, spare)
+            logger.info("Data has been successfully read from DB: " + str(data.shape) + " (rows, columns)")
+        except Exception as err:
+            logger.error("Failed to read the data: " + str(err))
+            raise Exception("Failed to read the data: " + str(err))
+        return data
+
+    def _chunked(self, ap):
+        """
+        :param ap: analysis parameters
+        :return: True if the analysis gets the data by chunks (not a batch, 'chunked' in A_ARGS, executed in a thread
+        and its result can be cached without the data's fingerprint)
+        """
+        if self.batch or self.s.db_chunk_rows <= 0 or self.server.execution_mode(ap['analysis']) != "thread":
+            return False
+        if not self.am.ANALYSIS_ARGS.get(ap['analysis'], {}).get("chunked", False):
+            return False
+        return self.source is not None or self.am.cache is None or not self._use_cache(ap)
+
+    def _read_chunks(self, read):
+        """
+        Reads data by chunks (see Analysis.analyze_chunks()), 'read' timing is the time spent reading
+        :param read: reading parameters (see _read_parameters())
+        :return: generator of dataframes
+        """
+        di, dsi, tu, limit, aggregate = read
+        self.timings["read"] = 0.
+        label = self.server.metrics_label(self.analysis_name)
+        # connections are borrowed for every chunk, they are not held while the analysis processes it
+        chunks = self.db_pool.read_chunks(di, dsi, tu, limit, self.s.db_chunk_rows, aggregate,
+                                          parallel=self._spare(di) + 1)
+        while True:
+            start = time.monotonic()
+            try:
+                chunk = next(chunks, None)
+            except Exception as err:
+                logger.error("Failed to read the data: " + str(err))
+                raise Exception("Failed to read the data: " + str(err))
+            finally:
+                self.timings["read"] = round(self.timings["read"] + time.monotonic() - start, 6)
+            if chunk is None:
+                break
+            self.server.m_rows_read.inc(len(chunk), analysis=label)
+            yield chunk
+
+    def _spare(self, device_id):
+        """
+        :param device_id: series' device ids
+        :return: number of spare DB connections for parallel reading of the series
+        """
+        return max(0, min(self.s.db_parallel_reads, len(device_id)) - 1)
+
+    def _final_data_source(self, read):
+        """
+        Input data identification for results cache, if the data can not change anymore (no reading or all time
+        ranges ended more than 'srv_cache_settle' seconds ago)
+        :param read: reading parameters (see _read_parameters())
+        :return: dictionary or None
+        """
+        if self.am.cache is None:
+            return None
+        if read is None:
+            return {"data": None}
+        di, dsi, tu, limit, aggregate = read
+        settled = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.s.srv_cache_settle)
+        if all(t[1] <= settled for t in tu):
+            query = [[str(i) for i in di], [str(i) for i in dsi], [[t[0].isoformat(), t[1].isoformat()] for t in tu],
+                     limit]
+            return {"query": query + [list(aggregate)] if aggregate is not None else query}
+        return None
+
+    def _cache_key(self, ap):
+        """
+        Results cache key of the analysis entry
+        :param ap: analysis parameters
+        :return: key or None if not cacheable (no data identification yet, bypass flag 'use_cache' is set to false)
+        """
+        if self.source is None or not self._use_cache(ap):
+            return None
+        return self.am.cache_key(ap['analysis'], ap['analysis_arguments'], self.source)
+
+    @staticmethod
+    def _use_cache(ap):
+        """
+        :param ap: analysis parameters
+        :return: False if the entry bypasses the cache ('use_cache' is set to false) or is malformed (its error is
+        reported by the entry, not by the whole batch)
+        """
+        if not isinstance(ap, dict) or not isinstance(ap.get('analysis'), str) or 'analysis_arguments' not in ap:
+            return False
+        return bool(ap.get('use_cache', True))
+
+    def _call_analysis(self, ap, data):
         """
         Analysis caller
+        :param ap: analysis parameters
+        :param data: input dataframe
+        :return: output dataframe
         """
         try:
-            ap = self.json_request["analysis_parameters"]
-            self.output = self.am.run_analysis(ap['analysis'], ap['analysis_arguments'], self.input)
+            runner = None
+            if self.server.execution_mode(ap['analysis']) == "process":
+                # workers reload the script if their version differs from the server's one
+                script_hash = self.am.ANALYSIS_HASH.get(ap['analysis'])
+                runner = lambda n, a, d: self.server.process_pool.run(n, a, d, script_hash)
+            return self.am.run_analysis(ap['analysis'], ap['analysis_arguments'], data, self._cache_key(ap), runner)
         except Exception as err:
             logger.error("Failed to analyze the data: " + str(err))
             raise Exception("Failed to analyze the data: " + str(err))
 
-    def _write_results(self):
+    def _write_results(self, result_id, output):
         """
         Write analysis results to DB
+        :param result_id: list of result ids
+        :param output: output dataframe
+        :return: number of written rows
         """
         try:
             db_io = self.json_request["db_io_parameters"]
-            if 'w' in db_io['mode']:
-                self._check_write_parameters(db_io['result_id'], self.output)
-                self.influx.connect()
-                output_results = self.influx.write_data(db_io['result_id'], self.output)
-                self.influx.disconnect()
-                logger.info("Data has been saved into DB: " + str(self.output.shape) + " " + str(output_results))
+            if 'w' not in db_io['mode']:
+                return 0
+            self._check_write_parameters(result_id, output)
+            with self.db_pool.connection() as influx:
+                output_results = influx.write_data(result_id, output)
+            logger.info("Data has been saved into DB: " + str(output.shape) + " " + str(output_results))
+            return len(output)
         except Exception as err:
             logger.error("Failed to write the data: " + str(err))
             raise Exception("Failed to write the data: " + str(err))
@@ -404,43 +1717,30 @@ class AnalyticsRequestHandler(BaseHTTPRequestHandler):
 
         logger.debug("Writing parameters successfully checked")
 
-    @staticmethod
-    def _get_status_msg():
-        """
-        Server's status wrapper
-        :return: dictionary with status variables
-        """
-
-        def thread_name(t):
-            name = t.name + ' (' + str(t.ident) + ')'
-            if t.daemon:
-                name += ' daemon'
-            return name
-
-        threads = [thread_name(t) for t in threading.enumerate()]
-        return {"active_threads": threading.active_count(),
-                "active_list": threads}
-
 
 if __name__ == "__main__":
     # parse args
     a = parse_args(sys.argv[1:])
 
     # init logger
-    logger = init_logger(a.log_file, a.log_dir, a.log_level, a.log_gmt)
+    logger = init_logger(a)
     logger.info("Server started")
 
     # init analytics server
-    am = analytics.AnalyticsModule(a.srv_script_folders)
-    srv = AnalyticsServerThreaded(AnalyticsRequestHandler, a, am)
+    am = analytics.AnalyticsModule(a.srv_script_folders, a.srv_cache_size * 2 ** 20, a.srv_cache_ttl)
+    logger.info("Analysis functions discovered in " + str(am.startup_time) + " s")
+    if a.srv_frontend == "asyncio":
+        srv = AsyncAnalyticsServer(AsyncAnalyticsRequestHandler, a, am)
+    else:
+        srv = AnalyticsServerThreaded(AnalyticsRequestHandler, a, am)
     srv_thread = threading.Thread(target=srv.start, daemon=True)
 
-    # main loop
+    # main loop: periodic tasks run in the server's scheduler thread, here we just wait (join with timeout keeps
+    # the main thread interruptible on all platforms)
     try:
         srv_thread.start()
-        while True:
-            auto_update_analysis_functions(a, am)
-            continue
+        while srv_thread.is_alive():
+            srv_thread.join(1.)
     # shutdown
     except KeyboardInterrupt:
         logger.info("Server stopped by user\n\n")
@@ -1 +1,2 @@
 from .influx_server_io import InfluxServerIO
+from .influx_pool import InfluxConnectionPool
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from analytics import cancellation
+from .influx_server_io import InfluxServerIO
+
+
+class InfluxConnectionPool:
+    """
+    Thread-safe pool of persistent InfluxDB connections shared across request handlers.
+
+    Connections are created lazily (up to 'size') and reused between requests. Idle connections are checked with
+    check_health(), which is meant to be called periodically in the background.
+    """
+    logger = logging.getLogger('influx_connection_pool')
+
+    def __init__(self, host=None, database=None, port=None, username=None, password=None, size=4, timeout=30.):
+        """
+        Constructor.
+        :param size: maximal number of open connections
+        :param timeout: maximal time (seconds) to wait for a free connection
+        """
+        self.logger.debug("Setting pool parameters")
+        self.host = host
+        self.database = database
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = max(1, size)
+        self.timeout = timeout
+
+        self._idle = []  # most recently used connections are reused first (stack)
+        self._lock = threading.Condition()
+        self._created = 0
+        self._closed = False
+
+        # statistics
+        self._acquired = 0
+        self._waited = 0
+        self._wait_time = 0.
+        self._max_wait_time = 0.
+        self._timeouts = 0
+        self._discarded = 0
+        self._health_checks = 0
+        self._last_health_check = None
+
+    def close(self):
+        """
+        Close all idle connections, the ones in use are closed when released.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            self._disconnect(conn)
+        self.logger.debug("Connection pool closed")
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager: borrow a connection and give it back to the pool.
+        If the block raises a connection error or is aborted, the connection is discarded (it may be broken) and
+        reopened on demand. Query errors (e.g. wrong InfluxQL statement) keep it.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException as err:
+            self.release(conn, discard=self._broken(err))
+            raise
+        else:
+            self.release(conn)
+
+    @contextmanager
+    def spare_connections(self, n):
+        """
+        Context manager: borrow up to n more connections for parallel queries, without waiting (only idle ones and
+        new ones while the pool is not full, possibly none).
+        """
+        conns = []
+        try:
+            while len(conns) < n:
+                conn = self.acquire(block=False)
+                if conn is None:
+                    break
+                conns.append(conn)
+        except Exception as err:
+            self.logger.warning("Failed to open a spare DB connection: " + str(err))
+        try:
+            yield conns
+        except BaseException as err:
+            for conn in conns:
+                self.release(conn, discard=self._broken(err))
+            raise
+        else:
+            for conn in conns:
+                self.release(conn)
+
+    @contextmanager
+    def connections(self, n):
+        """
+        Context manager: borrow a connection (waiting for it) and up to n - 1 spare ones (see spare_connections()),
+        gives the list of them.
+        """
+        with self.connection() as conn, self.spare_connections(n - 1) as spare:
+            yield [conn] + spare
+
+    def read_chunks(self, *args, parallel=1, **kwargs):
+        """
+        Reads data by chunks (see InfluxServerIO.read_chunks()) without holding connections between the chunks:
+        every chunk is read with connections borrowed from the pool, so a slow consumer of the chunks does not keep
+        them from other requests.
+        :param parallel: maximal number of connections reading one chunk in parallel (spare ones are used only if
+        free)
+        :return: generator of DataFrames
+        """
+        reader = InfluxServerIO(self.host, self.database, self.port, self.username, self.password)  # not connected
+        return reader.read_chunks(*args, lease=lambda: self.connections(parallel), **kwargs)
+
+    def acquire(self, block=True):
+        """
+        Take a connection from the pool, open a new one if the pool is not full, wait otherwise.
+        :param block: wait for a free connection, False - return None if there is none
+        :return: connected InfluxServerIO object
+        """
+        if self._closed:
+            raise Exception("Connection pool is closed")
+
+        start = time.monotonic()
+        timeout = min(self.timeout, cancellation.remaining(self.timeout))  # request's deadline
+        conn = None
+        waited = False
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise Exception("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1  # reserve a slot, connect outside of the lock
+                    break
+                if not block:
+                    return None
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    cancellation.check()
+                    self._timeouts += 1
+                    self.logger.error("No free DB connection in " + str(self.timeout) + " s")
+                    raise Exception("No free DB connection in " + str(self.timeout) + " s")
+                waited = True
+                self._lock.wait(remaining)
+            self._acquired += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._waited += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                    self._lock.notify()
+                raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """
+        Give a connection back to the pool.
+        :param conn: connection taken with acquire()
+        :param discard: close the connection instead of reusing it
+        """
+        with self._lock:
+            discard = discard or self._closed
+            if discard:
+                self._created -= 1
+                self._discarded += 1
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+        if discard:
+            self._disconnect(conn)
+
+    def check_health(self):
+        """
+        Ping idle connections, drop the ones that do not respond.
+        """
+        with self._lock:
+            count = len(self._idle)
+        checked = 0
+        for _ in range(count):
+            with self._lock:
+                if not self._idle:
+                    break
+                # the checked connection is taken out of the pool, so it is never pinged and used at the same time;
+                # the others stay available: the least recently used one is checked, the released ones are reused first
+                conn = self._idle.pop(0)
+            checked += 1
+            try:
+                conn.ping()
+                self.release(conn)
+            except Exception as err:
+                self.logger.warning("Idle DB connection is broken, dropping it: " + str(err))
+                self.release(conn, discard=True)
+        with self._lock:
+            self._health_checks += 1
+            self._last_health_check = time.time()
+        self.logger.debug("Health check complete: " + str(checked) + " idle connections checked")
+
+    def stats(self):
+        """
+        Pool statistics.
+        :return: dictionary with occupancy and waiting statistics
+        """
+        with self._lock:
+            idle = len(self._idle)
+            return {"size": self.size,
+                    "open": self._created,
+                    "idle": idle,
+                    "in_use": self._created - idle,
+                    "acquired": self._acquired,
+                    "waited": self._waited,
+                    "wait_time_total": round(self._wait_time, 6),
+                    "wait_time_avg": round(self._wait_time / self._waited, 6) if self._waited else 0.,
+                    "wait_time_max": round(self._max_wait_time, 6),
+                    "timeouts": self._timeouts,
+                    "discarded": self._discarded,
+                    "health_checks": self._health_checks,
+                    "last_health_check": self._last_health_check}
+
+    @staticmethod
+    def _broken(err):
+        """
+        :return: True if the connection which raised the error may be broken: connection errors and aborted
+        (DeadlineExceeded) requests
+        """
+        return not isinstance(err, Exception) or InfluxServerIO.is_connection_error(err)
+
+    def _connect(self):
+        conn = InfluxServerIO(self.host, self.database, self.port, self.username, self.password)
+        conn.connect()
+        self.logger.debug("New DB connection opened")
+        return conn
+
+    def _disconnect(self, conn):
+        try:
+            conn.disconnect()
+        except Exception as err:
+            self.logger.warning("Failed to close DB connection: " + str(err))
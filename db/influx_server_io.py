@@ -1,13 +1,42 @@
+import contextvars
+import http.client
 import logging
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from influxdb import DataFrameClient
 import datetime
 import pandas as pd
 import numpy as np
+import requests
+
+from analytics import cancellation, tracing
+
+
+class _DeadlineSession(requests.Session):
+    """
+    HTTP session of a DB connection: the timeout of every HTTP request (set by the client) is shortened to the
+    remaining time of the current analysis request's deadline (see cancellation.remaining()).
+    """
+
+    def request(self, method, url, **kwargs):
+        remaining = cancellation.remaining()
+        if remaining is not None:
+            timeout = kwargs.get("timeout")
+            kwargs["timeout"] = max(0.001, remaining if timeout is None else min(timeout, remaining))
+        return super().request(method, url, **kwargs)
 
 
 class InfluxServerIO:
     logger = logging.getLogger('influx_server_io')
 
+    TIMEOUT = 15  # seconds, DB requests' timeout (shortened to the remaining time of request's deadline)
+    SERIES_PER_QUERY = 50  # series read by one query (the query is sent in the URL)
+    AGGREGATES = ("mean", "median", "sum", "count", "min", "max", "first", "last", "spread", "stddev")
+    RESOLUTION_RE = re.compile(r"^[1-9]\d*(ns|u|ms|s|m|h|d|w)$")  # InfluxQL duration literal
+    CONNECTION_ERRORS = (OSError, http.client.HTTPException)  # requests' exceptions are OSErrors
+
     def __init__(self, host=None, database=None, port=None, username=None, password=None):
         """
         Constructor.
@@ -28,7 +57,8 @@ class InfluxServerIO:
         try:
             self.logger.debug("Connecting to DB")
 
-            self.client = DataFrameClient(self.host, self.port, self.username, self.password, self.database, timeout=15)
+            self.client = DataFrameClient(self.host, self.port, self.username, self.password, self.database,
+                                          timeout=self.TIMEOUT, session=_DeadlineSession())
             self.client.ping()
 
             self.logger.debug("DB Connection set")
@@ -36,6 +66,31 @@ class InfluxServerIO:
             self.logger.error("DB Connection failed: " + str(err))
             raise Exception("DB Connection failed: " + str(err))
 
+    def ping(self):
+        """
+        Check connection.
+        """
+        try:
+            self.client.ping()
+        except Exception as err:
+            self.logger.error("DB ping failed: " + str(err))
+            raise Exception("DB ping failed: " + str(err))
+
+    @classmethod
+    def is_connection_error(cls, err):
+        """
+        :param err: exception raised by a method of this class (its original exception is its cause or context)
+        :return: True if it is caused by a connection or transport error (the connection may be broken), False - by
+        the query or the data (e.g. wrong InfluxQL statement)
+        """
+        seen = set()
+        while err is not None and id(err) not in seen:
+            if isinstance(err, cls.CONNECTION_ERRORS):
+                return True
+            seen.add(id(err))
+            err = err.__cause__ or err.__context__
+        return False
+
     def disconnect(self):
         """
         Close connection.
@@ -50,55 +105,279 @@ class InfluxServerIO:
             self.logger.error("Can't disconnect from DB: " + str(err))
             raise Exception("Can't disconnect from DB: " + str(err))
 
-    def read_data(self, device_id=None, data_source_id=None, time_upload=None, limit=None):
+    def read_data(self, device_id=None, data_source_id=None, time_upload=None, limit=None, chunk_rows=None,
+                  aggregate=None, connections=None):
         """
         Read data from db according to object's parameters.
+        Series with the same time range are read together: one query per SERIES_PER_QUERY series (tag filters,
+        'GROUP BY device_id, data_source_id'), columns are aligned at once.
         :param device_id: list of ids [uuid1, uuid2, ..., uuidN]
         :param data_source_id: list of ids [id1, id2, ..., idN]
         :param time_upload: list of tuples of dates [(d_min1 d_max1), (d_min2 d_max2), ..., (d_minN d_maxN)]
-        :param limit: retrieved data rows limit
-        :return: list of queries results
+        :param limit: retrieved data rows limit (per series)
+        :param chunk_rows: rows per series read by one query (the data is read by chunks, see read_chunks()),
+        None - at once
+        :param aggregate: (function, resolution), e.g. ('mean', '1h'): values are aggregated by the DB into time
+        intervals of this resolution ('GROUP BY time(1h)', the rows are the intervals with values), None - raw values
+        :param connections: additional connections (InfluxServerIO) to run queries of several series in parallel on
+        (series are split between the queries), None - one query at a time on this connection
+        :return: DataFrame, a column per series ('<device_id>_<data_source_id>')
         """
-        results = pd.DataFrame()
-        try:
-            self.logger.debug("Reading data")
+        chunks = list(self.read_chunks(device_id, data_source_id, time_upload, limit, chunk_rows, aggregate,
+                                       connections))
+        results = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+        self.logger.debug("Reading complete: " + str(results.shape) + " entries returned")
+        return results
 
+    def read_chunks(self, device_id=None, data_source_id=None, time_upload=None, limit=None, chunk_rows=None,
+                    aggregate=None, connections=None, lease=None):
+        """
+        Reads data by chunks: consecutive time intervals, every query returns at most chunk_rows rows per series.
+        The next chunk starts after the last row of the previous one (the rows read beyond it are read again).
+        Parameters are the same as read_data() ones.
+        :param lease: function returning a context manager which borrows the connections (list of InfluxServerIO,
+        the queries are split between them) to read one chunk with, they are given back before the chunk is
+        yielded; None - this connection and 'connections' read all chunks
+        :return: generator of time-ordered DataFrames with the same columns (the first one may be empty)
+        """
+        try:
+            self.logger.debug("Reading data" + (" by chunks of " + str(chunk_rows) + " rows" if chunk_rows else ""))
             if limit is not None:
                 self.logger.debug("Data reading limit set to " + str(limit))
-                limit = "LIMIT " + str(limit)
-            else:
-                limit = ""
+            if aggregate is not None:
+                aggregate = self._check_aggregate(aggregate)
+                self.logger.debug("Data is aggregated: " + aggregate[0] + " by " + aggregate[1])
 
-            for di, dsi, tu in zip(device_id, data_source_id, time_upload):
+            # series' positions grouped by time range
+            ranges = {}
+            series = [(str(di), str(dsi), tu) for di, dsi, tu in zip(device_id, data_source_id, time_upload)]
+            for i, (di, dsi, tu) in enumerate(series):
+                ranges.setdefault((tu[0], tu[1]), []).append(i)
+            left = [limit] * len(series)  # rows left to read (None - unlimited)
+            cursor = None  # the last row of the previous chunk
+            first = True
+        except Exception as err:
+            self.logger.error("Impossible to read: " + str(err))
+            raise Exception("Impossible to read: " + str(err))
 
-                params = {"di": str(di), "dsi": str(dsi), "limit": limit,
-                          "from": datetime.datetime.strftime(tu[0], "%Y-%m-%dT%H:%M:%SZ"),
-                          "to": datetime.datetime.strftime(tu[1], "%Y-%m-%dT%H:%M:%SZ")}
+        if lease is None:
+            fixed = [self] + list(connections or [])
+            lease = lambda: nullcontext(fixed)
+        while True:
+            with lease() as conns:
+                chunk, cutoff = self._read_round(series, ranges, left, cursor, chunk_rows, aggregate, conns)
+            if first or not chunk.empty:
+                yield chunk
+            first = False
+            if cutoff is None:
+                return
+            cursor = cutoff
 
-                query = r"SELECT value FROM data WHERE device_id='{di}' ".format(**params)
-                query += r"and data_source_id='{dsi}' ".format(**params)
-                query += r"and time >= '{from}' and time <= '{to}' ".format(**params)
-                query += r"{limit}".format(**params)
+    def _read_round(self, series, ranges, left, cursor, chunk_rows, aggregate, conns):
+        """
+        Reads the next chunk: rows of all series after the cursor
+        :param ranges: positions of series by time range
+        :param conns: connections to run the queries on (used by one query at a time)
+        :return: chunk (DataFrame), its last row's timestamp (None if it is the last chunk)
+        """
+        # queries: (time range, positions of series), split between the connections
+        pages = []
+        for tu, positions in ranges.items():
+            size = min(self.SERIES_PER_QUERY, -(-len(positions) // len(conns)))
+            pages.extend((tu, positions[b:b + size]) for b in range(0, len(positions), size))
 
-                self.logger.debug("Executing query " + str(query))
+        if len(conns) > 1 and len(pages) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(conns), len(pages)),
+                                    thread_name_prefix="InfluxRead") as executor:
+                outcomes = self._run_pages(series, pages, left, cursor, chunk_rows, aggregate, conns, executor)
+        else:
+            outcomes = self._run_pages(series, pages, left, cursor, chunk_rows, aggregate, conns, None)
 
-                result = self.client.query(query)
-                name = str(di) + '_' + str(dsi)
+        # errors are reported by series, a connection error (if any) is the cause
+        errors = [", ".join(series[i][0] + '_' + series[i][1] for i in batch) + ": " + str(err)
+                  for (tu, batch), (result, page, err) in zip(pages, outcomes) if err is not None]
+        if errors:
+            failures = sorted((err for result, page, err in outcomes if err is not None),
+                              key=lambda err: not self.is_connection_error(err))
+            self.logger.error("Impossible to read: " + "; ".join(errors))
+            raise Exception("Impossible to read: " + "; ".join(errors)) from failures[0]
 
-                if len(result) != 0:
-                    r = result['data']
-                    self.logger.debug("Column " + name + " contains " + str(len(r)) + " rows")
-                    r.rename(columns={"value": name}, inplace=True)
-                    results = pd.merge(results, r, how='outer', left_index=True, right_index=True)
-                else:
-                    self.logger.debug("Column " + name + " contains " + str(0) + " rows")
-                    results[name] = np.nan
+        try:
+            columns = [None] * len(series)
+            more = []  # the last rows of series which may have more rows
+            for (tu, batch), (result, page, err) in zip(pages, outcomes):
+                for i in batch:
+                    di, dsi = series[i][0], series[i][1]
+                    r = result.get(('data', (('data_source_id', dsi), ('device_id', di))))
+                    if r is not None and 'value' in r:
+                        column = r['value'].rename(di + '_' + dsi)
+                    else:
+                        column = pd.Series(index=pd.DatetimeIndex([], tz='UTC'), name=di + '_' + dsi,
+                                           dtype=np.float64)
+                    if left[i] is not None:
+                        column = column.iloc[:left[i]]
+                    if page is not None and len(column) == page and (left[i] is None or left[i] > page):
+                        more.append(column.index[-1])
+                    columns[i] = column
 
+            # the chunk ends at the earliest of the last rows of unfinished series
+            cutoff = min(more) if more else None
+            for i, column in enumerate(columns):
+                if cutoff is not None:
+                    columns[i] = column = column.loc[:cutoff]
+                if left[i] is not None:
+                    left[i] -= len(column)
+                self.logger.debug("Column " + column.name + " contains " + str(len(column)) + " rows")
+
+            # one outer join of all columns (index union is sorted)
+            chunk = pd.concat(columns, axis=1, sort=True) if columns else pd.DataFrame()
         except Exception as err:
             self.logger.error("Impossible to read: " + str(err))
             raise Exception("Impossible to read: " + str(err))
-        self.logger.debug("Reading complete: " + str(results.shape) + " entries returned")
-        return results
+        return chunk, cutoff
+
+    @staticmethod
+    def _run_pages(series, pages, left, cursor, chunk_rows, aggregate, conns, executor):
+        """
+        Runs the queries, one after another or in parallel (a connection per query). Queries not started yet are
+        skipped after a failure.
+        :return: list of (query result, rows limit of the query, error or None) in order of pages
+        """
+        if executor is None:
+            outcomes = []
+            for tu, batch in pages:
+                try:
+                    outcomes.append(conns[0]._read_page(series, batch, tu, left, cursor, chunk_rows, aggregate) +
+                                    (None,))
+                except Exception as err:
+                    outcomes.append(({}, None, err))
+                    break
+            return outcomes + [({}, None, None)] * (len(pages) - len(outcomes))
+
+        free = queue.Queue()
+        for conn in conns:
+            free.put(conn)
+
+        def read(tu, batch):
+            conn = free.get()
+            try:
+                return conn._read_page(series, batch, tu, left, cursor, chunk_rows, aggregate)
+            finally:
+                free.put(conn)
+
+        # every query runs in a copy of this context (request's deadline, trace span)
+        futures = [executor.submit(contextvars.copy_context().run, read, tu, batch) for tu, batch in pages]
+        outcomes = []
+        try:
+            for f in futures:
+                if f.cancelled():
+                    outcomes.append(({}, None, None))
+                    continue
+                try:
+                    outcomes.append(f.result() + (None,))
+                except Exception as err:
+                    outcomes.append(({}, None, err))
+                    for rest in futures:
+                        rest.cancel()
+        except BaseException:  # DeadlineExceeded
+            for rest in futures:
+                rest.cancel()
+            raise
+        return outcomes
+
+    def _read_page(self, series, batch, tu, left, cursor, chunk_rows, aggregate):
+        """
+        Reads rows of the batch of series with the same time range after the cursor
+        :param series: list of (device_id, data_source_id, time_upload)
+        :param batch: positions of the series to read
+        :param left: rows left to read by series (None - unlimited)
+        :param cursor: timestamp to read after (or the time range's start if it is later), None - from the start of
+        the time range
+        :param chunk_rows: rows per series, None - unlimited
+        :param aggregate: (function, resolution) or None
+        :return: query result (dictionary of DataFrames), rows limit of the query (None - unlimited)
+        """
+        batch = [i for i in batch if left[i] is None or left[i] > 0]
+        end = pd.Timestamp(tu[1])
+        end = end.tz_localize('UTC') if end.tzinfo is None else end
+        if len(batch) == 0 or (cursor is not None and cursor >= end):
+            return {}, None
+        page = [chunk_rows] if chunk_rows else []
+        if all(left[i] is not None for i in batch):
+            page.append(max(left[i] for i in batch))
+        page = min(page) if page else None
+
+        # the cursor is shared by all time ranges: a range starting after it is read from its own start
+        tags = list(dict.fromkeys((series[i][0], series[i][1]) for i in batch))
+        begin = pd.Timestamp(tu[0])
+        begin = begin.tz_localize('UTC') if begin.tzinfo is None else begin
+        start = "time >= '" + datetime.datetime.strftime(tu[0], "%Y-%m-%dT%H:%M:%SZ") + "'"
+        if cursor is not None and aggregate is not None:
+            cursor = cursor + pd.Timedelta(aggregate[1])  # cursor is the interval's start, the next one is read
+            if cursor > begin:
+                start = "time >= " + str(cursor.value)
+        elif cursor is not None and cursor >= begin:
+            start = "time > " + str(cursor.value)
+        query = self._series_query(tags, start, tu[1], "LIMIT " + str(page) if page is not None else "", aggregate)
+
+        self.logger.debug("Executing query " + str(query))
+
+        with tracing.span("influx.query", series=len(tags)) as sp:
+            result = self._query(query)
+            if sp is not None:
+                sp.attributes["rows"] = sum(len(r) for r in result.values())
+        return result, page
+
+    def _check_aggregate(self, aggregate):
+        """
+        :param aggregate: (function, resolution)
+        :return: checked (function, resolution)
+        """
+        function, resolution = str(aggregate[0]).lower(), str(aggregate[1])
+        if function not in self.AGGREGATES:
+            raise Exception("Unsupported aggregate function '" + function + "', supported: " + str(self.AGGREGATES))
+        if self.RESOLUTION_RE.match(resolution) is None:
+            raise Exception("Wrong aggregation resolution '" + resolution + "' (InfluxQL duration expected, e.g. '1h')")
+        return function, resolution
+
+    @staticmethod
+    def _series_query(tags, start, end, limit, aggregate=None):
+        """
+        Query of several series with the same time range (limit is applied to every series)
+        :param tags: list of (device_id, data_source_id)
+        :param start: time range's start condition
+        :param end: time range's end (datetime)
+        :param limit: 'LIMIT N' or ''
+        :param aggregate: (function, resolution) or None
+        """
+        def quote(value):
+            return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+        params = {"start": start, "to": datetime.datetime.strftime(end, "%Y-%m-%dT%H:%M:%SZ"), "limit": limit}
+        condition = " or ".join("(device_id=" + quote(di) + " and data_source_id=" + quote(dsi) + ")"
+                                for di, dsi in tags)
+        if aggregate is None:
+            query = r"SELECT value FROM data WHERE (" + condition + ") "
+            query += r"and {start} and time <= '{to}' ".format(**params)
+            query += r"GROUP BY device_id, data_source_id {limit}".format(**params)
+        else:
+            # intervals without values are omitted: fill(none)
+            query = r"SELECT " + aggregate[0] + "(value) AS value FROM data WHERE (" + condition + ") "
+            query += r"and {start} and time <= '{to}' ".format(**params)
+            query += r"GROUP BY time(" + aggregate[1] + "), device_id, data_source_id fill(none) "
+            query += r"{limit}".format(**params)
+        return query
+
+    def _query(self, query):
+        """
+        Executes the query, aborts it if the current request's deadline passes (raises DeadlineExceeded).
+        """
+        cancellation.check()
+        try:
+            return self.client.query(query)  # HTTP timeout is bounded by the deadline (see _DeadlineSession)
+        except Exception:
+            cancellation.check()  # timed out because of the deadline
+            raise
 
     def write_data(self, result_id=None, output_data=None):
         """
@@ -120,7 +399,8 @@ class InfluxServerIO:
                     self.logger.warning(
                         "Column name: " + str(col) + " (doesnt's start with 'val' or 'bool', renaming to 'val')")
                     df.rename(columns={col: 'value'}, inplace=True)
-                v = self.client.write_points(df, 'data_result', {'result_id': str(ri)})
+                with tracing.span("influx.write_points", result_id=str(ri), rows=len(df)):
+                    v = self.client.write_points(df, 'data_result', {'result_id': str(ri)})
                 results.append(str(ri))
         except Exception as err:
             self.logger.error("Writing to DB failed: " + str(err))
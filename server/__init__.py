@@ -0,0 +1,6 @@
+from .executor import AnalysisExecutor, QueueFullError
+from .process_pool import AnalysisProcessPool
+from .jobs import Job, JobTable
+from .single_flight import SingleFlight
+from .scheduler import Scheduler
+from . import codec
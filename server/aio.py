@@ -0,0 +1,77 @@
+import asyncio
+import http.client
+import io
+
+"""
+HTTP/1.x request parsing for the asyncio front end.
+"""
+
+MAX_HEADERS = 100
+
+
+class BadRequest(Exception):
+    """
+    Raised when the request can not be parsed (the connection is closed after the 400 response).
+    """
+    pass
+
+
+async def read_request(reader):
+    """
+    Reads request line and headers.
+    :param reader: asyncio.StreamReader (its limit is the maximal line length)
+    :return: (method, target, version, headers (http.client.HTTPMessage)) or None if the connection is closed
+    """
+    try:
+        line = await reader.readline()
+        while line in (b"\r\n", b"\n"):  # empty lines before the request line are allowed
+            line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode("iso-8859-1").split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise BadRequest("Bad request line: " + repr(line[:100]))
+        method, target, version = parts
+
+        lines = []
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            lines.append(header)
+            if len(lines) > MAX_HEADERS:
+                raise BadRequest("Too many headers")
+    except ValueError as err:  # line longer than the reader's limit
+        raise BadRequest("Request line or header is too long: " + str(err))
+    headers = http.client.parse_headers(io.BytesIO(b"".join(lines) + b"\r\n"))
+    return method, target, version, headers
+
+
+def keep_alive(version, headers):
+    """
+    :return: True if the connection persists after the response (HTTP/1.1 default, HTTP/1.0 'keep-alive')
+    """
+    connection = headers.get("Connection", "").lower()
+    if version == "HTTP/1.1":
+        return connection != "close"
+    return connection == "keep-alive"
+
+
+async def read_body(reader, length):
+    """
+    Reads the request's body into a writable buffer (inline input data arrays are its views, see codec.read_npz())
+    :param reader: asyncio.StreamReader
+    :param length: 'Content-Length'
+    :return: bytearray
+    :raise asyncio.IncompleteReadError: the connection is closed early
+    """
+    content = bytearray(length)
+    view = memoryview(content)
+    position = 0
+    while position < length:
+        chunk = await reader.read(min(length - position, 2 ** 20))
+        if not chunk:
+            raise asyncio.IncompleteReadError(bytes(view[:position]), length)
+        view[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return content
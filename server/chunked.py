@@ -0,0 +1,27 @@
+class ChunkedWriter:
+    """
+    HTTP/1.1 chunked transfer encoding writer (a plain pass-through for HTTP/1.0 clients: the body ends with
+    the connection).
+    """
+
+    def __init__(self, wfile, chunked=True):
+        """
+        :param wfile: handler's output stream
+        :param chunked: use chunked encoding
+        """
+        self.wfile = wfile
+        self.chunked = chunked
+
+    def write(self, data):
+        if not data:
+            return  # an empty chunk would end the body
+        if self.chunked:
+            self.wfile.write(b"%X\r\n" % len(data) + data + b"\r\n")
+        else:
+            self.wfile.write(data)
+        self.wfile.flush()
+
+    def close(self):
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
@@ -0,0 +1,192 @@
+import io
+import json
+import struct
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+"""
+Analysis results (DataFrames) encoding for responses, inline input data decoding.
+"""
+
+# inline result formats ('return' of 'db_io_parameters') : content type
+FORMATS = {"json": "application/json",
+           "ndjson": "application/x-ndjson",
+           "npz": "application/x-npz"}
+
+NDJSON_ROWS = 10000  # rows per streamed chunk
+
+
+def check_format(fmt):
+    """
+    :param fmt: inline result format or None (results are not returned)
+    :return: the format
+    """
+    if fmt is not None and fmt not in FORMATS:
+        raise Exception("Unknown result format '" + str(fmt) + "', available: " + str(sorted(FORMATS)))
+    return fmt
+
+
+def frame_to_records(df):
+    """
+    DataFrame -> list of records
+    :param df: DataFrame with time series index
+    :return: [{'time': ISO time, 'col1': val1, ...}, ...]
+    """
+    if df is None:
+        return []
+    out = df.copy(deep=False)
+    out.index.name = 'time'
+    return json.loads(out.reset_index().to_json(orient='records', date_format='iso', date_unit='ms'))
+
+
+def frame_to_ndjson(df, **fields):
+    """
+    DataFrame -> newline delimited JSON records (same as frame_to_records()), encoded by blocks of NDJSON_ROWS rows
+    :param df: DataFrame with time series index
+    :param fields: constant fields added to every record (e.g. batch entry number)
+    :return: generator of bytes
+    """
+    if df is None:
+        return
+    for start in range(0, len(df), NDJSON_ROWS):
+        out = df.iloc[start:start + NDJSON_ROWS].copy(deep=False)
+        out.index.name = 'time'
+        out = out.reset_index()
+        for key, value in fields.items():
+            out[key] = value
+        text = out.to_json(orient='records', lines=True, date_format='iso', date_unit='ms')
+        yield (text if text.endswith("\n") else text + "\n").encode()  # newer pandas versions end with a newline
+
+
+def frames_to_npz(frames, meta):
+    """
+    DataFrames -> uncompressed npz archive (numpy.load() without pickles), columnar:
+    '<i>.time' - int64 timestamps (ns since epoch, UTC), '<i>.values' - float64 (rows, columns),
+    '<i>.columns' - column names, 'meta' - JSON (response message); i - number of the frame (batch entry).
+    Frames which are None are skipped.
+    :param frames: list of DataFrames with time series index
+    :param meta: JSON-serializable dictionary
+    :return: bytes
+    """
+    arrays = {"meta": np.array(json.dumps(meta, sort_keys=True, default=str))}
+    for i, df in enumerate(frames):
+        if df is None:
+            continue
+        try:
+            arrays[str(i) + ".time"] = np.asarray(df.index.asi8, dtype=np.int64)
+            arrays[str(i) + ".values"] = df.to_numpy(dtype=np.float64)
+        except (AttributeError, TypeError, ValueError) as err:
+            raise Exception("Impossible to encode the result as npz (time index and numeric columns are "
+                            "required): " + str(err))
+        arrays[str(i) + ".columns"] = np.array([str(c) for c in df.columns], dtype=np.str_)
+    out = io.BytesIO()
+    np.savez(out, **arrays)
+    return out.getvalue()
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    Seekable file over a bytes-like object, without copying it (io.BytesIO copies everything but bytes).
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._buffer = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._buffer[self._position:self._position + len(b)]
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def read_npz(buffer):
+    """
+    Reads arrays of an npz archive (numpy.savez() or savez_compressed()). Uncompressed arrays are not copied: they are
+    views of the buffer (writable if the buffer is, e.g. bytearray). Object arrays (pickles) are not allowed.
+    :param buffer: bytes-like archive
+    :return: dictionary {name : array}
+    """
+    arrays = {}
+    f = _BufferReader(buffer)
+    try:
+        with zipfile.ZipFile(f) as zf:
+            for info in zf.infolist():
+                name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+                if info.compress_type != zipfile.ZIP_STORED:
+                    with zf.open(info) as member:
+                        arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                    continue
+                # member's data follows its local header: 30 bytes, file name and extra field
+                f.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack("<HH", f.read(4))
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                if dtype.hasobject:
+                    raise Exception("object arrays are not allowed: " + name)
+                count = int(np.prod(shape, dtype=np.int64))
+                array = np.frombuffer(buffer, dtype, count, f.tell())
+                arrays[name] = array.reshape(shape, order="F" if fortran_order else "C")
+    except (zipfile.BadZipFile, ValueError, struct.error) as err:
+        raise Exception("Impossible to read npz: " + str(err))
+    return arrays
+
+
+def npz_to_request(buffer):
+    """
+    Inline input data request: npz archive with 'request' - analysis request (JSON string), 'time' - int64 timestamps
+    (ns since epoch, UTC), 'values' - float64 (rows, columns) or (rows,), 'columns' - column names (optional).
+    The layout of frames_to_npz() ('0.time', '0.values', '0.columns') is accepted too: results can be sent back.
+    Values are not copied if the buffer is writable (analyses may modify the input inplace).
+    :param buffer: bytes-like archive
+    :return: analysis request (dictionary), input DataFrame
+    """
+    arrays = read_npz(buffer)
+    if "request" not in arrays:
+        raise Exception("Inline data has no 'request'")
+    try:
+        json_request = json.loads(str(arrays["request"]))
+    except Exception as err:
+        raise Exception("Inline data 'request' is not a JSON: " + str(err))
+    prefix = "" if "time" in arrays else "0."
+    if prefix + "time" not in arrays or prefix + "values" not in arrays:
+        raise Exception("Inline data must have 'time' and 'values'")
+    time = arrays[prefix + "time"]
+    values = arrays[prefix + "values"]
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    if time.ndim != 1 or values.ndim != 2 or len(time) != len(values):
+        raise Exception("Inline data shapes do not match: 'time' " + str(time.shape) + ", 'values' " +
+                        str(values.shape))
+    if not values.flags.writeable:
+        values = values.copy()
+    columns = arrays.get(prefix + "columns")
+    columns = [str(c) for c in columns] if columns is not None else [str(i) for i in range(values.shape[1])]
+    if len(columns) != values.shape[1]:
+        raise Exception("Inline data has " + str(values.shape[1]) + " columns, but " + str(len(columns)) + " names")
+    index = pd.DatetimeIndex(time.astype(np.int64, copy=False).view("datetime64[ns]"), tz="UTC")
+    return json_request, pd.DataFrame(values, index=index, columns=columns, copy=False)
@@ -0,0 +1,225 @@
+import collections
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the executor's queue is full and the task is rejected.
+    """
+    pass
+
+
+class _Task:
+    __slots__ = ("fn", "args", "kwargs", "key", "priority", "tag", "future", "submitted", "context")
+
+    def __init__(self, fn, args, kwargs, key, priority):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.priority = priority
+        self.tag = None  # virtual finish time (weighted fair queueing)
+        self.future = Future()
+        self.submitted = time.monotonic()
+        self.context = contextvars.copy_context()  # e.g. the request's trace span
+
+
+class AnalysisExecutor:
+    """
+    Fixed-size pool of worker threads with a bounded queue (admission control).
+
+    Optional per-key (analysis name) concurrency caps: a queued task whose key has reached its cap is skipped
+    until one of the running tasks with the same key completes, the other tasks are not blocked.
+
+    Priority classes share the workers by weighted fair queueing: every task gets a virtual finish time
+    (max(virtual time, previous task of its class) + 1 / weight) and the queued task with the earliest one starts
+    first. A class with weight 8 gets 8 times more starts than a class with weight 1 while both have queued tasks,
+    an idle class does not accumulate credit.
+    """
+    logger = logging.getLogger('analysis_executor')
+
+    def __init__(self, workers=4, queue_size=16, limit=None, classes=None):
+        """
+        Constructor.
+        :param workers: number of worker threads
+        :param queue_size: maximal number of waiting tasks, further tasks are rejected
+        :param limit: callable key -> maximal number of concurrently running tasks with this key (None if unlimited)
+        :param classes: priority class : weight (dictionary), None - one class
+        """
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.limit = limit
+        self.classes = dict(classes) if classes else {None: 1.}
+
+        self._pending = collections.deque()
+        self._virtual_time = 0.
+        self._last_tag = {c: 0. for c in self.classes}  # class : virtual finish time of its last task
+        self._running = collections.Counter()  # key : running tasks
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+
+        # statistics
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_time = 0.
+        self._max_wait_time = 0.
+        self._class_stats = {c: {"submitted": 0, "rejected": 0, "started": 0, "wait_time": 0., "max_wait_time": 0.}
+                             for c in self.classes}
+
+    def start(self):
+        """
+        Start worker threads.
+        """
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name="AnalysisWorker-" + str(i), daemon=True)
+                self._threads.append(t)
+                t.start()
+        self.logger.debug("Executor started: " + str(self.workers) + " workers, queue size " + str(self.queue_size))
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting tasks, cancel queued ones, optionally wait for the running ones.
+        """
+        with self._cond:
+            self._shutdown = True
+            pending, self._pending = self._pending, collections.deque()
+            self._cond.notify_all()
+        for task in pending:
+            task.future.cancel()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def submit(self, fn, *args, key=None, priority=None, **kwargs):
+        """
+        Queue a task.
+        :param fn: callable
+        :param key: task's key (analysis name) for concurrency caps
+        :param priority: task's priority class, None - the first one
+        :return: Future
+        """
+        if priority is None:
+            priority = next(iter(self.classes))
+        if priority not in self.classes:
+            raise Exception("Unknown priority class: " + str(priority))
+        task = _Task(fn, args, kwargs, key, priority)
+        with self._cond:
+            if self._shutdown:
+                raise Exception("Executor is shut down")
+            if len(self._pending) >= self.queue_size + self._free_workers():
+                self._rejected += 1
+                self._class_stats[priority]["rejected"] += 1
+                raise QueueFullError("Server is busy: " + str(len(self._pending)) + " requests queued")
+            task.tag = max(self._virtual_time, self._last_tag[priority]) + 1. / self.classes[priority]
+            self._last_tag[priority] = task.tag
+            self._pending.append(task)
+            self._submitted += 1
+            self._class_stats[priority]["submitted"] += 1
+            self._cond.notify()
+        return task.future
+
+    def stats(self):
+        """
+        Executor statistics.
+        :return: dictionary with queue and workers statistics
+        """
+        with self._cond:
+            started = self._completed + self._failed + sum(self._running.values())
+            return {"workers": self.workers,
+                    "busy": sum(self._running.values()),
+                    "queue_size": self.queue_size,
+                    "queue_depth": len(self._pending),
+                    "submitted": self._submitted,
+                    "rejected": self._rejected,
+                    "completed": self._completed,
+                    "failed": self._failed,
+                    "wait_time_avg": round(self._wait_time / started, 6) if started else 0.,
+                    "wait_time_max": round(self._max_wait_time, 6),
+                    "running": {str(k): v for k, v in self._running.items() if v > 0},
+                    "classes": self._classes_stats()}
+
+    def _classes_stats(self):
+        """
+        Per priority class statistics (called under the lock).
+        """
+        if list(self.classes) == [None]:
+            return {}
+        queued = collections.Counter(task.priority for task in self._pending)
+        out = {}
+        for c, weight in self.classes.items():
+            cs = self._class_stats[c]
+            out[str(c)] = {"weight": weight,
+                           "queue_depth": queued[c],
+                           "submitted": cs["submitted"],
+                           "rejected": cs["rejected"],
+                           "started": cs["started"],
+                           "wait_time_avg": round(cs["wait_time"] / cs["started"], 6) if cs["started"] else 0.,
+                           "wait_time_max": round(cs["max_wait_time"], 6)}
+        return out
+
+    def _free_workers(self):
+        return max(0, self.workers - sum(self._running.values()))
+
+    def _next_task(self):
+        """
+        Queued task with the earliest virtual finish time among the ones whose key is below its concurrency cap
+        (called under the lock).
+        """
+        best = None
+        for task in self._pending:
+            if best is not None and task.tag >= best.tag:
+                continue
+            cap = self.limit(task.key) if (self.limit is not None and task.key is not None) else None
+            if cap is None or cap <= 0 or self._running[task.key] < cap:
+                best = task
+        if best is not None:
+            self._pending.remove(best)
+            self._virtual_time = max(self._virtual_time, best.tag)
+        return best
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = None
+                while not self._shutdown:
+                    task = self._next_task()
+                    if task is not None:
+                        break
+                    self._cond.wait()
+                if task is None:
+                    return
+                self._running[task.key] += 1
+                wait = time.monotonic() - task.submitted
+                self._wait_time += wait
+                self._max_wait_time = max(self._max_wait_time, wait)
+                cs = self._class_stats[task.priority]
+                cs["started"] += 1
+                cs["wait_time"] += wait
+                cs["max_wait_time"] = max(cs["max_wait_time"], wait)
+
+            failed = False
+            if task.future.set_running_or_notify_cancel():
+                try:
+                    task.future.set_result(task.context.run(task.fn, *task.args, **task.kwargs))
+                except BaseException as err:
+                    failed = True
+                    task.future.set_exception(err)
+
+            with self._cond:
+                self._running[task.key] -= 1
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                # a task skipped because of its key's cap may be runnable now
+                self._cond.notify_all()
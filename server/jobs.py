@@ -0,0 +1,162 @@
+import collections
+import logging
+import threading
+import time
+import uuid
+
+from analytics import cancellation
+from .executor import QueueFullError
+
+
+class Job:
+    """
+    Asynchronous analysis request: task submitted to the executor and its future.
+    """
+
+    def __init__(self, task, future):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.future = future
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    @property
+    def status(self):
+        """
+        Job status: 'queued', 'running', 'done', 'error' or 'cancelled'
+        """
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "error" if self.future.exception() is not None else "done"
+        return "running" if self.task.started is not None else "queued"
+
+    def describe(self):
+        """
+        Job's description (without result data)
+        :return: dictionary
+        """
+        status = self.status
+        msg = {"job_id": self.id,
+               "status": status,
+               "analysis": self.task.analysis_name,
+               "priority": self.task.priority,
+               "created": self.created,
+               "finished": self.finished,
+               "timings": dict(self.task.timings)}
+        if self.task.trace is not None:
+            msg["trace"] = {"trace_id": self.task.trace.trace_id, "spans": self.task.trace.to_dict()}
+        if status == "done":
+            msg.update(self.future.result())
+        elif status == "error":
+            err = self.future.exception()
+            msg.update({"result": "TIMEOUT" if isinstance(err, cancellation.DeadlineExceeded) else "ERROR",
+                        "error_message": str(err)})
+        return msg
+
+
+class JobTable:
+    """
+    Bounded table of asynchronous jobs. Finished jobs are evicted after their TTL expires
+    or, if the table is full, starting from the oldest finished one.
+    """
+    logger = logging.getLogger('job_table')
+
+    def __init__(self, max_jobs=1000, ttl=3600.):
+        """
+        Constructor.
+        :param max_jobs: maximal number of stored jobs (queued, running and finished)
+        :param ttl: time (seconds) finished jobs are kept for
+        """
+        self.max_jobs = max(1, max_jobs)
+        self.ttl = ttl
+        self._jobs = collections.OrderedDict()  # id : job, in order of creation
+        self._lock = threading.Lock()
+
+        # statistics
+        self._added = 0
+        self._evicted = 0
+        self._rejected = 0
+
+    def add(self, task, submit):
+        """
+        Registers a new job.
+        :param task: AnalysisTask object
+        :param submit: callable task -> (executed task, future), submits the task for execution (the executed task
+        differs from the given one if the request is coalesced with an identical in-flight one)
+        :return: Job object
+        """
+        with self._lock:
+            self._evict_expired()
+            if len(self._jobs) >= self.max_jobs and not self._evict_oldest_finished():
+                self._rejected += 1
+                raise QueueFullError("Job table is full: " + str(len(self._jobs)) + " jobs")
+            job = Job(*submit(task))
+            self._jobs[job.id] = job
+            self._added += 1
+        job.future.add_done_callback(lambda f: self._on_done(job))
+        return job
+
+    def get(self, job_id):
+        """
+        :param job_id: job id
+        :return: Job object or None if not found (or expired)
+        """
+        with self._lock:
+            self._evict_expired()
+            return self._jobs.get(job_id)
+
+    def evict(self):
+        """
+        Removes expired jobs.
+        """
+        with self._lock:
+            self._evict_expired()
+
+    def stats(self):
+        """
+        Job table statistics.
+        :return: dictionary
+        """
+        with self._lock:
+            unfinished = sum(1 for job in self._jobs.values() if not job.done)
+            return {"max_jobs": self.max_jobs,
+                    "ttl": self.ttl,
+                    "jobs": len(self._jobs),
+                    "unfinished": unfinished,
+                    "added": self._added,
+                    "evicted": self._evicted,
+                    "rejected": self._rejected}
+
+    def _on_done(self, job):
+        job.finished = time.time()
+        job.task.input = None  # input data is not needed anymore, keep the result only
+
+    def _evict_expired(self):
+        """
+        Called under the lock.
+        """
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and now - job.finished > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired:
+            self._evicted += len(expired)
+            self.logger.debug(str(len(expired)) + " expired jobs evicted")
+
+    def _evict_oldest_finished(self):
+        """
+        Called under the lock.
+        :return: True if evicted
+        """
+        for job_id, job in self._jobs.items():
+            if job.finished is not None:
+                del self._jobs[job_id]
+                self._evicted += 1
+                return True
+        return False
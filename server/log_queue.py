@@ -0,0 +1,111 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+_handler = None  # installed BoundedQueueHandler
+_listener = None
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands log records over to the writer thread (QueueListener) through a bounded queue: logging threads never wait
+    for the disk. Records are dropped (and counted) if the queue is full.
+
+    The message is formatted in the logging thread (arguments could be modified later), messages longer than
+    max_message characters are truncated; only large_sample share of them is kept at all.
+    """
+
+    def __init__(self, q, max_message=4096, large_sample=1.):
+        super().__init__(q)
+        self.max_message = max_message
+        self.large_sample = large_sample
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._dropped = 0
+        self._truncated = 0
+        self._sampled_out = 0
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        if self.max_message > 0 and len(record.msg) > self.max_message:
+            if self.large_sample < 1. and random.random() >= self.large_sample:
+                with self._lock:
+                    self._sampled_out += 1
+                return None
+            cut = len(record.msg) - self.max_message
+            record.msg = record.msg[:self.max_message] + " ... [" + str(cut) + " characters truncated]"
+            record.message = record.msg
+            with self._lock:
+                self._truncated += 1
+        return record
+
+    def emit(self, record):
+        try:
+            record = self.prepare(record)
+            if record is not None:
+                self.enqueue(record)
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return
+        with self._lock:
+            self._enqueued += 1
+
+    def stats(self):
+        with self._lock:
+            return {"queue_size": self.queue.maxsize,
+                    "queued": self.queue.qsize(),
+                    "enqueued": self._enqueued,
+                    "dropped": self._dropped,
+                    "truncated": self._truncated,
+                    "sampled_out": self._sampled_out}
+
+
+def configure(filename, filemode, format, datefmt, level, gmt=False, queue_size=10000, max_message=4096,
+              large_sample=1.):
+    """
+    Installs queue-based logging: the root logger puts records into a bounded queue, a background thread writes them
+    to the file. Arguments are the same as logger_configs() returns (logging.basicConfig() ones and queue settings).
+    :return: BoundedQueueHandler
+    """
+    global _handler, _listener
+    file_handler = logging.FileHandler(filename, filemode)
+    formatter = logging.Formatter(format, datefmt)
+    if gmt:
+        formatter.converter = time.gmtime
+    file_handler.setFormatter(formatter)
+    _handler = BoundedQueueHandler(queue.Queue(max(1, queue_size)), max_message, large_sample)
+    _listener = logging.handlers.QueueListener(_handler.queue, file_handler)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_handler)
+    _listener.start()
+    atexit.register(shutdown)
+    return _handler
+
+
+def shutdown():
+    """
+    Writes the queued records and stops the writer thread (called at exit).
+    """
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def stats():
+    """
+    :return: logging queue statistics or None if not configured
+    """
+    return _handler.stats() if _handler is not None else None
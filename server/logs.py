@@ -0,0 +1,182 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+
+# record's first line: '2019-01-31 12:00:00.123 INFO module.function ...' (see logger_configs())
+RECORD_RE = re.compile(rb"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d+ ([A-Z]+) ")
+
+
+class LogFile:
+    """
+    Log file reader for '/logs': tail, byte ranges, level and time filters, follow mode. The file is streamed
+    in chunks, never loaded as a whole.
+
+    Time filters use a sparse offset index: the timestamp of the first record after every CHECKPOINT bytes.
+    The index is extended as the file grows (only the checkpoints are read) and rebuilt if the file is rotated.
+    """
+    logger = logging.getLogger('log_file')
+
+    CHECKPOINT = 2 ** 20  # bytes between index checkpoints
+    CHUNK = 2 ** 16  # bytes per output chunk
+    FOLLOW_POLL = 0.5  # seconds between file size checks in follow mode
+    IDLE = object()  # follow mode marker: no new records yet (see records())
+
+    def __init__(self, path):
+        """
+        :param path: log file path
+        """
+        self.path = path
+        self._index = []  # (timestamp, offset) of checkpoints, ordered
+        self._indexed = 0  # number of checked checkpoints
+        self._inode = None
+        self._lock = threading.Lock()
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def read_range(self, start, end):
+        """
+        Raw bytes of the file, streamed.
+        :param start: first byte offset
+        :param end: last byte offset (inclusive)
+        :return: generator of chunks
+        """
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            left = end - start + 1
+            while left > 0:
+                chunk = f.read(min(self.CHUNK, left))
+                if not chunk:
+                    break
+                left -= len(chunk)
+                yield chunk
+
+    def records(self, start=0, end=None, tail=None, level=None, since=None, until=None, follow=None, poll=True):
+        """
+        Log records (first line and continuation lines, e.g. tracebacks), filtered, streamed.
+        :param start: first byte offset
+        :param end: byte offset to stop at (exclusive), None - end of the file
+        :param tail: start from the N-th last line
+        :param level: minimal level (number)
+        :param since: records not older than this time ('YYYY-MM-DD HH:MM:SS', log's time zone)
+        :param until: records not newer than this time
+        :param follow: keep streaming records appended during this time (seconds) after the end of file is reached
+        :param poll: wait for new records in follow mode here (sleeps), False - yield IDLE instead: the consumer waits
+        FOLLOW_POLL seconds before taking the next chunk (e.g. on an event loop)
+        :return: generator of chunks (and IDLE markers)
+        """
+        since_b = since.encode() if since is not None else None
+        until_b = until.encode() if until is not None else None
+        with open(self.path, "rb") as f:
+            if since_b is not None:
+                start = max(start, self._offset_before(f, since_b))
+            if tail is not None:
+                start = max(start, self._tail_offset(f, tail))
+            f.seek(start)
+            if start > 0:
+                f.seek(start - 1)
+                if f.read(1) != b"\n":
+                    f.readline()  # skip partial line
+            deadline = time.monotonic() + follow if follow else None
+
+            out = []
+            out_size = 0
+            keep = False  # the current record passes the filters
+            position = f.tell()
+            while True:
+                limit = -1 if end is None else end - position
+                line = f.readline(limit) if limit != 0 else b""
+                complete = line.endswith(b"\n")
+                if not complete and end is None and deadline is not None and time.monotonic() < deadline:
+                    # follow mode: wait for new (complete) lines at the end of the file
+                    if out:
+                        yield b"".join(out)
+                        out, out_size = [], 0
+                    f.seek(position)
+                    if poll:
+                        time.sleep(self.FOLLOW_POLL)
+                    else:
+                        yield self.IDLE
+                    continue
+                if not line:
+                    break
+                position += len(line)
+                m = RECORD_RE.match(line)
+                if m is not None:
+                    timestamp = m.group(1)
+                    if until_b is not None and timestamp > until_b:
+                        break
+                    keep = (since_b is None or timestamp >= since_b) and \
+                           (level is None or self._level(m.group(2)) >= level)
+                if keep:
+                    out.append(line)
+                    out_size += len(line)
+                    if out_size >= self.CHUNK:
+                        yield b"".join(out)
+                        out, out_size = [], 0
+                if not complete:
+                    break
+            if out:
+                yield b"".join(out)
+
+    @staticmethod
+    def _level(name):
+        level = logging.getLevelName(name.decode())
+        return level if isinstance(level, int) else logging.NOTSET
+
+    def _tail_offset(self, f, lines):
+        """
+        Offset of the N-th last line, the file is read backwards by blocks.
+        """
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        if position == 0 or lines <= 0:
+            return position
+        f.seek(position - 1)
+        count = -1 if f.read(1) == b"\n" else 0  # the final line break doesn't start a line
+        while position > 0:
+            size = min(self.CHUNK, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            i = len(block)
+            while True:
+                i = block.rfind(b"\n", 0, i)
+                if i < 0:
+                    break
+                count += 1
+                if count == lines:
+                    return position + i + 1
+        return 0
+
+    def _offset_before(self, f, timestamp):
+        """
+        Offset of the last checkpoint older than the timestamp (0 if none).
+        """
+        self._update_index(f)
+        with self._lock:
+            i = bisect.bisect_left(self._index, (timestamp, -1))
+            return self._index[i - 1][1] if i > 0 else 0
+
+    def _update_index(self, f):
+        st = os.fstat(f.fileno())
+        with self._lock:
+            if self._inode != st.st_ino or st.st_size < self._indexed * self.CHECKPOINT:
+                self._index, self._indexed, self._inode = [], 0, st.st_ino  # new (rotated) or truncated file
+            while (self._indexed + 1) * self.CHECKPOINT < st.st_size:
+                self._indexed += 1
+                f.seek(self._indexed * self.CHECKPOINT)
+                f.readline()  # partial line
+                for _ in range(1000):
+                    line = f.readline()
+                    if not line:
+                        break
+                    m = RECORD_RE.match(line)
+                    if m is not None:
+                        checkpoint = (m.group(1), f.tell() - len(line))
+                        if not self._index or checkpoint > self._index[-1]:
+                            self._index.append(checkpoint)
+                        break
@@ -0,0 +1,155 @@
+import bisect
+import math
+import os
+import threading
+
+# seconds, analyses can take minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., 120., 300.)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(n + '="' + v + '"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # label values : value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise Exception("Wrong labels of metric '" + self.name + "': " + str(sorted(labels)))
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self):
+        lines = ["# HELP " + self.name + " " + self.documentation, "# TYPE " + self.name + " " + self.type]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [self.name + _format_labels(self.labels, k) + " " + _format_value(v) for k, v in items]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.]  # per-bucket counts, sum
+            counts[0][i] += 1
+            counts[1] += value
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(self.name + "_bucket" + _format_labels(self.labels, key, ("le", _format_value(bound))) +
+                             " " + str(cumulative))
+            lines.append(self.name + "_sum" + _format_labels(self.labels, key) + " " + repr(round(total, 6)))
+            lines.append(self.name + "_count" + _format_labels(self.labels, key) + " " + str(cumulative))
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Gauge (or externally counted counter) read at scrape time: func() returns a value, a dictionary
+    {label values tuple : value} or None (not available).
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, func, labels=(), type="gauge"):
+        super().__init__(name, documentation, labels)
+        self.func = func
+        self.type = type
+
+    def render(self):
+        value = self.func()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        lines = ["# HELP " + self.name + " " + self.documentation, "# TYPE " + self.name + " " + self.type]
+        lines.extend(self._render_samples(sorted(value.items())))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics in Prometheus text exposition format. Thread safe: updates only take a per-metric lock.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, func, labels=(), type="gauge"):
+        return self._add(Gauge(name, documentation, func, labels, type))
+
+    def render(self):
+        """
+        :return: metrics in text exposition format
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+def process_rss(pid="self"):
+    """
+    Resident set size of the process (bytes), None if not available (no /proc).
+    """
+    try:
+        with open("/proc/" + str(pid) + "/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
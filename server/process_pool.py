@@ -0,0 +1,269 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+
+from analytics import cancellation, tracing
+from . import log_queue
+
+
+def _send(conn, obj):
+    """
+    Sends object through the pipe. Large contiguous buffers (numpy arrays behind DataFrames) are sent out-of-band
+    (pickle protocol 5), without being copied into the pickle stream.
+    """
+    buffers = []
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    raws = [b.raw() for b in buffers]
+    conn.send((payload, [r.nbytes for r in raws]))
+    for r in raws:
+        conn.send_bytes(r)
+
+
+def _recv(conn):
+    """
+    Receives object sent with _send(). Out-of-band buffers are received into writable memory.
+    """
+    payload, sizes = conn.recv()
+    buffers = []
+    for size in sizes:
+        buf = bytearray(size)
+        if size:
+            conn.recv_bytes_into(buf)
+        else:
+            conn.recv_bytes()
+        buffers.append(buf)
+    return pickle.loads(payload, buffers=buffers)
+
+
+def _worker_main(conn, script_folders, log_config):
+    """
+    Worker process' main loop: imports analysis scripts once, then runs analyses one by one.
+    Scripts are reloaded (incrementally) if the requested script version differs from the imported one.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent process handles interruption
+    if log_config is not None:
+        log_queue.configure(**log_config)
+    import analytics
+    am = analytics.AnalyticsModule(script_folders)
+    am.registry.load_all()  # warm worker: no imports on the first tasks
+
+    while True:
+        try:
+            request = _recv(conn)
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        analysis_name, analysis_arguments, data, script_hash, traced, timeout = request
+        root = tracing.new_trace("analysis_process", pid=os.getpid()) if traced else None
+        token = cancellation.CancellationToken(timeout) if timeout is not None else None
+        with tracing.activate(root), cancellation.activate(token):
+            try:
+                if script_hash is not None and am.ANALYSIS_HASH.get(analysis_name) != script_hash:
+                    am.update_analysis_functions()
+                status, result = "DONE", am.run_analysis(analysis_name, analysis_arguments, data)
+            except cancellation.DeadlineExceeded as err:
+                status, result = "TIMEOUT", str(err)
+            except Exception as err:
+                status, result = "ERROR", str(err)
+        spans = []
+        if root is not None:
+            root.finish()
+            spans.append(root.to_dict(0.))
+        try:
+            _send(conn, (status, result, spans))
+        except Exception as err:
+            _send(conn, ("ERROR", "Impossible to send analysis result: " + str(err), spans))
+    log_queue.shutdown()  # worker processes exit without atexit handlers
+
+
+class _Worker:
+
+    def __init__(self, ctx, number, script_folders, log_config):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, script_folders, log_config),
+                                   name="AnalysisProcess-" + str(number), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self):
+        try:
+            _send(self.conn, None)
+        except Exception:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class AnalysisProcessPool:
+    """
+    Pool of warm worker processes for CPU-bound analyses (not limited by the GIL).
+
+    Every worker imports analysis scripts once at start and runs one analysis at a time.
+    A crashed worker fails only its own request and is replaced by a new one.
+
+    The request's deadline is passed to the worker (cooperative cancellation, see analytics.cancellation), a worker
+    which does not respond DEADLINE_GRACE seconds after the deadline is killed.
+    """
+    logger = logging.getLogger('analysis_process_pool')
+
+    DEADLINE_GRACE = 1.  # seconds
+
+    def __init__(self, script_folders, processes=2, log_config=None):
+        """
+        Constructor.
+        :param script_folders: additional analytics script folders (see AnalyticsModule)
+        :param processes: number of worker processes
+        :param log_config: log_queue.configure() arguments for worker processes
+        """
+        self.script_folders = script_folders
+        self.processes = max(1, processes)
+        self.log_config = log_config
+
+        self._ctx = multiprocessing.get_context("spawn")  # no fork() of a multithreaded server
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._spawned = 0
+        self._started = False
+
+        # statistics
+        self._tasks = 0
+        self._failed = 0
+        self._crashed = 0
+        self._killed = 0
+        self._run_time = 0.
+
+    def start(self):
+        """
+        Start worker processes (idempotent).
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.processes):
+                self._idle.put(self._spawn())
+        self.logger.info("Analysis process pool started: " + str(self.processes) + " processes")
+
+    def shutdown(self):
+        """
+        Stop worker processes.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._started = False
+            while not self._idle.empty():  # stopped workers are not reused, start() spawns new ones
+                self._idle.get_nowait()
+        for worker in workers:
+            worker.stop()
+
+    def run(self, analysis_name, analysis_arguments, data, script_hash=None):
+        """
+        Runs analysis in a worker process (waits for a free one until the request's deadline).
+        :param analysis_name: analysis function name
+        :param analysis_arguments: dictonary of analysis function arguments
+        :param data: dataframe with data (time series)
+        :param script_hash: expected analysis script's hash (worker reloads scripts if differs), None - not checked
+        :return: dataframe
+        """
+        self.start()
+        try:
+            worker = self._idle.get(timeout=cancellation.remaining())
+        except queue.Empty:
+            cancellation.check()
+            raise cancellation.DeadlineExceeded("Request deadline exceeded while waiting for an analysis process")
+        start = time.monotonic()
+        try:
+            traced = tracing.current_span() is not None
+            timeout = cancellation.remaining()
+            _send(worker.conn, (analysis_name, analysis_arguments, data, script_hash, traced, timeout))
+            if timeout is not None and not worker.conn.poll(timeout + self.DEADLINE_GRACE):
+                self._replace(worker, killed=True)
+                self.logger.warning("Analysis worker process killed: deadline exceeded")
+                raise cancellation.DeadlineExceeded("Request deadline exceeded, analysis process killed")
+            status, result, spans = _recv(worker.conn)
+            tracing.attach(spans)
+        except (EOFError, OSError) as err:
+            exitcode = self._replace(worker)
+            self.logger.error("Analysis worker process crashed (exit code " + str(exitcode) + "): " + str(err))
+            raise Exception("Analysis worker process crashed (exit code " + str(exitcode) + ")")
+        except cancellation.DeadlineExceeded:
+            raise
+        except BaseException:
+            # the pipe is in an unknown state (e.g. half-sent request)
+            self._replace(worker)
+            raise
+        else:
+            self._idle.put(worker)
+        finally:
+            with self._lock:
+                self._tasks += 1
+                self._run_time += time.monotonic() - start
+            worker.tasks += 1
+
+        if status == "TIMEOUT":
+            raise cancellation.DeadlineExceeded(result)
+        if status != "DONE":
+            with self._lock:
+                self._failed += 1
+            raise Exception(result)
+        return result
+
+    def stats(self):
+        """
+        Pool statistics.
+        :return: dictionary with workers and tasks statistics
+        """
+        with self._lock:
+            return {"processes": self.processes,
+                    "started": self._started,
+                    "idle": self._idle.qsize(),
+                    "spawned": self._spawned,
+                    "tasks": self._tasks,
+                    "failed": self._failed,
+                    "crashed": self._crashed,
+                    "killed": self._killed,
+                    "run_time_avg": round(self._run_time / self._tasks, 6) if self._tasks else 0.,
+                    "pids": [w.process.pid for w in self._workers]}
+
+    def _spawn(self):
+        """
+        Start a new worker process (called under the lock).
+        """
+        worker = _Worker(self._ctx, self._spawned, self.script_folders, self.log_config)
+        self._spawned += 1
+        self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker, killed=False):
+        """
+        Kill broken worker and start a new one instead.
+        :param killed: the worker is killed because of a deadline (not crashed)
+        :return: exit code of the broken worker
+        """
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        try:
+            worker.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            if killed:
+                self._killed += 1
+            else:
+                self._crashed += 1
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if self._started:
+                self._idle.put(self._spawn())
+        return worker.process.exitcode
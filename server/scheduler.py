@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class _ScheduledTask:
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = None  # monotonic time
+        self.last_run = None  # wall time
+        self.last_duration = None
+        self.runs = 0
+        self.errors = 0
+        self.last_error = None
+        self.cancelled = False
+
+
+class Scheduler:
+    """
+    Periodic tasks scheduler: single thread, tasks are kept in a heap ordered by their next run time,
+    the thread sleeps until the nearest one (or until tasks are changed).
+    Tasks run one after another in the scheduler's thread, so they should be short.
+    """
+    logger = logging.getLogger('scheduler')
+
+    def __init__(self):
+        self._heap = []  # (next run, sequence number, task)
+        self._tasks = {}  # name : task
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def add_task(self, name, interval, func, delay=None):
+        """
+        Registers periodic task (replaces the task with the same name).
+        :param name: task name
+        :param interval: interval between runs (seconds)
+        :param func: callable without arguments
+        :param delay: delay of the first run (seconds), default - interval
+        """
+        if interval <= 0:
+            raise Exception("Task interval must be positive: " + name)
+        task = _ScheduledTask(name, interval, func)
+        with self._cond:
+            old = self._tasks.get(name)
+            if old is not None:
+                old.cancelled = True
+            self._tasks[name] = task
+            self._push(task, time.monotonic() + (interval if delay is None else delay))
+            self._cond.notify()
+        self.logger.debug("Task scheduled: " + name + ", interval " + str(interval) + " s")
+
+    def remove_task(self, name):
+        """
+        :param name: task name
+        """
+        with self._cond:
+            task = self._tasks.pop(name, None)
+            if task is not None:
+                task.cancelled = True  # removed from the heap lazily
+                self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name="Scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def tasks(self):
+        """
+        Registered tasks.
+        :return: list of dictionaries, ordered by the next run time
+        """
+        now_monotonic = time.monotonic()
+        now = time.time()
+        with self._cond:
+            tasks = sorted(self._tasks.values(), key=lambda t: t.next_run)
+            return [{"name": t.name,
+                     "interval": t.interval,
+                     "next_run": now + t.next_run - now_monotonic,
+                     "last_run": t.last_run,
+                     "last_duration": t.last_duration,
+                     "runs": t.runs,
+                     "errors": t.errors,
+                     "last_error": t.last_error} for t in tasks]
+
+    def _push(self, task, next_run):
+        """
+        Called under the lock.
+        """
+        task.next_run = next_run
+        heapq.heappush(self._heap, (next_run, next(self._seq), task))
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                _, _, task = heapq.heappop(self._heap)
+
+            start = time.monotonic()
+            task.last_run = time.time()
+            try:
+                task.func()
+            except Exception as err:
+                task.errors += 1
+                task.last_error = str(err)
+                self.logger.error("Scheduled task '" + task.name + "' failed: " + str(err))
+            task.last_duration = round(time.monotonic() - start, 6)
+            task.runs += 1
+
+            with self._cond:
+                if not task.cancelled:
+                    # fixed rate, but never catching up with missed runs
+                    self._push(task, max(start + task.interval, time.monotonic()))
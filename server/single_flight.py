@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+import threading
+
+
+class SingleFlight:
+    """
+    Coalescing of identical in-flight requests: a request identical to a running (or queued) one is attached to it
+    and shares its result (including the write outcome) instead of being executed again.
+
+    The attached request is bound by the deadline of the executed one, so it is attached only if its own deadline is
+    not later. Otherwise it is executed and the following identical requests are attached to it.
+    """
+    logger = logging.getLogger('single_flight')
+
+    def __init__(self):
+        self._inflight = {}  # key : (task, future, deadline)
+        self._lock = threading.Lock()
+
+        # statistics
+        self._leaders = 0
+        self._coalesced = 0
+
+    @staticmethod
+    def key(json_request, priority=None):
+        """
+        :param json_request: analysis request
+        :param priority: request's priority class (requests of different classes are queued separately)
+        :return: request's key (hash of its canonical JSON representation)
+        """
+        content = json.dumps([json_request, priority], sort_keys=True, default=str)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def submit(self, key, task, submit, deadline=None):
+        """
+        Submits the task unless identical one is in flight.
+        :param key: request's key, None - do not coalesce
+        :param task: task object
+        :param submit: callable () -> future, submits the task for execution
+        :param deadline: request's deadline (time.monotonic()), None - no deadline
+        :return: task which is actually executed (this one or identical in-flight one), its future
+        """
+        if key is None:
+            return task, submit()
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None and (flight[2] is None or (deadline is not None and deadline <= flight[2])):
+                self._coalesced += 1
+                self.logger.debug("Request coalesced with in-flight one: " + key)
+                return flight[:2]
+            future = submit()
+            self._inflight[key] = (task, future, deadline)
+            self._leaders += 1
+        future.add_done_callback(lambda f: self._done(key, f))
+        return task, future
+
+    def stats(self):
+        """
+        :return: dictionary with coalescing statistics
+        """
+        with self._lock:
+            return {"in_flight": len(self._inflight),
+                    "executed": self._leaders,
+                    "coalesced": self._coalesced}
+
+    def _done(self, key, future):
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None and flight[1] is future:
+                del self._inflight[key]
@@ -0,0 +1,71 @@
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+import analytics
+import analytics_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Client:
+    """
+    HTTP client of a test server.
+    """
+
+    def __init__(self, port):
+        self.port = port
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        :return: status, headers, body (bytes)
+        """
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        try:
+            if isinstance(body, dict):
+                body = json.dumps(body).encode()
+            conn.request(method, path, body, headers or {})
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def make_server(tmp_path, monkeypatch):
+    """
+    Factory of analytics servers listening on a free local port: make_server(*args, frontend="threaded"),
+    args are command line arguments (see analytics_server.parse_args()). Returns the server and its client.
+    """
+    monkeypatch.chdir(ROOT)  # analysis scripts are discovered relatively to the working directory
+    monkeypatch.setattr(analytics_server, "logger", logging.getLogger("analytics_server"), raising=False)
+    servers = []
+
+    def make(*args, frontend="threaded"):
+        settings = analytics_server.parse_args(["-sh", "127.0.0.1", "-sp", "0", "-ld", str(tmp_path), "-sfe",
+                                                frontend, "-dbhci", "0", "-saui", "0", *args])
+        am = analytics.AnalyticsModule(settings.srv_script_folders, settings.srv_cache_size * 2 ** 20,
+                                       settings.srv_cache_ttl)
+        if frontend == "asyncio":
+            srv = analytics_server.AsyncAnalyticsServer(analytics_server.AsyncAnalyticsRequestHandler, settings, am)
+        else:
+            srv = analytics_server.AnalyticsServerThreaded(analytics_server.AnalyticsRequestHandler, settings, am)
+        srv.executor.start()
+        thread = threading.Thread(target=srv.serve_forever, daemon=True)
+        thread.start()
+        if frontend == "asyncio":
+            while srv._stop is None:  # the event loop is running
+                time.sleep(0.01)
+        servers.append((srv, thread))
+        return srv, Client(srv.server_address[1])
+
+    yield make
+    for srv, thread in servers:
+        srv.shutdown()
+        thread.join(5.)
+        srv.server_close()
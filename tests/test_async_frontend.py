@@ -0,0 +1,72 @@
+import gzip
+import json
+import socket
+import threading
+import time
+
+from test_logs import record
+from test_metrics import inline_request
+
+
+def start_logging(srv):
+    with open(srv.log_file.path, "w") as f:
+        f.write(record(0))
+    srv.log_file.FOLLOW_POLL = 0.02
+
+
+def follow(client, seconds, results, headers=None):
+    results.append(client.request("GET", "/logs?tail=1&follow=" + str(seconds), headers=headers))
+
+
+def test_get_and_post(make_server):
+    _, client = make_server(frontend="asyncio")
+    status, _, body = client.request("GET", "/status")
+    assert status == 200 and "active_threads" in json.loads(body)
+    status, _, body = client.request("POST", "/", inline_request(2), {"Content-Type": "application/x-npz"})
+    assert status == 200
+    assert json.loads(body)["data"][0]["val0"] == 3.
+
+
+def test_keep_alive_and_bad_requests(make_server):
+    srv, _ = make_server(frontend="asyncio")
+    with socket.create_connection(srv.server_address[:2], timeout=10) as s:
+        f = s.makefile("rb")
+        for _ in range(2):  # one connection, two requests
+            s.sendall(b"GET /status HTTP/1.1\r\nHost: test\r\n\r\n")
+            assert f.readline().startswith(b"HTTP/1.1 200")
+            length = 0
+            for line in iter(f.readline, b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            f.read(length)
+        s.sendall(b"DELETE /status HTTP/1.1\r\nHost: test\r\n\r\n")
+        assert f.readline().startswith(b"HTTP/1.1 501")
+    with socket.create_connection(srv.server_address[:2], timeout=10) as s:
+        s.sendall(b"GARBAGE\r\n\r\n")
+        assert s.makefile("rb").readline().split()[1] == b"400"
+
+
+def test_followed_logs_do_not_hold_io_threads(make_server):
+    srv, client = make_server("-sio", "1", frontend="asyncio")
+    start_logging(srv)
+    results = []
+    followers = [threading.Thread(target=follow, args=(client, 1.5, results)) for _ in range(3)]
+    followers.append(threading.Thread(target=follow, args=(client, 1.5, results, {"Accept-Encoding": "gzip"})))
+    for t in followers:
+        t.start()
+    time.sleep(0.3)
+
+    # the only I/O thread is free while the logs are followed
+    start = time.monotonic()
+    status, _, _ = client.request("GET", "/status")
+    assert status == 200 and time.monotonic() - start < 1.
+    with open(srv.log_file.path, "a") as f:
+        f.write(record(1))
+
+    for t in followers:
+        t.join(10.)
+    assert len(results) == 4
+    for status, headers, body in results:
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        assert status == 200 and body == (record(0) + record(1)).encode()
@@ -0,0 +1,120 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from server import codec
+from test_influx_server_io import STORE, FakeInfluxClient, FakeInfluxPool, utc
+
+
+def batch_request(entries, **db_io):
+    request = {"db_io_parameters": {"return": "json", **db_io}, "analysis_parameters": entries}
+    out = io.BytesIO()
+    np.savez(out, request=np.array(json.dumps(request)), time=np.arange(10, dtype=np.int64) * 3600 * 10 ** 9,
+             values=np.ones(10))
+    return out.getvalue()
+
+
+def entry(value, **kwargs):
+    return {"analysis": "test", "analysis_arguments": {"operation": ["add"], "value": [str(value)]}, **kwargs}
+
+
+def post(client, body):
+    status, _, body = client.request("POST", "/", body, {"Content-Type": codec.FORMATS["npz"]})
+    return status, json.loads(body)
+
+
+def test_malformed_entries_fail_alone(make_server):
+    for args in [(), ("-scs", "0")]:  # with and without the results cache
+        _, client = make_server(*args)
+        status, msg = post(client, batch_request([entry(1), {"analysis": "test"}, "test"]))
+        assert status == 200, msg
+        assert msg["result"] == "PARTIAL"
+        assert [r["result"] for r in msg["results"]] == ["DONE", "ERROR", "ERROR"]
+        assert msg["data"][0][0]["val0"] == 2.
+
+
+class RecordingInfluxClient(FakeInfluxClient):
+    """
+    FakeInfluxClient recording the written points.
+    """
+
+    def __init__(self, store, writes):
+        super().__init__(store)
+        self.writes = writes
+
+    def write_points(self, df, measurement, tags):
+        self.writes.append((measurement, tags["result_id"], df))
+        return True
+
+
+class RecordingInfluxPool(FakeInfluxPool):
+    def __init__(self, store, **kwargs):
+        super().__init__(store, **kwargs)
+        self.writes = []
+
+    def _connect(self):
+        conn = super()._connect()
+        conn.client = RecordingInfluxClient(self.store, self.writes)
+        return conn
+
+
+@pytest.fixture
+def batch_server(make_server):
+    srv, client = make_server("-dbpr", "1")  # one connection reads all series
+    srv.db_pool = RecordingInfluxPool(STORE)
+    return srv, client
+
+
+def db_request(entries):
+    return {"db_io_parameters": {"mode": "rw", "device_id": ["d1", "d2"], "data_source_id": ["1", "1"],
+                                 "time_upload": ["2020-01-02_00:00:00+0000", "2020-01-03_00:00:00+0000",
+                                                 "2020-01-02_00:00:00+0000", "2020-01-03_00:00:00+0000"],
+                                 "limit": None},
+            "analysis_parameters": entries}
+
+
+def post_json(client, request):
+    status, _, body = client.request("POST", "/", request, {"Content-Type": "application/json"})
+    return status, json.loads(body)
+
+
+def test_batch_entries_share_one_read(batch_server):
+    srv, client = batch_server
+    status, msg = post_json(client, db_request([entry(1, result_id=["r1", "r2"]), entry(2, result_id=["r3", "r4"]),
+                                                entry(3, result_id=["r5", "r6"])]))
+    assert status == 200, msg
+    assert msg["result"] == "DONE" and [r["result"] for r in msg["results"]] == ["DONE"] * 3
+    assert sum(len(conn.client.queries) for conn in srv.db_pool.opened) == 1  # one grouped query
+
+    # every entry's result is written with its own result ids
+    written = {ri: df for _, ri, df in srv.db_pool.writes}
+    assert sorted(written) == ["r1", "r2", "r3", "r4", "r5", "r6"]
+    assert all(measurement == "data_result" for measurement, _, _ in srv.db_pool.writes)
+    for ri, value, series in [("r1", 1, ("d1", "1")), ("r4", 2, ("d2", "1")), ("r5", 3, ("d1", "1"))]:
+        source = STORE[series][utc(2):utc(3)]  # the rest of hourly d1's rows are d2's half hours (filled with 0)
+        np.testing.assert_allclose(written[ri]["value"].loc[source.index], source + value)
+
+
+def test_failing_entry_does_not_fail_the_others(batch_server):
+    srv, client = batch_server
+    bad = {"analysis": "test", "analysis_arguments": {"operation": ["pow"], "value": ["1"]}, "result_id": ["x", "y"]}
+    status, msg = post_json(client, db_request([entry(1, result_id=["r1", "r2"]), bad, entry(2)]))
+    assert status == 200, msg
+    assert msg["result"] == "PARTIAL"
+    assert [r["result"] for r in msg["results"]] == ["DONE", "ERROR", "ERROR"]
+    assert "operation" in msg["results"][1]["error_message"]
+    assert "result_id" in msg["results"][2]["error_message"]  # analyzed, but not written
+    assert sorted(ri for _, ri, _ in srv.db_pool.writes) == ["r1", "r2"]
+
+
+@pytest.mark.parametrize("values, result", [(["1", "2"], "DONE"), (["1", "x"], "PARTIAL"), (["x", "y"], "ERROR")])
+def test_batch_result(make_server, values, result):
+    _, client = make_server()
+    entries = [{"analysis": "test", "analysis_arguments": {"operation": ["add"], "value": [value]}} for value in values]
+    status, msg = post(client, batch_request(entries))
+    assert status == 200, msg
+    assert msg["result"] == result
+    assert [r["result"] == "DONE" for r in msg["results"]] == [value.isdigit() for value in values]
+    assert [len(records) > 0 for records in msg["data"]] == [value.isdigit() for value in values]
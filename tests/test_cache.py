@@ -0,0 +1,95 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from analytics.cache import ResultCache
+
+from conftest import ROOT
+
+
+def frame(n=100, value=1.):
+    index = pd.date_range("2020-01-01", periods=n, freq="h", tz="UTC")
+    return pd.DataFrame({"val0": np.full(n, value)}, index=index)
+
+
+def test_results_are_returned_as_copies():
+    cache = ResultCache(10 ** 6)
+    result = frame()
+    cache.put("k", result)
+    result.iloc[0, 0] = -1.  # modified by the caller after caching
+    cached = cache.get("k")
+    assert cached.iloc[0, 0] == 1.
+    cached.iloc[0, 0] = -2.  # modified by a consumer
+    assert cache.get("k").iloc[0, 0] == 1.
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["entries"] == 1 and stats["bytes"] == ResultCache.frame_size(result)
+
+
+def test_least_recently_used_results_are_evicted():
+    size = ResultCache.frame_size(frame())
+    cache = ResultCache(3 * size)
+    for key in "abc":
+        cache.put(key, frame())
+    cache.get("a")  # 'b' is the least recently used now
+    cache.put("d", frame())
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats()["evicted"] == 1 and cache.stats()["bytes"] == 3 * size
+
+
+def test_too_large_results_are_not_cached():
+    cache = ResultCache(ResultCache.frame_size(frame(10)))
+    cache.put("large", frame(1000))
+    assert cache.get("large") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_results_expire_after_ttl():
+    cache = ResultCache(10 ** 6, ttl=0.05)
+    cache.put("k", frame())
+    assert cache.get("k") is not None
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["bytes"] == 0
+
+
+def test_key_composition():
+    key = ResultCache.key("test", {"value": ["1"], "operation": ["add"]}, {"data": None}, "hash")
+    assert key == ResultCache.key("test", {"operation": ["add"], "value": ["1"]}, {"data": None}, "hash")
+    assert key != ResultCache.key("test2", {"operation": ["add"], "value": ["1"]}, {"data": None}, "hash")
+    assert key != ResultCache.key("test", {"operation": ["add"], "value": ["2"]}, {"data": None}, "hash")
+    assert key != ResultCache.key("test", {"operation": ["add"], "value": ["1"]}, {"fingerprint": "f"}, "hash")
+    assert key != ResultCache.key("test", {"operation": ["add"], "value": ["1"]}, {"data": None}, "hash2")
+
+
+def test_fingerprint_depends_on_the_content():
+    df = frame()
+    assert ResultCache.fingerprint(df) == ResultCache.fingerprint(frame())
+    assert ResultCache.fingerprint(df) != ResultCache.fingerprint(frame(value=2.))
+    assert ResultCache.fingerprint(df) != ResultCache.fingerprint(df.rename(columns={"val0": "val1"}))
+    assert ResultCache.fingerprint(df) != ResultCache.fingerprint(df.set_axis(df.index.shift(1)))
+    assert ResultCache.fingerprint(df) != ResultCache.fingerprint(df.astype(np.float32))
+
+
+def test_analytics_module_caches_results(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    am = analytics.AnalyticsModule([], cache_size=10 ** 6)
+    arguments = {"operation": ["add"], "value": ["1"]}
+    source = {"fingerprint": ResultCache.fingerprint(frame())}
+    key = am.cache_key("test", arguments, source)
+    assert key == ResultCache.key("test", arguments, source, am.ANALYSIS_HASH["test"])
+    assert am.cached_result(key) is None
+    result = am.run_analysis("test", arguments, frame(), key)
+    pd.testing.assert_frame_equal(am.cached_result(key), result)
+    assert am.cache_key("unknown", arguments, source) is None
+    assert analytics.AnalyticsModule([]).cache_key("test", arguments, source) is None  # disabled
+
+
+def test_non_cacheable_analyses_have_no_key(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    am = analytics.AnalyticsModule([], cache_size=10 ** 6)
+    monkeypatch.setitem(am.ANALYSIS_ARGS["test"], "cacheable", False)
+    assert am.cache_key("test", {}, {"data": None}) is None
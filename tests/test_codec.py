@@ -0,0 +1,98 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from server import codec
+
+
+def frame(n=5):
+    index = pd.date_range("2020-01-01", periods=n, freq="h", tz="UTC")
+    return pd.DataFrame({"val0": np.arange(n, dtype=np.float64), "val1": np.full(n, 0.5)}, index=index)
+
+
+def npz(compressed=False, **arrays):
+    out = io.BytesIO()
+    (np.savez_compressed if compressed else np.savez)(out, **arrays)
+    return out.getvalue()
+
+
+def test_check_format():
+    assert codec.check_format(None) is None and codec.check_format("npz") == "npz"
+    with pytest.raises(Exception, match="Unknown result format"):
+        codec.check_format("xml")
+
+
+def test_records_and_ndjson():
+    df = frame()
+    records = codec.frame_to_records(df)
+    assert records[1] == {"time": "2020-01-01T01:00:00.000Z", "val0": 1.0, "val1": 0.5}
+    assert codec.frame_to_records(None) == []
+    codec.NDJSON_ROWS, rows = 2, codec.NDJSON_ROWS
+    try:
+        chunks = list(codec.frame_to_ndjson(df, entry=3))
+    finally:
+        codec.NDJSON_ROWS = rows
+    assert len(chunks) == 3
+    lines = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert lines == [dict(r, entry=3) for r in records]
+
+
+def test_results_npz_round_trip():
+    frames = [frame(), None, frame(3) * 2]
+    arrays = codec.read_npz(codec.frames_to_npz(frames, {"result": "DONE"}))
+    assert json.loads(str(arrays["meta"])) == {"result": "DONE"}
+    assert "1.time" not in arrays
+    for i in (0, 2):
+        df = pd.DataFrame(arrays[str(i) + ".values"], columns=list(arrays[str(i) + ".columns"]),
+                          index=pd.DatetimeIndex(arrays[str(i) + ".time"].view("datetime64[ns]"), tz="UTC"))
+        pd.testing.assert_frame_equal(df, frames[i], check_freq=False)
+
+
+def test_results_are_accepted_as_inline_input():
+    request = {"analysis_parameters": {"analysis": "test"}}
+    content = codec.frames_to_npz([frame()], {"result": "DONE"})
+    arrays = codec.read_npz(content)
+    arrays["request"] = np.array(json.dumps(request))
+    json_request, df = codec.npz_to_request(npz(**arrays))
+    assert json_request == request
+    pd.testing.assert_frame_equal(df, frame(), check_freq=False)
+
+
+def test_inline_input_is_not_copied():
+    content = bytearray(npz(request=np.array("{}"), time=np.arange(4, dtype=np.int64), values=np.ones(4)))
+    _, df = codec.npz_to_request(content)
+    assert list(df.columns) == ["0"] and df.index.tz is not None
+    df.iloc[0, 0] = 7.  # writable view of the request's buffer
+    assert np.float64(7.).tobytes() in content
+
+
+def test_read_only_and_compressed_input():
+    arrays = {"request": np.array("{}"), "time": np.arange(3, dtype=np.int64), "values": np.ones((3, 2)),
+              "columns": np.array(["a", "b"])}
+    for content in (npz(**arrays), npz(compressed=True, **arrays)):
+        _, df = codec.npz_to_request(content)  # bytes: values are copied to be writable
+        df.iloc[0, 0] = 2.
+        assert list(df.columns) == ["a", "b"] and df.shape == (3, 2)
+
+
+@pytest.mark.parametrize("arrays, message", [
+    ({"time": np.arange(3), "values": np.ones(3)}, "no 'request'"),
+    ({"request": np.array("not json"), "time": np.arange(3), "values": np.ones(3)}, "not a JSON"),
+    ({"request": np.array("{}"), "values": np.ones(3)}, "must have 'time' and 'values'"),
+    ({"request": np.array("{}"), "time": np.arange(3), "values": np.ones(4)}, "shapes do not match"),
+    ({"request": np.array("{}"), "time": np.arange(3), "values": np.ones(3), "columns": np.array(["a", "b"])},
+     "names"),
+])
+def test_wrong_inline_input(arrays, message):
+    with pytest.raises(Exception, match=message):
+        codec.npz_to_request(npz(**arrays))
+
+
+def test_pickles_and_broken_archives_are_rejected():
+    with pytest.raises(Exception, match="object arrays are not allowed"):
+        codec.read_npz(npz(request=np.array([{"a": 1}], dtype=object)))
+    with pytest.raises(Exception, match="Impossible to read npz"):
+        codec.read_npz(b"not a zip archive")
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+from server import AnalysisExecutor, QueueFullError
+
+
+def wait_for(condition, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition is not met in " + str(timeout) + " s")
+        time.sleep(0.005)
+
+
+def blocked(executor, **kwargs):
+    """
+    Occupies a worker until the returned event is set.
+    """
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(10.)
+
+    future = executor.submit(block, **kwargs)
+    started.wait(5.)
+    return release, future
+
+
+def test_tasks_run_and_report_results():
+    executor = AnalysisExecutor(workers=2, queue_size=4)
+    executor.start()
+    try:
+        assert executor.submit(lambda x: x * 2, 21).result(5.) == 42
+        with pytest.raises(ValueError):
+            executor.submit(int, "x").result(5.)
+        stats = executor.stats()
+        assert stats["completed"] == 1 and stats["failed"] == 1
+    finally:
+        executor.shutdown()
+
+
+def test_full_queue_rejects_tasks():
+    executor = AnalysisExecutor(workers=1, queue_size=1)
+    executor.start()
+    try:
+        release, running = blocked(executor)
+        queued = executor.submit(lambda: "queued")
+        with pytest.raises(QueueFullError):
+            executor.submit(lambda: "rejected")
+        assert executor.stats()["rejected"] == 1
+        release.set()
+        assert queued.result(5.) == "queued"
+    finally:
+        executor.shutdown()
+
+
+def test_free_workers_are_counted_as_queue_slots():
+    executor = AnalysisExecutor(workers=2, queue_size=0)  # not started: nothing runs
+    executor.submit(lambda: None)
+    executor.submit(lambda: None)
+    with pytest.raises(QueueFullError):
+        executor.submit(lambda: None)
+    executor.shutdown()
+
+
+def test_weighted_fair_queueing_order():
+    executor = AnalysisExecutor(workers=1, queue_size=100, classes={"interactive": 4., "batch": 1.})
+    executor.start()
+    order = []
+    try:
+        release, _ = blocked(executor, priority="batch")
+        futures = [executor.submit(order.append, "B", priority="batch") for _ in range(3)]
+        futures += [executor.submit(order.append, "I", priority="interactive") for _ in range(8)]
+        release.set()
+        for f in futures:
+            f.result(5.)
+    finally:
+        executor.shutdown()
+    # virtual finish times: batch 2, 3, 4; interactive 1.25, 1.5, ..., 3 (ties go to the earlier task)
+    assert "".join(order) == "IIIBIIIIBIB"
+    classes = executor.stats()["classes"]
+    assert classes["interactive"]["started"] == 8 and classes["batch"]["started"] == 4
+
+
+def test_unknown_priority_class():
+    executor = AnalysisExecutor(classes={"interactive": 8., "batch": 1.})
+    with pytest.raises(Exception, match="Unknown priority class"):
+        executor.submit(lambda: None, priority="urgent")
+
+
+def test_concurrency_cap_skips_capped_tasks():
+    executor = AnalysisExecutor(workers=2, queue_size=10, limit={"slow": 1}.get)
+    executor.start()
+    try:
+        release, first = blocked(executor, key="slow")
+        second = executor.submit(lambda: "slow", key="slow")
+        other = executor.submit(lambda: "other", key="fast")
+        assert other.result(5.) == "other"  # not blocked by the capped task queued before it
+        assert not second.done()
+        assert executor.stats()["running"] == {"slow": 1}
+        release.set()
+        assert second.result(5.) == "slow"
+    finally:
+        executor.shutdown()
+
+
+def test_shutdown_cancels_queued_tasks():
+    executor = AnalysisExecutor(workers=1, queue_size=2)
+    executor.start()
+    release, running = blocked(executor)
+    queued = executor.submit(lambda: None)
+    executor.shutdown(wait=False)
+    assert queued.cancelled()
+    release.set()
+    running.result(5.)
+    with pytest.raises(Exception, match="shut down"):
+        executor.submit(lambda: None)
+
+
+def test_busy_server_answers_503(make_server):
+    srv, client = make_server("-sw", "1", "-sqs", "0", "-sra", "7")
+    release, _ = blocked(srv.executor)
+    wait_for(lambda: srv.executor.stats()["busy"] == 1)
+    try:
+        request = {"db_io_parameters": {"mode": "", "device_id": ["d"], "data_source_id": ["1"],
+                                        "time_upload": ["2020-01-01_00:00:00+0000", "2020-01-02_00:00:00+0000"]},
+                   "analysis_parameters": {"analysis": "test",
+                                           "analysis_arguments": {"operation": ["add"], "value": ["1"]}}}
+        status, headers, body = client.request("POST", "/", request, {"Content-Type": "application/json"})
+    finally:
+        release.set()
+    assert status == 503
+    assert headers["Retry-After"] == "7"
+    assert b'"BUSY"' in body
+    assert srv.executor.stats()["rejected"] == 1
@@ -0,0 +1,110 @@
+import gzip
+import http.client
+import json
+import socket
+
+import pytest
+
+from test_metrics import inline_request
+
+NPZ = {"Content-Type": "application/x-npz"}
+
+
+def request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body, headers or {})
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def test_requests_share_a_persistent_connection(make_server):
+    srv, _ = make_server()
+    conn = http.client.HTTPConnection(*srv.server_address[:2], timeout=30)
+    try:
+        response, _ = request(conn, "GET", "/status")
+        sock = conn.sock
+        assert response.status == 200 and sock is not None
+        response, body = request(conn, "POST", "/", b"not json", {"Content-Type": "application/json"})
+        assert response.status == 400 and json.loads(body)["result"] == "ERROR"
+        response, body = request(conn, "POST", "/", inline_request(1), NPZ)
+        assert response.status == 200 and json.loads(body)["data"][0]["val0"] == 2.
+        response, _ = request(conn, "GET", "/nothing")
+        assert response.status == 404
+        response, _ = request(conn, "GET", "/status")
+        assert response.status == 200
+        assert conn.sock is sock  # the same connection after the errors
+    finally:
+        conn.close()
+
+
+def test_keep_alive_can_be_disabled(make_server):
+    srv, client = make_server("-ska", "0")
+    status, headers, _ = client.request("GET", "/status")
+    assert status == 200 and headers["Connection"] == "close"
+
+
+def test_content_length(make_server):
+    _, client = make_server()
+    for method, path, body, headers in [("GET", "/status", None, None), ("GET", "/nothing", None, None),
+                                        ("POST", "/", inline_request(1), NPZ)]:
+        status, headers, body = client.request(method, path, body, headers)
+        assert int(headers["Content-Length"]) == len(body) > 0
+
+
+def test_gzip_request_body(make_server):
+    _, client = make_server()
+    status, _, body = client.request("POST", "/", gzip.compress(inline_request(2)), dict(NPZ, **{
+        "Content-Encoding": "gzip"}))
+    assert status == 200, body
+    assert json.loads(body)["data"][0]["val0"] == 3.
+    status, _, body = client.request("POST", "/", b"not gzip", dict(NPZ, **{"Content-Encoding": "gzip"}))
+    assert status == 400 and "decompress" in json.loads(body)["error_message"]
+
+
+@pytest.mark.parametrize("frontend", ["threaded", "asyncio"])
+def test_gzip_responses(make_server, frontend):
+    _, client = make_server("-sgz", "100", frontend=frontend)
+    status, headers, body = client.request("GET", "/status", headers={"Accept-Encoding": "gzip, deflate"})
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip" and headers["Vary"] == "Accept-Encoding"
+    assert int(headers["Content-Length"]) == len(body)
+    assert "active_threads" in json.loads(gzip.decompress(body))
+
+    for accept in [None, "identity", "gzip;q=0"]:
+        status, headers, body = client.request("GET", "/status", headers={"Accept-Encoding": accept} if accept else {})
+        assert status == 200 and "Content-Encoding" not in headers
+        assert "active_threads" in json.loads(body)
+
+
+def test_small_responses_are_not_compressed(make_server):
+    _, client = make_server("-sgz", str(10 ** 6))
+    status, headers, _ = client.request("GET", "/status", headers={"Accept-Encoding": "gzip"})
+    assert status == 200 and "Content-Encoding" not in headers
+
+
+@pytest.mark.parametrize("frontend", ["threaded", "asyncio"])
+def test_too_large_body_is_rejected(make_server, frontend):
+    srv, _ = make_server("-smb", "1", frontend=frontend)
+    with socket.create_connection(srv.server_address[:2], timeout=10) as s:
+        # the body is not sent: it is rejected by its length
+        s.sendall(b"POST / HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\nContent-Length: " +
+                  str(2 ** 21).encode() + b"\r\n\r\n")
+        response = http.client.HTTPResponse(s)
+        response.begin()
+        assert response.status == 413
+        assert "too large" in json.loads(response.read())["error_message"]
+        assert response.getheader("Connection") == "close"
+        assert s.recv(1) == b""  # closed by the server
+
+
+def test_too_large_decompressed_body_is_rejected(make_server):
+    srv, _ = make_server("-smb", "1")
+    conn = http.client.HTTPConnection(*srv.server_address[:2], timeout=30)
+    try:
+        body = gzip.compress(b" " * 2 ** 21)
+        response, content = request(conn, "POST", "/", body, {"Content-Type": "application/json",
+                                                               "Content-Encoding": "gzip"})
+        assert response.status == 413 and "decompressed" in json.loads(content)["error_message"]
+        response, _ = request(conn, "GET", "/status")  # the body was read, the connection persists
+        assert response.status == 200
+    finally:
+        conn.close()
@@ -0,0 +1,207 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+from influxdb.exceptions import InfluxDBClientError
+
+from analytics import cancellation
+from db import InfluxConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, n):
+        self.n = n
+        self.broken = False
+        self.pings = 0
+        self.closed = False
+
+    def ping(self):
+        self.pings += 1
+        if self.broken:
+            raise Exception("broken")
+
+    def disconnect(self):
+        self.closed = True
+
+
+class FakePool(InfluxConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.opened = []
+
+    def _connect(self):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+def test_connections_are_reused():
+    pool = FakePool(size=2)
+    with pool.connection() as a:
+        pass
+    with pool.connection() as b:
+        assert b is a
+    assert len(pool.opened) == 1
+    assert pool.stats()["acquired"] == 2
+
+
+def wrapped_connection_error():
+    try:
+        raise requests.exceptions.ConnectionError("connection reset")
+    except Exception as err:
+        raise Exception("Impossible to read: " + str(err))  # as InfluxServerIO reports errors
+
+
+@pytest.mark.parametrize("error", [ConnectionError, socket.timeout, wrapped_connection_error,
+                                   lambda: cancellation.DeadlineExceeded("deadline")])
+def test_connection_is_discarded_on_connection_error(error):
+    pool = FakePool(size=2)
+    with pytest.raises(BaseException):
+        with pool.connection() as a:
+            raise error()
+    assert a.closed
+    assert pool.stats()["open"] == 0
+    with pool.connection() as b:
+        assert b is not a
+
+
+def test_connection_is_kept_on_query_error():
+    pool = FakePool(size=2)
+    with pytest.raises(Exception, match="error parsing query"):
+        with pool.connection() as a:
+            try:
+                raise InfluxDBClientError("error parsing query", 400)
+            except Exception as err:
+                raise Exception("Impossible to read: " + str(err))
+    assert not a.closed
+    with pool.connection() as b:
+        assert b is a
+    assert pool.stats()["discarded"] == 0
+
+
+def test_acquire_waits_for_a_released_connection():
+    pool = FakePool(size=1, timeout=5.)
+    conn = pool.acquire()
+    threading.Timer(0.1, pool.release, (conn,)).start()
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats["waited"] == 1 and stats["wait_time_max"] > 0
+
+
+def test_acquire_times_out():
+    pool = FakePool(size=1, timeout=0.05)
+    pool.acquire()
+    with pytest.raises(Exception, match="No free DB connection"):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_acquire_is_bounded_by_the_deadline():
+    pool = FakePool(size=1, timeout=30.)
+    pool.acquire()
+    start = time.monotonic()
+    with cancellation.activate(cancellation.CancellationToken(0.05)):
+        with pytest.raises(cancellation.DeadlineExceeded):
+            pool.acquire()
+    assert time.monotonic() - start < 5.
+
+
+def test_acquire_without_blocking():
+    pool = FakePool(size=1)
+    conn = pool.acquire(block=False)
+    assert conn is not None
+    assert pool.acquire(block=False) is None
+
+
+def test_spare_connections_do_not_wait():
+    pool = FakePool(size=3)
+    primary = pool.acquire()
+    with pool.spare_connections(5) as spares:
+        assert len(spares) == 2
+        assert primary not in spares
+        with pool.spare_connections(1) as none:
+            assert none == []
+    assert pool.stats()["idle"] == 2
+
+
+def test_spare_connections_are_discarded_on_connection_error():
+    pool = FakePool(size=3)
+    with pytest.raises(Exception):
+        with pool.spare_connections(2) as spares:
+            wrapped_connection_error()
+    assert all(conn.closed for conn in spares)
+    assert pool.stats()["open"] == 0
+    with pytest.raises(ValueError):
+        with pool.spare_connections(2) as spares:
+            raise ValueError()
+    assert not any(conn.closed for conn in spares)
+    assert pool.stats()["idle"] == 2
+
+
+def test_health_check_drops_broken_connections():
+    pool = FakePool(size=2)
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    pool.release(b)
+    b.broken = True
+    pool.check_health()
+    assert a.pings == 1 and b.pings == 1
+    assert b.closed and not a.closed
+    stats = pool.stats()
+    assert stats["idle"] == 1 and stats["discarded"] == 1 and stats["health_checks"] == 1
+
+
+def test_health_check_keeps_the_other_connections_available():
+    pool = FakePool(size=3, timeout=5.)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        pool.release(conn)
+    available = []
+
+    def ping(conn):
+        available.append(pool.stats()["idle"])  # while the connection is pinged
+        with pool.connection():  # does not wait for the health check
+            pass
+        FakeConnection.ping(conn)
+
+    for conn in conns:
+        conn.ping = lambda conn=conn: ping(conn)
+    pool.check_health()
+    assert available == [2, 2, 2]
+    assert all(conn.pings == 1 for conn in conns)  # every connection is checked once
+    assert pool.stats()["idle"] == 3 and len(pool.opened) == 3
+
+
+def test_close():
+    pool = FakePool(size=2)
+    idle, busy = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    assert idle.closed and not busy.closed
+    with pytest.raises(Exception, match="closed"):
+        pool.acquire()
+    pool.release(busy)
+    assert busy.closed
+    assert pool.stats()["open"] == 0
+
+
+def test_close_wakes_up_waiting_threads():
+    pool = FakePool(size=1, timeout=30.)
+    pool.acquire()
+    errors = []
+
+    def wait():
+        try:
+            pool.acquire()
+        except Exception as err:
+            errors.append(err)
+
+    t = threading.Thread(target=wait)
+    t.start()
+    time.sleep(0.05)
+    pool.close()
+    t.join(5.)
+    assert not t.is_alive()
+    assert "closed" in str(errors[0])
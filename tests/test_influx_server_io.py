@@ -0,0 +1,392 @@
+import datetime
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+from influxdb.exceptions import InfluxDBClientError
+
+from analytics import cancellation
+from db import InfluxConnectionPool, InfluxServerIO
+
+
+class SlowInfluxHandler(BaseHTTPRequestHandler):
+    """
+    InfluxDB HTTP API answering queries after 'delay' seconds.
+    """
+
+    def do_GET(self):
+        if self.path.startswith("/ping"):
+            self.send_response(204)
+            self.send_header("X-Influxdb-Version", "1.8.0")
+            self.end_headers()
+            return
+        time.sleep(self.server.delay)
+        body = json.dumps({"results": [{"statement_id": 0}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_influx():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowInfluxHandler)
+    server.daemon_threads = True
+    server.delay = 0.
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def connect(server):
+    io = InfluxServerIO("127.0.0.1", "ems", server.server_address[1], "user", "password")
+    io.connect()
+    return io
+
+
+def test_queries_are_aborted_at_the_deadline(slow_influx):
+    io = connect(slow_influx)
+    slow_influx.delay = 3.
+    start = time.monotonic()
+    with cancellation.activate(cancellation.CancellationToken(0.2)):
+        with pytest.raises(cancellation.DeadlineExceeded):
+            io._query("SELECT value FROM data")
+    assert time.monotonic() - start < 2.
+
+
+def test_connection_keeps_its_timeout_after_a_deadline(slow_influx):
+    io = connect(slow_influx)
+    slow_influx.delay = 0.5
+    with cancellation.activate(cancellation.CancellationToken(0.1)):
+        with pytest.raises(cancellation.DeadlineExceeded):
+            io._query("SELECT value FROM data")
+    # the next request borrowing the connection has no deadline: the query is not cut short
+    assert io._query("SELECT value FROM data") == {}
+    with cancellation.activate(cancellation.CancellationToken(5.)):
+        assert io._query("SELECT value FROM data") == {}
+
+
+def test_expired_request_does_not_query(slow_influx):
+    io = connect(slow_influx)
+    token = cancellation.CancellationToken(10.)
+    token.cancel()
+    with cancellation.activate(token):
+        with pytest.raises(cancellation.DeadlineExceeded):
+            io._query("SELECT value FROM data")
+
+
+class FakeInfluxClient:
+    """
+    DataFrameClient answering the queries of InfluxServerIO from in-memory series.
+    """
+
+    def __init__(self, store):
+        self.store = store  # (device_id, data_source_id) : Series
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(query)
+        unescape = lambda v: re.sub(r"\\(.)", r"\1", v)
+        tags = [(unescape(di), unescape(dsi)) for di, dsi in
+                re.findall(r"device_id='((?:[^'\\]|\\.)*)' and data_source_id='((?:[^'\\]|\\.)*)'", query)]
+        end = pd.Timestamp(re.search(r"time <= '([^']*)'", query).group(1))
+        limit = re.search(r"LIMIT (\d+)", query)
+        aggregate = re.search(r"SELECT (\w+)\(value\) AS value .* GROUP BY time\((\w+)\)", query)
+        result = {}
+        for di, dsi in tags:
+            values = self.store.get((di, dsi))
+            if values is None:
+                continue
+            m = re.search(r"time >= '([^']*)'", query)
+            if m is not None:
+                values = values[values.index >= pd.Timestamp(m.group(1))]
+            m = re.search(r"time > (\d+)", query)
+            if m is not None:
+                values = values[values.index.asi8 > int(m.group(1))]
+            m = re.search(r"time >= (\d+)", query)
+            if m is not None:
+                values = values[values.index.asi8 >= int(m.group(1))]
+            values = values[values.index <= end]
+            if aggregate is not None:
+                values = values.resample(aggregate.group(2), origin="epoch").agg(aggregate.group(1)).dropna()
+            if limit is not None:
+                values = values.iloc[:int(limit.group(1))]
+            if len(values):
+                result[('data', (('data_source_id', dsi), ('device_id', di)))] = values.to_frame("value")
+        return result
+
+    def close(self):
+        pass
+
+
+def fake_io(store):
+    io = InfluxServerIO()
+    io.client = FakeInfluxClient(store)
+    return io
+
+
+def january(seed, freq="1h"):
+    index = pd.date_range("2020-01-01", "2020-02-01", freq=freq, tz="UTC", inclusive="left")
+    return pd.Series(np.random.RandomState(seed).rand(len(index)), index=index)
+
+
+STORE = {("d1", "1"): january(1), ("d1", "2"): january(2), ("d2", "1"): january(3, "30min"),
+         ("d'3", "1\\"): january(4)}
+
+
+def utc(day, hour=0):
+    return datetime.datetime(2020, 1, day, hour, tzinfo=datetime.timezone.utc)
+
+
+def expected(store, device_id, data_source_id, time_upload, limit=None):
+    columns = []
+    for di, dsi, (start, end) in zip(device_id, data_source_id, time_upload):
+        values = store.get((di, dsi), pd.Series(index=pd.DatetimeIndex([], tz="UTC"), dtype=np.float64))
+        columns.append(values[(values.index >= start) & (values.index <= end)].iloc[:limit].rename(di + "_" + dsi))
+    return pd.concat(columns, axis=1, sort=True)
+
+
+def assert_read(io, device_id, data_source_id, time_upload, limit=None, **kwargs):
+    result = io.read_data(device_id, data_source_id, time_upload, limit, **kwargs)
+    pd.testing.assert_frame_equal(result, expected(io.client.store, device_id, data_source_id, time_upload, limit),
+                                  check_freq=False)
+    return result
+
+
+def test_series_query():
+    query = InfluxServerIO._series_query([("d1", "1"), ("d'3", "1\\")], "time >= '2020-01-01T00:00:00Z'", utc(2),
+                                         "LIMIT 10")
+    assert query == r"SELECT value FROM data WHERE ((device_id='d1' and data_source_id='1') or " \
+                    r"(device_id='d\'3' and data_source_id='1\\')) and time >= '2020-01-01T00:00:00Z' and " \
+                    r"time <= '2020-01-02T00:00:00Z' GROUP BY device_id, data_source_id LIMIT 10"
+
+
+def test_series_with_the_same_range_are_read_by_one_query():
+    io = fake_io(STORE)
+    di, dsi = ["d1", "d2", "d'3", "d1"], ["2", "1", "1\\", "1"]
+    result = assert_read(io, di, dsi, [(utc(2), utc(5))] * 4)
+    assert list(result.columns) == ["d1_2", "d2_1", "d'3_1\\", "d1_1"]  # requested order
+    assert len(io.client.queries) == 1
+
+
+def test_series_are_split_between_queries():
+    io = fake_io(STORE)
+    io.SERIES_PER_QUERY = 2
+    assert_read(io, ["d1", "d2", "d'3"], ["2", "1", "1\\"], [(utc(2), utc(5))] * 3)
+    assert len(io.client.queries) == 2
+
+
+def test_series_are_grouped_by_time_range():
+    io = fake_io(STORE)
+    time_upload = [(utc(2), utc(5)), (utc(3), utc(4, 12)), (utc(2), utc(5))]
+    assert_read(io, ["d1", "d2", "d'3"], ["2", "1", "1\\"], time_upload, limit=30)
+    assert len(io.client.queries) == 2
+
+
+def test_missing_series_are_empty_columns():
+    io = fake_io(STORE)
+    result = assert_read(io, ["d1", "unknown"], ["1", "1"], [(utc(2), utc(3))] * 2)
+    assert isinstance(result.index, pd.DatetimeIndex) and str(result.index.tz) == "UTC"
+    assert result["unknown_1"].isna().all()
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 50, 1000])
+@pytest.mark.parametrize("limit", [None, 20, 100])
+def test_chunked_reads_equal_unchunked_ones(chunk_rows, limit):
+    di, dsi = ["d1", "d2", "d'3", "unknown"], ["1", "1", "1\\", "1"]
+    time_upload = [(utc(1), utc(6))] * 4
+    chunked = assert_read(fake_io(STORE), di, dsi, time_upload, limit, chunk_rows=chunk_rows)
+    pd.testing.assert_frame_equal(chunked, fake_io(STORE).read_data(di, dsi, time_upload, limit), check_freq=False)
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 50, 1000])
+@pytest.mark.parametrize("limit", [None, 100])
+def test_chunked_reads_of_different_time_ranges(chunk_rows, limit):
+    di, dsi = ["d1", "d2", "d1", "d'3"], ["1", "1", "2", "1\\"]
+    time_upload = [(utc(1), utc(10)), (utc(20), utc(30)), (utc(5, 12), utc(22)), (utc(25), utc(26))]
+    result = assert_read(fake_io(STORE), di, dsi, time_upload, limit, chunk_rows=chunk_rows)
+    assert result["d2_1"].first_valid_index() == utc(20)
+
+
+def test_chunks_are_consecutive():
+    io = fake_io(STORE)
+    di, dsi = ["d1", "d2"], ["1", "1"]
+    time_upload = [(utc(1), utc(10)), (utc(5), utc(12))]
+    chunks = list(io.read_chunks(di, dsi, time_upload, chunk_rows=50))
+    assert len(chunks) > 5
+    assert all(len(chunk) <= 50 * 2 for chunk in chunks)  # at most chunk_rows of every series
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert list(chunk.columns) == ["d1_1", "d2_1"]
+        assert previous.index[-1] < chunk.index[0]
+    assert all(re.search("LIMIT 50$", query) for query in io.client.queries)
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected(STORE, di, dsi, time_upload), check_freq=False)
+
+
+def test_empty_read_has_one_empty_chunk():
+    chunks = list(fake_io(STORE).read_chunks(["unknown"], ["1"], [(utc(1), utc(2))], chunk_rows=10))
+    assert len(chunks) == 1 and chunks[0].empty and list(chunks[0].columns) == ["unknown_1"]
+
+
+def aggregated(store, device_id, data_source_id, time_upload, aggregate, limit=None):
+    columns = []
+    for di, dsi, (start, end) in zip(device_id, data_source_id, time_upload):
+        values = store[(di, dsi)]
+        values = values[(values.index >= start) & (values.index <= end)]
+        values = values.resample(aggregate[1], origin="epoch").agg(aggregate[0]).dropna()
+        columns.append(values.iloc[:limit].rename(di + "_" + dsi))
+    return pd.concat(columns, axis=1, sort=True)
+
+
+def test_aggregated_series_query():
+    query = InfluxServerIO._series_query([("d1", "1")], "time >= '2020-01-01T00:00:00Z'", utc(2), "LIMIT 10",
+                                         ("mean", "1h"))
+    assert query == r"SELECT mean(value) AS value FROM data WHERE ((device_id='d1' and data_source_id='1')) and " \
+                    r"time >= '2020-01-01T00:00:00Z' and time <= '2020-01-02T00:00:00Z' " \
+                    r"GROUP BY time(1h), device_id, data_source_id fill(none) LIMIT 10"
+
+
+@pytest.mark.parametrize("aggregate", [("mean", "1h"), ("MAX", "1d"), ("sum", "6h")])
+def test_aggregated_reads(aggregate):
+    io = fake_io(STORE)
+    di, dsi = ["d1", "d2", "d'3"], ["1", "1", "1\\"]
+    time_upload = [(utc(1), utc(10)), (utc(2, 12), utc(9)), (utc(1), utc(10))]
+    result = io.read_data(di, dsi, time_upload, aggregate=aggregate)
+    expect = aggregated(STORE, di, dsi, time_upload, (aggregate[0].lower(), aggregate[1]))
+    pd.testing.assert_frame_equal(result, expect, check_freq=False)
+    assert all(query.startswith("SELECT " + aggregate[0].lower() + "(value)") for query in io.client.queries)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 5, 40])
+@pytest.mark.parametrize("limit", [None, 30])
+def test_chunked_aggregated_reads_equal_unchunked_ones(chunk_rows, limit):
+    di, dsi = ["d1", "d2", "d1"], ["1", "1", "2"]
+    time_upload = [(utc(1), utc(4)), (utc(2, 12), utc(6)), (utc(5), utc(8))]
+    chunked = fake_io(STORE).read_data(di, dsi, time_upload, limit, chunk_rows=chunk_rows, aggregate=("mean", "3h"))
+    unchunked = fake_io(STORE).read_data(di, dsi, time_upload, limit, aggregate=("mean", "3h"))
+    pd.testing.assert_frame_equal(chunked, unchunked, check_freq=False)
+    pd.testing.assert_frame_equal(chunked, aggregated(STORE, di, dsi, time_upload, ("mean", "3h"), limit),
+                                  check_freq=False)
+
+
+@pytest.mark.parametrize("aggregate, message", [(("average", "1h"), "Unsupported aggregate function 'average'"),
+                                                (("mean", "1 hour"), "Wrong aggregation resolution '1 hour'"),
+                                                (("mean", "h"), "Wrong aggregation resolution 'h'")])
+def test_wrong_aggregates_are_rejected(aggregate, message):
+    io = fake_io(STORE)
+    with pytest.raises(Exception, match=message):
+        io.read_data(["d1"], ["1"], [(utc(1), utc(2))], aggregate=aggregate)
+    assert io.client.queries == []
+
+
+class FailingInfluxClient(FakeInfluxClient):
+    """
+    FakeInfluxClient failing the queries of a device.
+    """
+
+    def __init__(self, store, device_id):
+        super().__init__(store)
+        self.device_id = device_id
+
+    def query(self, query):
+        if "device_id='" + self.device_id + "'" in query:
+            raise Exception("query failed")
+        return super().query(query)
+
+
+class FakeInfluxPool(InfluxConnectionPool):
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.opened = []
+
+    def _connect(self):
+        conn = fake_io(self.store)
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.mark.parametrize("chunk_rows", [None, 50])
+def test_parallel_reads_equal_sequential_ones(chunk_rows):
+    io, spare = fake_io(STORE), [fake_io(STORE), fake_io(STORE)]
+    io.SERIES_PER_QUERY = 2
+    di, dsi = ["d1", "d2", "d'3", "d1", "unknown"], ["1", "1", "1\\", "2", "1"]
+    time_upload = [(utc(1), utc(5))] * 4 + [(utc(2), utc(3))]
+    assert_read(io, di, dsi, time_upload, 80, chunk_rows=chunk_rows, connections=spare)
+    assert all(len(conn.client.queries) > 0 for conn in [io] + spare)  # the series are split between connections
+
+
+def test_parallel_read_errors_name_the_series():
+    io, spare = fake_io(STORE), fake_io(STORE)
+    spare.client = FailingInfluxClient(STORE, "d2")
+    io.client = FailingInfluxClient(STORE, "d2")
+    with pytest.raises(Exception, match=r"Impossible to read: d2_1: query failed$"):
+        io.read_data(["d1", "d2"], ["1", "1"], [(utc(1), utc(2)), (utc(2), utc(3))], connections=[spare])
+
+
+def test_pooled_chunked_reads_do_not_hold_connections():
+    pool = FakeInfluxPool(STORE, size=3)
+    di, dsi = ["d1", "d2", "d1"], ["1", "1", "2"]
+    time_upload = [(utc(1), utc(5)), (utc(3), utc(6)), (utc(1), utc(5))]
+    chunks = []
+    for chunk in pool.read_chunks(di, dsi, time_upload, chunk_rows=20, parallel=3):
+        assert pool.stats()["in_use"] == 0  # given back before the chunk is yielded
+        chunks.append(chunk)
+    assert len(chunks) > 1
+    assert len(pool.opened) == 3
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected(STORE, di, dsi, time_upload), check_freq=False)
+
+
+def test_pooled_chunked_reads_use_only_free_spare_connections():
+    pool = FakeInfluxPool(STORE, size=2)
+    busy = pool.acquire()
+    chunks = list(pool.read_chunks(["d1", "d2"], ["1", "1"], [(utc(1), utc(3))] * 2, chunk_rows=10, parallel=4))
+    assert len(pool.opened) == 2 and len(busy.client.queries) == 0
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected(STORE, ["d1", "d2"], ["1", "1"], [(utc(1), utc(3))] * 2),
+                                  check_freq=False)
+
+
+class ErrorInfluxClient(FakeInfluxClient):
+    """
+    FakeInfluxClient raising the error after a delay.
+    """
+
+    def __init__(self, store, error, delay=0.):
+        super().__init__(store)
+        self.error = error
+        self.delay = delay
+
+    def query(self, query):
+        time.sleep(self.delay)
+        raise self.error
+
+
+def test_read_errors_tell_connection_errors_from_query_errors():
+    query_error = InfluxDBClientError("error parsing query", 400)
+    connection_error = requests.exceptions.ConnectionError("connection reset")
+    for error, expected_result in [(query_error, False), (connection_error, True)]:
+        io = fake_io(STORE)
+        io.client = ErrorInfluxClient(STORE, error)
+        with pytest.raises(Exception) as err:
+            io.read_data(["d1"], ["1"], [(utc(1), utc(2))])
+        assert InfluxServerIO.is_connection_error(err.value) is expected_result
+
+    # a connection error of any of the parallel queries is the cause
+    io, spare = fake_io(STORE), fake_io(STORE)
+    io.client = ErrorInfluxClient(STORE, query_error, 0.1)  # the other query is running when it fails
+    spare.client = ErrorInfluxClient(STORE, connection_error, 0.1)
+    with pytest.raises(Exception, match="connection reset") as err:
+        io.read_data(["d1", "d2"], ["1", "1"], [(utc(1), utc(2)), (utc(2), utc(3))], connections=[spare])
+    assert InfluxServerIO.is_connection_error(err.value)
@@ -0,0 +1,74 @@
+import time
+import types
+from concurrent.futures import Future
+
+import pytest
+
+from analytics import cancellation
+from server import JobTable, QueueFullError
+
+
+def task():
+    return types.SimpleNamespace(started=None, analysis_name="test", priority="default", timings={}, trace=None,
+                                 input=object())
+
+
+def submit(t):
+    return t, Future()
+
+
+def test_job_status_and_description():
+    table = JobTable()
+    job = table.add(task(), submit)
+    assert table.get(job.id) is job
+    assert job.status == "queued"
+    job.task.started = time.monotonic()
+    assert job.status == "running"
+    job.future.set_result({"result": "DONE", "cached": False})
+    assert job.status == "done"
+    assert job.finished is not None and job.task.input is None
+    description = job.describe()
+    assert description["job_id"] == job.id and description["result"] == "DONE"
+
+
+def test_failed_jobs():
+    table = JobTable()
+    failed, timed_out = table.add(task(), submit), table.add(task(), submit)
+    failed.future.set_exception(Exception("boom"))
+    timed_out.future.set_exception(cancellation.DeadlineExceeded("late"))
+    assert failed.describe()["result"] == "ERROR" and failed.describe()["error_message"] == "boom"
+    assert timed_out.status == "error" and timed_out.describe()["result"] == "TIMEOUT"
+
+
+def test_finished_jobs_expire_after_ttl():
+    table = JobTable(ttl=60.)
+    finished, expired, running = (table.add(task(), submit) for _ in range(3))
+    finished.future.set_result({})
+    expired.future.set_result({})
+    expired.finished = time.time() - 61.
+    table.evict()
+    assert table.get(expired.id) is None
+    assert table.get(finished.id) is finished and table.get(running.id) is running
+    assert table.stats()["evicted"] == 1
+
+
+def test_full_table_evicts_the_oldest_finished_job():
+    table = JobTable(max_jobs=3)
+    running, first, second = (table.add(task(), submit) for _ in range(3))
+    second.future.set_result({})
+    first.future.set_result({})
+    new = table.add(task(), submit)
+    assert table.get(running.id) is running and table.get(new.id) is new
+    assert table.get(first.id) is None  # created earlier than the second one
+    assert table.get(second.id) is second
+
+
+def test_full_table_of_unfinished_jobs_rejects_new_ones():
+    table = JobTable(max_jobs=2)
+    submitted = []
+    table.add(task(), submit)
+    table.add(task(), submit)
+    with pytest.raises(QueueFullError):
+        table.add(task(), lambda t: submitted.append(t))
+    assert submitted == []  # the task is not submitted
+    assert table.stats()["rejected"] == 1
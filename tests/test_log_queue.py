@@ -0,0 +1,84 @@
+import logging
+import queue
+
+import pytest
+
+from server import log_queue
+from server.log_queue import BoundedQueueHandler
+
+
+@pytest.fixture
+def make_logger():
+    loggers = []
+
+    def make(handler):
+        logger = logging.getLogger("test_log_queue." + str(len(loggers)))
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        loggers.append((logger, handler))
+        return logger
+
+    yield make
+    for logger, handler in loggers:
+        logger.removeHandler(handler)
+
+
+def test_records_are_dropped_when_the_queue_is_full(make_logger):
+    handler = BoundedQueueHandler(queue.Queue(3))
+    logger = make_logger(handler)
+    for i in range(5):
+        logger.info("record %d", i)  # never blocks
+    assert [handler.queue.get_nowait().getMessage() for _ in range(3)] == ["record 0", "record 1", "record 2"]
+    stats = handler.stats()
+    assert stats["enqueued"] == 3 and stats["dropped"] == 2 and stats["queue_size"] == 3
+    logger.info("record 5")  # there is room again
+    assert handler.queue.get_nowait().getMessage() == "record 5"
+    assert handler.stats()["enqueued"] == 4 and handler.stats()["queued"] == 0
+
+
+def test_long_messages_are_truncated(make_logger):
+    handler = BoundedQueueHandler(queue.Queue(), max_message=10)
+    logger = make_logger(handler)
+    logger.info("%s", "x" * 25)  # formatted before truncation
+    logger.info("short")
+    logger.info("0123456789")
+    messages = [handler.queue.get_nowait().getMessage() for _ in range(3)]
+    assert messages == ["x" * 10 + " ... [15 characters truncated]", "short", "0123456789"]
+    assert handler.stats()["truncated"] == 1
+
+
+def test_truncation_can_be_disabled(make_logger):
+    handler = BoundedQueueHandler(queue.Queue(), max_message=0)
+    make_logger(handler).info("x" * 10000)
+    assert len(handler.queue.get_nowait().getMessage()) == 10000
+    assert handler.stats()["truncated"] == 0
+
+
+def test_long_messages_are_sampled(make_logger):
+    handler = BoundedQueueHandler(queue.Queue(), max_message=10, large_sample=0.)
+    logger = make_logger(handler)
+    logger.info("x" * 20)
+    logger.info("short")
+    assert handler.queue.get_nowait().getMessage() == "short"
+    assert handler.queue.empty()
+    stats = handler.stats()
+    assert stats["sampled_out"] == 1 and stats["truncated"] == 0 and stats["enqueued"] == 1
+
+
+def test_configured_records_are_written_to_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_queue, "_handler", None)
+    monkeypatch.setattr(log_queue, "_listener", None)
+    path = tmp_path / "test.log"
+    root = logging.getLogger()
+    level = root.level
+    handler = log_queue.configure(str(path), "w", "%(levelname)s %(message)s", None, logging.INFO, max_message=5)
+    try:
+        logging.getLogger("test_log_queue").info("written %s", "by the listener")
+        logging.getLogger("test_log_queue").debug("below the level")
+        log_queue.shutdown()  # writes the queued records
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+    assert path.read_text() == "INFO writt ... [18 characters truncated]\n"
+    assert log_queue.stats()["enqueued"] == 1
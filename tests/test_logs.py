@@ -0,0 +1,132 @@
+import datetime
+import logging
+import threading
+import time
+
+import pytest
+
+from server.logs import LogFile
+
+START = datetime.datetime(2020, 1, 1)
+
+
+def record(i, level="INFO"):
+    t = (START + datetime.timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")
+    return t + ".0 " + level + " module.function MainThread (1) message " + str(i) + "\n"
+
+
+@pytest.fixture
+def log(tmp_path):
+    """
+    100 records, one a minute, every 10th is an error with a traceback line.
+    """
+    path = tmp_path / "analytics_server.log"
+    with open(path, "w") as f:
+        for i in range(100):
+            if i % 10 == 0:
+                f.write(record(i, "ERROR") + "Traceback line " + str(i) + "\n")
+            else:
+                f.write(record(i))
+    log = LogFile(str(path))
+    log.CHECKPOINT = 512  # small checkpoints: the time index has many entries
+    log.CHUNK = 128
+    return log
+
+
+def text(chunks):
+    return b"".join(chunks).decode()
+
+
+def test_records_are_streamed_in_chunks(log):
+    chunks = list(log.records())
+    assert len(chunks) > 1
+    assert text(chunks) == open(log.path).read()
+
+
+def test_tail(log):
+    lines = text(log.records(tail=3)).splitlines(keepends=True)
+    assert lines == [record(97), record(98), record(99)]
+    assert text(log.records(tail=10 ** 6)) == open(log.path).read()
+    assert text(log.records(tail=0)) == ""
+
+
+def test_byte_ranges_skip_partial_lines(log):
+    first = len(record(0, "ERROR")) + len("Traceback line 0\n")
+    assert text(log.records(start=1, end=first + len(record(1)))) == record(1)
+    assert text(log.records(start=1, end=first + len(record(1)) - 1)) == record(1)[:-1]
+    assert b"".join(log.read_range(0, 9)) == record(0)[:10].encode()
+
+
+def test_level_filter_keeps_continuation_lines(log):
+    lines = text(log.records(level=logging.ERROR)).splitlines()
+    assert len(lines) == 20
+    assert lines[0] == record(0, "ERROR").rstrip() and lines[1] == "Traceback line 0"
+
+
+def test_time_filters_use_the_index(log):
+    since = (START + datetime.timedelta(minutes=50)).strftime("%Y-%m-%d %H:%M:%S")
+    until = (START + datetime.timedelta(minutes=52)).strftime("%Y-%m-%d %H:%M:%S")
+    out = text(log.records(since=since, until=until))
+    assert out == record(50, "ERROR") + "Traceback line 50\n" + record(51) + record(52)
+    assert len(log._index) > 5
+    assert log._offset_before(open(log.path, "rb"), since.encode()) > 0  # seeks instead of reading from the start
+    assert text(log.records(since="2019-01-01 00:00:00", until="2019-12-31 00:00:00")) == ""
+
+
+def test_index_is_extended_as_the_file_grows(log):
+    list(log.records(since="2020-01-01 00:00:00"))
+    indexed = len(log._index)
+    with open(log.path, "a") as f:
+        for i in range(100, 200):
+            f.write(record(i))
+    since = (START + datetime.timedelta(minutes=150)).strftime("%Y-%m-%d %H:%M:%S")
+    assert text(log.records(since=since)).splitlines(keepends=True)[0] == record(150)
+    assert len(log._index) > indexed
+
+
+def test_follow_streams_appended_records(log):
+    log.FOLLOW_POLL = 0.01
+
+    def append():
+        time.sleep(0.1)
+        with open(log.path, "a") as f:
+            f.write(record(100))
+            f.flush()
+            time.sleep(0.05)
+            f.write(record(101)[:10])  # incomplete line is not streamed until completed
+            f.flush()
+            time.sleep(0.05)
+            f.write(record(101)[10:])
+
+    threading.Thread(target=append).start()
+    start = time.monotonic()
+    out = text(log.records(tail=1, follow=0.5))
+    assert out == record(99) + record(100) + record(101)
+    assert time.monotonic() - start >= 0.5
+
+
+def test_logs_endpoint(log, make_server):
+    _, client = make_server()
+    content = open(log.path, "rb").read()
+    status, headers, body = client.request("GET", "/logs?tail=2")
+    assert status == 200 and body == (record(98) + record(99)).encode()
+    status, headers, body = client.request("GET", "/logs", headers={"Range": "bytes=-10"})
+    assert status == 206 and body == content[-10:]
+    assert headers["Content-Range"] == "bytes " + str(len(content) - 10) + "-" + str(len(content) - 1) + "/" + \
+        str(len(content))
+    status, headers, _ = client.request("GET", "/logs", headers={"Range": "bytes=" + str(len(content)) + "-"})
+    assert status == 416 and headers["Content-Range"] == "bytes */" + str(len(content))
+    status, _, _ = client.request("GET", "/logs?level=LOUD")
+    assert status == 400
+
+
+def test_follow_without_polling_yields_idle_markers(log):
+    chunks = log.records(tail=1, follow=10., poll=False)
+    assert next(chunks) == record(99).encode()
+    start = time.monotonic()
+    assert next(chunks) is LogFile.IDLE and next(chunks) is LogFile.IDLE  # returns at once, no sleeping
+    assert time.monotonic() - start < 0.1
+    with open(log.path, "a") as f:
+        f.write(record(100))
+    assert next(chunks) == record(100).encode()
+    chunks.close()
@@ -0,0 +1,61 @@
+import re
+
+import pytest
+
+from test_batch import post_json
+from test_influx_server_io import STORE, FakeInfluxPool
+
+
+def baseline(target_day):
+    return {"analysis": "demand-response-baseline",
+            "analysis_arguments": {"target_day": [target_day], "exception_days": [], "except_weekends": ["false"]}}
+
+
+def add(value=1):
+    return {"analysis": "test", "analysis_arguments": {"operation": ["add"], "value": [str(value)]}}
+
+
+@pytest.fixture
+def read_ranges(make_server):
+    """
+    Posts a reading request, returns the time ranges of its queries: set of (start, end)
+    """
+    srv, client = make_server("-scs", "0")  # no cached results: every request reads
+
+    def read(analysis_parameters, **db_io):
+        srv.db_pool = FakeInfluxPool(STORE)
+        request = {"db_io_parameters": {"mode": "r", "device_id": ["d1"], "data_source_id": ["1"],
+                                        "time_upload": ["2019-11-01_00:00:00+0000", "2020-02-01_00:00:00+0000"],
+                                        "limit": None, **db_io},
+                   "analysis_parameters": analysis_parameters}
+        post_json(client, request)
+        queries = [query for conn in srv.db_pool.opened for query in conn.client.queries]
+        assert queries
+        return {re.search(r"time >= '([^']*)' and time <= '([^']*)'", query).groups() for query in queries}
+
+    return read
+
+
+def test_time_range_is_clipped_to_the_lookback(read_ranges):
+    # 45 days before the target day to the end of the day after it
+    assert read_ranges(baseline("2020-01-20")) == {("2019-12-06T00:00:00Z", "2020-01-21T00:00:00Z")}
+
+
+def test_lookback_outside_of_the_time_range(read_ranges):
+    assert read_ranges(baseline("2019-12-01")) == {("2019-11-01T00:00:00Z", "2019-12-02T00:00:00Z")}
+    assert read_ranges(baseline("2021-01-01")) == {("2019-11-01T00:00:00Z", "2020-02-01T00:00:00Z")}
+
+
+def test_batch_reads_the_union_of_lookbacks(read_ranges):
+    entries = [baseline("2020-01-20"), baseline("2020-01-10")]
+    assert read_ranges(entries) == {("2019-11-26T00:00:00Z", "2020-01-21T00:00:00Z")}
+
+
+def test_analyses_without_lookback_read_the_whole_range(read_ranges):
+    whole = {("2019-11-01T00:00:00Z", "2020-02-01T00:00:00Z")}
+    assert read_ranges(add()) == whole
+    assert read_ranges([baseline("2020-01-20"), add()]) == whole
+
+
+def test_narrowing_can_be_disabled(read_ranges):
+    assert read_ranges(baseline("2020-01-20"), narrow=False) == {("2019-11-01T00:00:00Z", "2020-02-01T00:00:00Z")}
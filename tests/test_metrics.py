@@ -0,0 +1,63 @@
+import io
+import json
+
+import numpy as np
+
+from server import codec
+from server.metrics import MetricsRegistry
+
+
+def test_metrics_are_rendered_in_text_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests", ("code",))
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.))
+    registry.gauge("queue_depth", "Queue", lambda: 3)
+    registry.gauge("unavailable", "Not available", lambda: None)
+    counter.inc(code=200)
+    counter.inc(2, code='5"03')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.)
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{code="200"} 1' in text
+    assert 'requests_total{code="5\\"03"} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_sum 5.55' in text and 'latency_seconds_count 3' in text
+    assert 'queue_depth 3' in text
+    assert 'unavailable' not in text
+
+
+def inline_request(value):
+    request = {"db_io_parameters": {"return": "json"},
+               "analysis_parameters": {"analysis": "test",
+                                       "analysis_arguments": {"operation": ["add"], "value": [str(value)]}}}
+    out = io.BytesIO()
+    np.savez(out, request=np.array(json.dumps(request)), time=np.arange(10, dtype=np.int64) * 3600 * 10 ** 9,
+             values=np.ones(10))
+    return out.getvalue()
+
+
+def stage_count(text, stage):
+    prefix = 'analytics_stage_seconds_count{analysis="test",stage="' + stage + '"} '
+    lines = [line for line in text.splitlines() if line.startswith(prefix)]
+    return int(lines[0][len(prefix):]) if lines else 0
+
+
+def test_stages_without_work_are_not_observed(make_server):
+    _, client = make_server()
+    headers = {"Content-Type": codec.FORMATS["npz"]}
+    for _ in range(2):  # the second result is cached
+        status, _, body = client.request("POST", "/", inline_request(1), headers)
+        assert status == 200, body
+    msg = json.loads(body)
+    assert msg["cached"] and msg["data"][0]["val0"] == 2.
+    status, _, body = client.request("GET", "/metrics")
+    text = body.decode()
+    assert 'analytics_analysis_requests_total{analysis="test",result="DONE"} 2' in text
+    assert stage_count(text, "queue") == 2
+    assert stage_count(text, "analysis") == 1
+    assert stage_count(text, "read") == 0  # inline data
+    assert stage_count(text, "write") == 0  # results are returned only
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import cancellation
+from server import AnalysisProcessPool
+
+from conftest import ROOT
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    pool = AnalysisProcessPool([], processes=1)
+    yield pool
+    pool.shutdown()
+
+
+def frame():
+    index = pd.date_range("2020-01-01", periods=1000, freq="h", tz="UTC")
+    return pd.DataFrame({"a": np.arange(1000.), "b": np.ones(1000)}, index=index)
+
+
+def test_analysis_runs_in_a_worker_process(pool):
+    data = frame()
+    result = pool.run("test", {"operation": ["mul"], "value": ["2"]}, data)
+    pd.testing.assert_frame_equal(result, (data * 2).rename(columns={"a": "val0", "b": "val1"}))
+    result.iloc[0, 0] = -1.  # out-of-band buffers are received into writable memory
+    stats = pool.stats()
+    assert stats["tasks"] == 1 and stats["failed"] == 0 and len(stats["pids"]) == 1
+
+
+def test_analysis_errors_are_raised_and_the_worker_is_reused(pool):
+    with pytest.raises(Exception, match="Wrong parameter 'operation'"):
+        pool.run("test", {"operation": ["pow"], "value": ["2"]}, frame())
+    pid = pool.stats()["pids"]
+    assert pool.run("test", {"operation": ["add"], "value": ["1"]}, frame())["val1"].eq(2.).all()
+    stats = pool.stats()
+    assert stats["failed"] == 1 and stats["crashed"] == 0 and stats["pids"] == pid
+
+
+def test_crashed_worker_is_replaced(pool):
+    pool.start()
+    worker = pool._idle.get()
+    worker.process.kill()
+    worker.process.join()
+    pool._idle.put(worker)
+    with pytest.raises(Exception, match="crashed"):
+        pool.run("test", {"operation": ["add"], "value": ["1"]}, frame())
+    assert pool.stats()["crashed"] == 1
+    assert pool.run("test", {"operation": ["add"], "value": ["1"]}, frame())["val0"].iloc[0] == 1.
+
+
+def test_waiting_for_a_worker_is_bounded_by_the_deadline(pool):
+    pool.start()
+    worker = pool._idle.get()  # busy
+    try:
+        start = time.monotonic()
+        with cancellation.activate(cancellation.CancellationToken(0.2)):
+            with pytest.raises(cancellation.DeadlineExceeded, match="deadline exceeded"):
+                pool.run("test", {"operation": ["add"], "value": ["1"]}, frame())
+        assert 0.2 <= time.monotonic() - start < 5.
+        assert pool.stats()["tasks"] == 0
+    finally:
+        pool._idle.put(worker)
+    assert pool.run("test", {"operation": ["add"], "value": ["1"]}, frame())["val0"].iloc[0] == 1.
+
+
+def test_restarted_pool_does_not_reuse_stopped_workers(pool):
+    pool.start()
+    pids = pool.stats()["pids"]
+    pool.shutdown()
+    assert pool.stats()["idle"] == 0
+    assert pool.run("test", {"operation": ["add"], "value": ["1"]}, frame())["val0"].iloc[0] == 1.
+    stats = pool.stats()
+    assert stats["crashed"] == 0 and stats["pids"] != pids and stats["idle"] == 1
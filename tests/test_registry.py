@@ -0,0 +1,138 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from analytics.registry import AnalysisRegistry
+
+SCRIPT = '''
+from analytics.analysis import Analysis
+{imports}
+CLASS_NAME = "Tmp"
+ANALYSIS_NAME = "{name}"
+A_ARGS = {{"analysis_name": ANALYSIS_NAME, "version": {version}}}
+{extra}
+
+class Tmp(Analysis):
+    def analyze(self, parameters, data):
+        return {version}
+'''
+
+
+@pytest.fixture
+def folder(tmp_path):
+    yield tmp_path
+    for name in [m for m in sys.modules if m.startswith("analysis_tmp")]:
+        del sys.modules[name]
+
+
+def write(folder, module, name=None, version=1, imports="", extra=""):
+    path = os.path.join(str(folder), module + ".py")
+    with open(path, "w") as f:
+        f.write(SCRIPT.format(name=name or module, version=version, imports=imports, extra=textwrap.dedent(extra)))
+    return path
+
+
+def test_metadata_is_read_without_importing(folder):
+    write(folder, "analysis_tmp_lazy", imports="import not_installed_module")
+    registry = AnalysisRegistry([str(folder)])
+    report = registry.refresh()
+    assert report["changed"] == ["analysis_tmp_lazy"] and report["failed"] == {}
+    assert registry.snapshot.analysis_args["analysis_tmp_lazy"] == {"analysis_name": "analysis_tmp_lazy",
+                                                                     "version": 1, "folder": str(folder)}
+    assert "analysis_tmp_lazy" not in sys.modules
+    with pytest.raises(Exception, match="not_installed_module"):
+        registry.analysis_class("analysis_tmp_lazy")  # the dependency is imported on the first use
+
+
+def test_class_is_imported_on_first_use(folder):
+    write(folder, "analysis_tmp_use")
+    registry = AnalysisRegistry([str(folder)])
+    registry.refresh()
+    assert registry.stats()["imported"] == 0
+    cls = registry.analysis_class("analysis_tmp_use")
+    assert cls().analyze({}, None) == 1
+    assert registry.analysis_class("analysis_tmp_use") is cls
+    assert registry.stats()["imported"] == 1
+    with pytest.raises(Exception, match="doesn't exist"):
+        registry.analysis_class("unknown")
+
+
+@pytest.mark.parametrize("extra", ["A_ARGS['extra'] = True", "A_ARGS.update(extra=True)"])
+def test_modified_metadata_falls_back_to_import(folder, extra):
+    write(folder, "analysis_tmp_modified", extra=extra)
+    registry = AnalysisRegistry([str(folder)])
+    registry.refresh()
+    assert "analysis_tmp_modified" in sys.modules  # imported during discovery
+    assert registry.snapshot.analysis_args["analysis_tmp_modified"]["extra"] is True
+
+
+def test_non_literal_metadata_falls_back_to_import(folder):
+    write(folder, "analysis_tmp_computed", extra="ANALYSIS_NAME = 'computed_' + str(1)")
+    registry = AnalysisRegistry([str(folder)])
+    registry.refresh()
+    assert "computed_1" in registry.snapshot.analysis
+    assert registry.stats()["imported"] == 1
+
+
+def test_broken_scripts_are_reported(folder):
+    write(folder, "analysis_tmp_ok")
+    with open(os.path.join(str(folder), "analysis_tmp_syntax.py"), "w") as f:
+        f.write("CLASS_NAME = (\n")
+    write(folder, "analysis_tmp_import", extra="A_ARGS = dict(A_ARGS)", imports="import not_installed_module")
+    registry = AnalysisRegistry([str(folder)])
+    report = registry.refresh()
+    assert report["changed"] == ["analysis_tmp_ok"]
+    assert sorted(report["failed"]) == ["analysis_tmp_import", "analysis_tmp_syntax"]
+    assert list(registry.snapshot.analysis) == ["analysis_tmp_ok"]
+
+
+def test_eager_registry_imports_everything(folder):
+    write(folder, "analysis_tmp_eager")
+    registry = AnalysisRegistry([str(folder)], lazy=False)
+    registry.refresh()
+    assert registry.stats()["imported"] == 1
+
+
+def test_refresh_rediscovers_changed_scripts_only(folder):
+    kept = write(folder, "analysis_tmp_kept")
+    changed = write(folder, "analysis_tmp_changed")
+    removed = write(folder, "analysis_tmp_removed")
+    registry = AnalysisRegistry([str(folder)])
+    registry.refresh()
+    registry.analysis_class("analysis_tmp_kept")
+    old_hash = registry.snapshot.analysis_hash["analysis_tmp_changed"]
+
+    os.utime(kept, ns=(0, 0))  # touched only: the content hash is the same
+    write(folder, "analysis_tmp_changed", version=2)
+    os.utime(changed, ns=(1, 1))  # the same size, mtime could be the same too on coarse file systems
+    os.remove(removed)
+    report = registry.refresh()
+    assert report["changed"] == ["analysis_tmp_changed"]
+    assert report["removed"] == ["analysis_tmp_removed"]
+    assert registry.stats()["imported"] == 1  # the unchanged module is kept imported
+    assert registry.snapshot.analysis_hash["analysis_tmp_changed"] != old_hash
+    assert registry.analysis_class("analysis_tmp_changed")().analyze({}, None) == 2
+    assert registry.refresh()["changed"] == []
+
+
+def test_failed_scripts_are_retried(folder):
+    write(folder, "analysis_tmp_retry", extra="A_ARGS = dict(A_ARGS)", imports="import not_installed_module")
+    registry = AnalysisRegistry([str(folder)])
+    assert list(registry.refresh()["failed"]) == ["analysis_tmp_retry"]
+    assert list(registry.refresh()["failed"]) == ["analysis_tmp_retry"]  # retried, not skipped as unchanged
+    os.utime(write(folder, "analysis_tmp_retry", extra="A_ARGS = dict(A_ARGS)"), ns=(1, 1))
+    report = registry.refresh()
+    assert report["changed"] == ["analysis_tmp_retry"] and report["failed"] == {}
+
+
+def test_snapshot_is_swapped_at_once(folder):
+    write(folder, "analysis_tmp_first")
+    registry = AnalysisRegistry([str(folder)])
+    registry.refresh()
+    snapshot = registry.snapshot
+    write(folder, "analysis_tmp_second")
+    registry.refresh()
+    assert list(snapshot.analysis) == ["analysis_tmp_first"]  # readers keep a consistent state
+    assert sorted(registry.snapshot.analysis) == ["analysis_tmp_first", "analysis_tmp_second"]
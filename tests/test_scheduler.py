@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from server import Scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler()
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def test_tasks_run_periodically_in_order(scheduler):
+    runs = []
+    done = threading.Event()
+
+    def record(name):
+        runs.append(name)
+        if len(runs) >= 5:
+            done.set()
+
+    scheduler.add_task("slow", 0.2, lambda: record("slow"), delay=0.05)
+    scheduler.add_task("fast", 0.05, lambda: record("fast"), delay=0.)
+    assert done.wait(5.)
+    assert runs[0] == "fast"
+    assert runs.count("fast") > runs.count("slow") >= 1
+    assert [t["name"] for t in scheduler.tasks()][-1] == "slow"  # ordered by the next run
+
+
+def test_failing_task_keeps_running(scheduler):
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise Exception("boom")
+
+    scheduler.add_task("fail", 0.02, fail, delay=0.)
+    deadline = time.monotonic() + 5.
+    while len(calls) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    task = scheduler.tasks()[0]
+    assert task["errors"] >= 3 and task["last_error"] == "boom"
+
+
+def test_removed_and_replaced_tasks_do_not_run(scheduler):
+    calls = []
+    scheduler.add_task("removed", 0.05, lambda: calls.append("removed"), delay=0.05)
+    scheduler.remove_task("removed")
+    scheduler.add_task("replaced", 0.05, lambda: calls.append("old"), delay=0.05)
+    scheduler.add_task("replaced", 0.05, lambda: calls.append("new"), delay=0.05)
+    time.sleep(0.3)
+    assert "removed" not in calls and "old" not in calls and "new" in calls
+    assert [t["name"] for t in scheduler.tasks()] == ["replaced"]
+
+
+def test_added_task_wakes_up_the_scheduler(scheduler):
+    scheduler.add_task("distant", 3600., lambda: None)
+    ran = threading.Event()
+    scheduler.add_task("soon", 3600., ran.set, delay=0.)
+    assert ran.wait(5.)
+
+
+def test_wrong_interval():
+    with pytest.raises(Exception, match="positive"):
+        Scheduler().add_task("never", 0, lambda: None)
+
+
+def test_stop_ends_the_thread():
+    scheduler = Scheduler()
+    scheduler.start()
+    thread = scheduler._thread
+    scheduler.stop()
+    assert not thread.is_alive()
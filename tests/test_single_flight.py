@@ -0,0 +1,98 @@
+import threading
+import types
+from concurrent.futures import Future
+
+import pytest
+
+from analytics import cancellation
+from server import SingleFlight
+
+REQUEST = {"db_io_parameters": {"mode": "r", "device_id": ["d"], "data_source_id": ["1"]},
+           "analysis_parameters": {"analysis": "test", "analysis_arguments": {"operation": ["add"], "value": ["1"]}}}
+
+
+class Submitter:
+    def __init__(self):
+        self.futures = []
+
+    def __call__(self):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+def test_identical_requests_share_one_execution():
+    sf, submit = SingleFlight(), Submitter()
+    leader, future = sf.submit("k", "leader", submit)
+    executed, shared = sf.submit("k", "follower", submit)
+    assert (executed, shared) == (leader, future) == ("leader", submit.futures[0])
+    assert len(submit.futures) == 1
+    other, _ = sf.submit("other", "other", submit)
+    assert other == "other" and len(submit.futures) == 2
+    future.set_result({"result": "DONE"})
+    assert shared.result() == {"result": "DONE"}
+    assert sf.stats() == {"in_flight": 1, "executed": 2, "coalesced": 1}
+
+
+def test_errors_are_shared_and_finished_requests_are_not_joined():
+    sf, submit = SingleFlight(), Submitter()
+    _, future = sf.submit("k", "leader", submit)
+    _, shared = sf.submit("k", "follower", submit)
+    future.set_exception(Exception("boom"))
+    with pytest.raises(Exception, match="boom"):
+        shared.result()
+    executed, again = sf.submit("k", "next", submit)
+    assert executed == "next" and again is not future
+    assert sf.stats()["in_flight"] == 1
+
+
+def test_requests_without_key_are_not_coalesced():
+    sf, submit = SingleFlight(), Submitter()
+    sf.submit(None, "a", submit)
+    sf.submit(None, "b", submit)
+    assert len(submit.futures) == 2 and sf.stats()["coalesced"] == 0
+
+
+def test_requests_with_later_deadlines_are_not_attached():
+    sf, submit = SingleFlight(), Submitter()
+    leader, _ = sf.submit("k", "leader", submit, deadline=100.)
+    assert sf.submit("k", "earlier", submit, deadline=90.)[0] == leader
+    assert sf.submit("k", "same", submit, deadline=100.)[0] == leader
+    assert sf.submit("k", "later", submit, deadline=110.)[0] == "later"
+    # the later one is the leader now
+    assert sf.submit("k", "follower", submit, deadline=105.)[0] == "later"
+    assert sf.submit("k", "unlimited", submit)[0] == "unlimited"
+    assert sf.submit("k", "any", submit, deadline=1000.)[0] == "unlimited"
+    assert len(submit.futures) == 3
+    submit.futures[0].set_result({})  # the replaced leader completes
+    assert sf.stats()["in_flight"] == 1
+
+
+def test_key_is_canonical_and_depends_on_the_priority():
+    reordered = {"analysis_parameters": REQUEST["analysis_parameters"], "db_io_parameters": REQUEST["db_io_parameters"]}
+    assert SingleFlight.key(REQUEST) == SingleFlight.key(reordered)
+    assert SingleFlight.key(REQUEST, "interactive") != SingleFlight.key(REQUEST, "batch")
+    assert SingleFlight.key(REQUEST) != SingleFlight.key(dict(REQUEST, timeout=5))
+
+
+def test_server_coalesces_requests_of_the_same_class_and_deadline(make_server):
+    srv, _ = make_server("-sw", "1")
+    release = threading.Event()
+
+    def task(priority="interactive", timeout=None, inline=None):
+        token = cancellation.CancellationToken(timeout, 0.) if timeout is not None else None
+        return types.SimpleNamespace(json_request=REQUEST, inline=inline, analysis_name="test", priority=priority,
+                                     token=token, run=lambda: release.wait(10.) and {"result": "DONE"})
+
+    try:
+        leader = task(timeout=100.)
+        assert srv.submit(leader)[0] is leader
+        assert srv.submit(task(timeout=50.))[0] is leader
+        later = task(timeout=200.)
+        assert srv.submit(later)[0] is later
+        batch = task("batch", timeout=50.)
+        assert srv.submit(batch)[0] is batch
+        inline = task(inline=object())
+        assert srv.submit(inline)[0] is inline
+        assert srv.single_flight.stats()["coalesced"] == 1
+    finally:
+        release.set()
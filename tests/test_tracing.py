@@ -0,0 +1,51 @@
+import json
+
+from test_metrics import inline_request
+
+NPZ = {"Content-Type": "application/x-npz"}
+
+
+def span_names(span):
+    yield span["name"]
+    for child in span.get("children", []):
+        yield from span_names(child)
+
+
+def test_spans_are_returned_when_requested(make_server):
+    _, client = make_server("-sts", "0")
+    status, headers, body = client.request("POST", "/", inline_request(1), NPZ)
+    assert status == 200 and "trace" not in json.loads(body) and "X-Trace-Id" not in headers
+
+    status, headers, body = client.request("POST", "/", inline_request(2), dict(NPZ, **{"X-Trace": "1",
+                                                                                       "X-Trace-Id": "abc"}))
+    assert status == 200
+    trace = json.loads(body)["trace"]
+    assert trace["trace_id"] == headers["X-Trace-Id"] == "abc"
+    assert trace["spans"]["name"] == "POST /"
+    names = list(span_names(trace["spans"]))
+    for name in ["parse_npz", "task", "analysis", "_analyze"]:
+        assert name in names
+    assert trace["spans"]["duration"] >= trace["spans"]["children"][0]["duration"]
+
+
+def test_sampled_traces_are_written(make_server, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    _, client = make_server("-sts", "1", "-stf", str(path))
+    trace_ids = []
+    for value in range(2):
+        status, headers, body = client.request("POST", "/", inline_request(value), NPZ)
+        assert status == 200
+        trace_ids.append(headers["X-Trace-Id"])
+        assert json.loads(body)["trace"]["trace_id"] == trace_ids[-1]
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["trace_id"] for line in lines] == trace_ids
+    assert all(line["span"]["name"] == "POST /" and "task" in span_names(line["span"]) for line in lines)
+
+
+def test_unsampled_requests_are_not_written(make_server, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    _, client = make_server("-sts", "0", "-stf", str(path))
+    client.request("POST", "/", inline_request(1), NPZ)
+    assert not path.exists()
+    _, headers, _ = client.request("POST", "/", inline_request(1), dict(NPZ, **{"X-Trace": "1"}))
+    assert [json.loads(line)["trace_id"] for line in path.read_text().splitlines()] == [headers["X-Trace-Id"]]